@@ -1,5 +1,10 @@
 import requests
 import csv
+import argparse
+from contextlib import closing
+
+import store
+import last365
 
 
 def fetch_json_data(url):
@@ -61,13 +66,19 @@ def save_to_csv(filename, headers, table):
     return f"Data has been written to {filename}"
 
 
-def fetch_heatpump_data():
+def fetch_heatpump_data(local_stats=False):
     # Define URLs
     url_meta = "https://heatpumpmonitor.org/system/list/public.json"
     url_stats = "https://heatpumpmonitor.org/system/stats/last365"
 
     meta = fetch_json_data(url_meta)
-    stats = fetch_json_data(url_stats)
+    stats = last365.local_last365() if local_stats else fetch_json_data(url_stats)
+
+    store_file = store.default_store_file()
+    if store_file is not None:
+        with closing(store.connect(store_file)) as conn:
+            store.load_systems(conn, meta)
+            store.load_stats(conn, stats)
 
     systems = combine_meta_and_stats(meta, stats)
 
@@ -122,7 +133,12 @@ def fetch_heatpump_data():
     }
 
 
-result = fetch_heatpump_data()
+parser = argparse.ArgumentParser()
+parser.add_argument('--local-stats', action='store_true',
+                    help="Compute last365 stats from the daily data downloaded by dailydata.py")
+args = parser.parse_args()
+
+result = fetch_heatpump_data(local_stats=args.local_stats)
 
 cop_limited_msg = result['cop_limited_result']
 id_limited_msg = result['id_limited_result']
@@ -0,0 +1,124 @@
+import io
+import os
+import glob
+import gzip
+import logging
+import argparse
+import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_FOLDER = "archive"
+ARCHIVE_FILE_TEMPLATE = "system_{system_id}_daily_data_{fetched_at}.csv"
+FETCHED_AT_FORMAT = '%Y%m%dT%H%M%S'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+LEGACY_ORIGINAL_SUFFIX = "_daily_data_original.csv"
+
+# zstd compresses these CSVs better and decodes faster; gzip is the fallback when zstandard is missing
+ARCHIVE_EXTENSION = '.zst' if zstandard is not None else '.gz'
+ARCHIVE_EXTENSIONS = ('.zst', '.gz')
+
+
+def archive_folder(output_folder):
+    return os.path.join(output_folder, ARCHIVE_FOLDER)
+
+
+def archive_file_path(output_folder, system_id, fetched_at, extension=ARCHIVE_EXTENSION):
+    name = ARCHIVE_FILE_TEMPLATE.format(system_id=system_id, fetched_at=fetched_at.strftime(FETCHED_AT_FORMAT))
+    return os.path.join(archive_folder(output_folder), name + extension)
+
+
+def archive_files(output_folder, system_id):
+    # The timestamp in the name sorts lexically, so the newest fetch is last. Only finished archives count:
+    # an interrupted write_archive leaves a .tmp file behind.
+    pattern = os.path.join(archive_folder(output_folder), f"system_{system_id}_daily_data_*.csv.*")
+    return sorted((file_path for file_path in glob.glob(pattern) if file_path.endswith(ARCHIVE_EXTENSIONS)),
+                  key=os.path.basename)
+
+
+def write_archive(output_folder, system_id, content, fetched_at=None):
+    fetched_at = fetched_at or datetime.datetime.now(datetime.timezone.utc)
+    file_path = archive_file_path(output_folder, system_id, fetched_at)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    temporary_file = f"{file_path}.tmp"
+    if file_path.endswith('.zst'):
+        with open(temporary_file, mode='wb') as file:
+            file.write(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(content))
+    else:
+        # mtime=0 keeps the gzip header free of the write time, so the same response compresses identically
+        with open(temporary_file, mode='wb') as file:
+            with gzip.GzipFile(fileobj=file, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) as compressed:
+                compressed.write(content)
+    os.replace(temporary_file, file_path)
+    return file_path
+
+
+def open_archive(file_path):
+    if file_path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError(f"zstandard is required to read {file_path}")
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, mode='rb'), closefd=True)
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, mode='rb')
+    return open(file_path, mode='rb')
+
+
+def open_archive_text(file_path):
+    # Decompresses while it is read, so a whole response never has to be held in memory
+    return io.TextIOWrapper(open_archive(file_path), encoding='utf-8', newline='')
+
+
+def read_archive(file_path):
+    with open_archive(file_path) as file:
+        return file.read()
+
+
+def latest_archive(output_folder, system_id):
+    files = archive_files(output_folder, system_id)
+    if files:
+        return files[-1]
+    # Originals written before the archive existed are still read as they are
+    legacy_file = os.path.join(output_folder, f"system_{system_id}{LEGACY_ORIGINAL_SUFFIX}")
+    return legacy_file if os.path.exists(legacy_file) else None
+
+
+def migrate_originals(output_folder, remove=False):
+    migrated = []
+    for legacy_file in sorted(glob.glob(os.path.join(output_folder, f"system_*{LEGACY_ORIGINAL_SUFFIX}"))):
+        system_id = os.path.basename(legacy_file)[len('system_'):-len(LEGACY_ORIGINAL_SUFFIX)]
+        with open(legacy_file, mode='rb') as file:
+            content = file.read()
+        fetched_at = datetime.datetime.fromtimestamp(os.path.getmtime(legacy_file), datetime.timezone.utc)
+        archive_file = write_archive(output_folder, system_id, content, fetched_at)
+
+        if read_archive(archive_file) != content:
+            raise ValueError(f"Archive {archive_file} does not reproduce {legacy_file}")
+        if remove:
+            os.remove(legacy_file)
+        migrated.append((legacy_file, archive_file, len(content), os.path.getsize(archive_file)))
+
+    original_bytes = sum(item[2] for item in migrated)
+    archive_bytes = sum(item[3] for item in migrated)
+    if migrated:
+        logging.info(f"Archived {len(migrated)} originals: {original_bytes} bytes -> {archive_bytes} bytes "
+                     f"({original_bytes / max(archive_bytes, 1):.1f}x)")
+    return migrated
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='system_daily_data', help="Folder holding the daily data files")
+    parser.add_argument('--remove', action='store_true', help="Delete each original once its archive is verified")
+    args = parser.parse_args()
+
+    migrate_originals(args.data, remove=args.remove)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import metrics
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# pyarrow parses each file on several threads and releases the GIL; the C engine still overlaps I/O across files
+CSV_ENGINE = 'pyarrow' if pyarrow is not None else 'c'
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+TEXT_COLUMNS = {'timestamp'}
+
+
+def read_header(file_path):
+    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+        return file.readline().rstrip('\r\n').split(',')
+
+
+def _coerce_padded_numbers(data):
+    # The daily files pad every value with a leading space, which can be read as text rather than numbers
+    for column in data.columns:
+        dtype = data[column].dtype
+        if column in TEXT_COLUMNS or not (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)):
+            continue
+        values = data[column].astype(str).str.strip().replace('', None)
+        numbers = pd.to_numeric(values, errors='coerce')
+        if numbers.notna().sum() == values.notna().sum():
+            data[column] = numbers
+    return data
+
+
+def coerce_dtypes(data, dtypes=None):
+    for column, dtype in (dtypes or {}).items():
+        if column in data:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype(dtype)
+    return data
+
+
+def read_daily_file(file_path, columns=None, dtypes=None, engine=CSV_ENGINE):
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = [name for name in read_header(file_path) if name.strip() in wanted]
+
+    with metrics.stage('load'):
+        data = pd.read_csv(file_path, usecols=usecols, engine=engine)
+        data.columns = data.columns.str.strip()
+        data = coerce_dtypes(_coerce_padded_numbers(data), dtypes)
+        metrics.add_rows('load', len(data))
+        metrics.add_bytes('load', os.path.getsize(file_path))
+    return data
+
+
+def imap(func, items, workers=DEFAULT_WORKERS):
+    # Ordered map that keeps at most a couple of results per worker in flight, so callers can
+    # stream a large fleet without holding every frame at once
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
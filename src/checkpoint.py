@@ -0,0 +1,50 @@
+import os
+import json
+import logging
+import datetime
+
+CHECKPOINT_FILE = "dailydata_checkpoint.jsonl"
+
+
+def current_run_id():
+    # A run that is interrupted and restarted the same day resumes; the next nightly run starts over
+    return datetime.date.today().isoformat()
+
+
+def load_checkpoint(file_path=CHECKPOINT_FILE, run_id=None):
+    completed = {}
+    if not os.path.exists(file_path):
+        return completed
+
+    run_id = run_id or current_run_id()
+    other_runs = 0
+    with open(file_path, mode='r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash while appending leaves at most one truncated line at the end
+                logging.warning(f"Ignoring unreadable checkpoint line {line_number} in {file_path}")
+                continue
+            if record.get('run_id') != run_id:
+                other_runs += 1
+                continue
+            completed[record['system_id']] = record
+
+    if other_runs:
+        logging.warning(f"Ignoring {other_runs} checkpoint records in {file_path} from runs other than {run_id}")
+    logging.info(f"Resuming from {file_path}: {len(completed)} systems already completed.")
+    return completed
+
+
+def record_system(system_id, record, file_path=CHECKPOINT_FILE, run_id=None):
+    line = json.dumps(dict(record, system_id=system_id, run_id=run_id or current_run_id()))
+    with open(file_path, mode='a', encoding='utf-8') as file:
+        file.write(line + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def clear_checkpoint(file_path=CHECKPOINT_FILE):
+    if os.path.exists(file_path):
+        os.remove(file_path)
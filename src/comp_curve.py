@@ -2,13 +2,16 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+import metastore
+
 all_data_file_path = 'all_data_sorted_by_id.csv'
 sh_scop_file_path = 'annual_system_sh_scop.csv'
 
-all_data_df = pd.read_csv(all_data_file_path, encoding='latin1')
 sh_scop_df = pd.read_csv(sh_scop_file_path)
 
-merged_df = pd.merge(sh_scop_df, all_data_df[['ID', 'space_heat_control_type']], on='ID', how='left')
+# Plain strings keep seaborn's category order to the control types that actually appear
+merged_df = metastore.join_metadata(sh_scop_df, ['space_heat_control_type'], categories=False,
+                                   metadata_file=all_data_file_path)
 
 plt.figure(figsize=(12, 8))
 sns.boxplot(data=merged_df, x='space_heat_control_type', y='SCOP (Jun 23 to Jun 24)',
@@ -0,0 +1,111 @@
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import metastore
+import store
+from fleet import Fleet
+
+X_COLUMN = 'space_outsideT_mean'
+Y_COLUMN = 'space_flowT_mean'
+HEAT_COLUMN = 'space_heat_kwh'
+# Systems with fewer heating days, or a narrower outside temperature range, get no curve
+MIN_DAYS = 10
+MIN_OUTSIDE_RANGE = 2.0
+OUTPUT_FILE = 'compensation_curves.csv'
+
+CURVE_FIELDS = ['days', 'slope', 'intercept', 'residual_std', 'r_squared', 'outsideT_min', 'outsideT_max']
+
+
+def load_heating_days(fleet, file_type='clean'):
+    data = fleet.source(file_type).select(X_COLUMN, Y_COLUMN, HEAT_COLUMN).frame()
+    if data.empty:
+        return data
+    values = data[[X_COLUMN, Y_COLUMN, HEAT_COLUMN]].apply(pd.to_numeric, errors='coerce')
+    # Only days with space heating say anything about the curve the controller runs
+    mask = np.isfinite(values[X_COLUMN]) & np.isfinite(values[Y_COLUMN]) & (values[HEAT_COLUMN] > 0)
+    return values[mask].assign(system_id=data.loc[mask, 'system_id'])
+
+
+def fit_curves(system_ids, x, y):
+    # Every system's flowT = intercept + slope * outsideT solved at once: the design matrix is block diagonal
+    # with one block per system, so its normal equations reduce to per-system sums gathered with bincount
+    system_ids = np.asarray(system_ids)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ids, index = np.unique(system_ids, return_inverse=True)
+    counts = np.bincount(index, minlength=len(ids)).astype(float)
+
+    # Centring per system first keeps the sums of squares from cancelling
+    mean_x = np.bincount(index, weights=x, minlength=len(ids)) / counts
+    mean_y = np.bincount(index, weights=y, minlength=len(ids)) / counts
+    dx = x - mean_x[index]
+    dy = y - mean_y[index]
+    sxx = np.bincount(index, weights=dx * dx, minlength=len(ids))
+    sxy = np.bincount(index, weights=dx * dy, minlength=len(ids))
+    syy = np.bincount(index, weights=dy * dy, minlength=len(ids))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        residuals = dy - slope[index] * dx
+        ss_res = np.bincount(index, weights=residuals * residuals, minlength=len(ids))
+        residual_std = np.sqrt(ss_res / (counts - 2))
+        r_squared = 1 - ss_res / syy
+
+    outside_min = pd.Series(x).groupby(index).min().to_numpy()
+    outside_max = pd.Series(x).groupby(index).max().to_numpy()
+    curves = pd.DataFrame({
+        'ID': ids,
+        'days': counts.astype(int),
+        'slope': slope,
+        'intercept': intercept,
+        'residual_std': residual_std,
+        'r_squared': r_squared,
+        'outsideT_min': outside_min,
+        'outsideT_max': outside_max
+    })
+    unreliable = (curves['days'] < MIN_DAYS) | (curves['outsideT_max'] - curves['outsideT_min'] < MIN_OUTSIDE_RANGE)
+    curves.loc[unreliable, ['slope', 'intercept', 'residual_std', 'r_squared']] = np.nan
+    return curves
+
+
+def compensation_curves(fleet=None, file_type='clean', metadata_columns=None):
+    if fleet is None:
+        fleet = Fleet(store_file=store.default_store_file())
+    data = load_heating_days(fleet, file_type)
+    if data.empty:
+        logging.warning("No daily data found to fit compensation curves")
+        return pd.DataFrame(columns=['ID'] + CURVE_FIELDS)
+
+    with metrics.stage('curvefit'):
+        curves = fit_curves(data['system_id'], data[X_COLUMN], data[Y_COLUMN])
+        metrics.add_rows('curvefit', len(data))
+    if metadata_columns:
+        curves = metastore.join_metadata(curves, metadata_columns, categories=False)
+
+    logging.info(f"Fitted compensation curves for {curves['slope'].notna().sum()} of {len(curves)} systems "
+                 f"from {len(data)} heating days")
+    return curves
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', choices=['clean', 'winter', 'converted'], default='clean',
+                        help="Which daily files to fit from")
+    parser.add_argument('--metadata', nargs='*', default=['space_heat_control_type'],
+                        help="Metadata columns to join onto the curve table")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="CSV file for the per-system curves")
+    args = parser.parse_args()
+
+    curves = compensation_curves(file_type=args.source, metadata_columns=args.metadata)
+    curves.to_csv(args.output, index=False)
+    logging.info(f"Compensation curves written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,18 @@ import requests
 import csv
 import datetime
 import os
+import time
 import logging
+import argparse
+
+import metrics
+import archive
+import checkpoint
+import ratelimit
+import rollup
+import sketch
+import streaming
+import store
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -27,6 +38,30 @@ CLEAN_FILE_SUFFIX = "_daily_data_clean.csv"
 WINTER_FILE_SUFFIX = "_daily_data_winter.csv"
 METERING_ERROR_FOLDER = "metering_error"
 
+FILE_SUFFIXES = {
+    'original': ORIGINAL_FILE_SUFFIX,
+    'converted': CONVERTED_FILE_SUFFIX,
+    'clean': CLEAN_FILE_SUFFIX,
+    'winter': WINTER_FILE_SUFFIX
+}
+
+METRICS_OUTPUT_FILE = "dailydata_metrics.json"
+SCOP_SKETCH_FILE = "scop_sketches.json"
+
+SCOP_COLUMNS = [
+    'SCOP (Jun 23 to Aug 23)',
+    'SCOP (Sep 23 to Nov 23)',
+    'SCOP (Dec 23 to Feb 24)',
+    'SCOP (Mar 24 to May 24)',
+    'SCOP (Jun 23 to Jun 24)'
+]
+
+FETCH_WORKERS = ratelimit.MAX_CONCURRENCY
+CONVERT_WORKERS = 2
+PERSIST_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 8
+SYSTEM_RETRIES = 2
+
 SYSTEM_IDS_TO_REMOVE = [12, 17, 21, 36, 49, 52, 67, 105, 117, 148, 163, 169, 224, 276, 301, 305, 311, 325, 333]
 
 
@@ -39,139 +74,146 @@ def convert_timestamp(timestamp):
         return timestamp
 
 
+def daily_file_path(output_folder, system_id, file_type):
+    return os.path.join(output_folder, f"system_{system_id}{FILE_SUFFIXES[file_type]}")
+
+
 def is_within_date_range(date_str, start_date, end_date):
     date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d %H:00:00')
     return start_date <= date_obj < end_date
 
 
-def fetch_and_save_daily_data(system_id, output_folder):
+def download_daily_data(system_id, controller=None):
     url = f"https://heatpumpmonitor.org/system/stats/daily?id={system_id}"
-    response = requests.get(url)
-    data = response.text
-
-    lines = data.splitlines()
-    reader = csv.reader(lines)
-
-    headers = next(reader)
-
-    original_rows = [headers]
-    converted_rows = [headers]
-    clean_rows = [headers]
-    winter_rows = [headers]
+    with metrics.stage('fetch'):
+        request_start = time.perf_counter()
+        response = controller.get(url) if controller is not None else requests.get(url)
+        metrics.observe_latency('fetch', system_id, time.perf_counter() - request_start)
+        metrics.add_bytes('fetch', len(response.content))
+    return response.content
 
-    for row in reader:
-        if len(row) > 1:
-            converted_row = row.copy()
-            converted_row[1] = convert_timestamp(row[1])
 
-            original_rows.append(row)
-            converted_rows.append(converted_row)
+def convert_daily_data(data):
+    with metrics.stage('convert'):
+        lines = data.splitlines()
+        reader = csv.reader(lines)
 
-            if is_within_date_range(converted_row[1], SUMMER_START_DATE, SPRING_END_DATE):
-                clean_rows.append(converted_row)
+        headers = next(reader)
 
-            if is_within_date_range(converted_row[1], WINTER_START_DATE, WINTER_END_DATE):
-                winter_rows.append(converted_row)
-        else:
-            converted_rows.append(row)
+        original_rows = [headers]
+        converted_rows = [headers]
+        clean_rows = [headers]
+        winter_rows = [headers]
 
-    original_output_file = os.path.join(output_folder, f"system_{system_id}{ORIGINAL_FILE_SUFFIX}")
-    converted_output_file = os.path.join(output_folder, f"system_{system_id}{CONVERTED_FILE_SUFFIX}")
-    clean_output_file = os.path.join(output_folder, f"system_{system_id}{CLEAN_FILE_SUFFIX}")
-    winter_output_file = os.path.join(output_folder, f"system_{system_id}{WINTER_FILE_SUFFIX}")
+        for row in reader:
+            if len(row) > 1:
+                converted_row = row.copy()
+                converted_row[1] = convert_timestamp(row[1])
 
-    with open(original_output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerows(original_rows)
+                original_rows.append(row)
+                converted_rows.append(converted_row)
 
-    with open(converted_output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerows(converted_rows)
+                if is_within_date_range(converted_row[1], SUMMER_START_DATE, SPRING_END_DATE):
+                    clean_rows.append(converted_row)
 
-    with open(clean_output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerows(clean_rows)
+                if is_within_date_range(converted_row[1], WINTER_START_DATE, WINTER_END_DATE):
+                    winter_rows.append(converted_row)
+            else:
+                converted_rows.append(row)
+        metrics.add_rows('convert', len(original_rows) - 1)
 
-    with open(winter_output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerows(winter_rows)
+    return original_rows, converted_rows, clean_rows, winter_rows
 
-    return original_output_file, converted_output_file, clean_output_file, winter_output_file
 
+def write_daily_files(system_id, daily_rows, output_folder, content):
+    original_rows, converted_rows, clean_rows, winter_rows = daily_rows
 
-def calculate_scop_from_file(file_path, start_date, end_date):
-    total_heat_kwh = 0.0
-    total_elec_kwh = 0.0
-    data_available = False
+    converted_output_file = daily_file_path(output_folder, system_id, 'converted')
+    clean_output_file = daily_file_path(output_folder, system_id, 'clean')
+    winter_output_file = daily_file_path(output_folder, system_id, 'winter')
 
-    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            date = row[' timestamp']
-            if is_within_date_range(date, start_date, end_date):
-                data_available = True
-                total_heat_kwh += float(row[' combined_heat_kwh'])
-                total_elec_kwh += float(row[' combined_elec_kwh'])
+    with metrics.stage('persist'):
+        # The response is archived compressed and byte for byte; only the derived copies are plain CSV
+        original_output_file = archive.write_archive(output_folder, system_id, content)
 
-    if not data_available:
-        return "Data not available"
+        with open(converted_output_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerows(converted_rows)
 
-    if total_elec_kwh > 0:
-        scop = total_heat_kwh / total_elec_kwh
-    else:
-        scop = "Data not available"
+        with open(clean_output_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerows(clean_rows)
 
-    return scop
+        with open(winter_output_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerows(winter_rows)
+        metrics.add_rows('persist', len(original_rows) + len(converted_rows) + len(clean_rows) + len(winter_rows) - 4)
 
+    return original_output_file, converted_output_file, clean_output_file, winter_output_file
 
-def calculate_sh_scop_from_file(file_path, start_date, end_date):
-    total_space_heat_kwh = 0.0
-    total_space_elec_kwh = 0.0
-    data_available = False
 
-    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            date = row[' timestamp']
-            if is_within_date_range(date, start_date, end_date):
-                data_available = True
-                total_space_heat_kwh += float(row[' space_heat_kwh'])
-                total_space_elec_kwh += float(row[' space_elec_kwh'])
+def calculate_scop(rollup_tables, system_id, start_date, end_date, prefix='combined', store_conn=None):
+    with metrics.stage('scop'):
+        # With a store the window is one indexed range query; otherwise the rollups add up its periods
+        if store_conn is not None:
+            totals = store.totals(store_conn, system_id, start_date, end_date,
+                                  [f'{prefix}_heat_kwh', f'{prefix}_elec_kwh'])
+        else:
+            totals = rollup.aggregate(rollup_tables, system_id, start_date, end_date)
 
-    if not data_available:
+    if totals['days'] == 0:
         return "Data not available"
 
-    if total_space_elec_kwh > 0:
-        scop = total_space_heat_kwh / total_space_elec_kwh
+    if totals[f'{prefix}_elec_kwh'] > 0:
+        scop = totals[f'{prefix}_heat_kwh'] / totals[f'{prefix}_elec_kwh']
     else:
         scop = "Data not available"
 
     return scop
 
 
-def calculate_wh_scop_from_file(file_path, start_date, end_date):
-    total_water_heat_kwh = 0.0
-    total_water_elec_kwh = 0.0
-    data_available = False
+def calculate_system_scops(rollup_tables, system_id, store_conn=None):
+    system_scops = []
+    for prefix in ['combined', 'space', 'water']:
+        system_scops.append({
+            'ID': system_id,
+            'SCOP (Jun 23 to Aug 23)': calculate_scop(rollup_tables, system_id, SUMMER_START_DATE, SUMMER_END_DATE,
+                                                      prefix, store_conn),
+            'SCOP (Sep 23 to Nov 23)': calculate_scop(rollup_tables, system_id, AUTUMN_START_DATE, AUTUMN_END_DATE,
+                                                      prefix, store_conn),
+            'SCOP (Dec 23 to Feb 24)': calculate_scop(rollup_tables, system_id, WINTER_START_DATE, WINTER_END_DATE,
+                                                      prefix, store_conn),
+            'SCOP (Mar 24 to May 24)': calculate_scop(rollup_tables, system_id, SPRING_START_DATE, SPRING_END_DATE,
+                                                      prefix, store_conn),
+            'SCOP (Jun 23 to Jun 24)': calculate_scop(rollup_tables, system_id, FULL_YEAR_START_DATE,
+                                                      FULL_YEAR_END_DATE, prefix, store_conn)
+        })
+    return system_scops
 
-    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            date = row[' timestamp']
-            if is_within_date_range(date, start_date, end_date):
-                data_available = True
-                total_water_heat_kwh += float(row[' water_heat_kwh'])
-                total_water_elec_kwh += float(row[' water_elec_kwh'])
 
-    if not data_available:
-        return "Data not available"
+def append_scop_result(result, scop_results, annual_scop_results):
+    scop_results.append(result)
 
-    if total_water_elec_kwh > 0:
-        scop = total_water_heat_kwh / total_water_elec_kwh
-    else:
-        scop = "Data not available"
+    full_year_scop = result['SCOP (Jun 23 to Jun 24)']
+    if full_year_scop != "Data not available" and float(full_year_scop) > 0:
+        annual_scop_results.append({
+            'ID': result['ID'],
+            'SCOP (Jun 23 to Jun 24)': full_year_scop
+        })
 
-    return scop
+
+def save_scop_sketches(file_path, clean_results):
+    # One quantile sketch per SCOP type and period, keyed "combined/SCOP (Jun 23 to Aug 23)" and so on
+    sketches = {}
+    for prefix, results in clean_results.items():
+        for column in SCOP_COLUMNS:
+            values = [float(result[column]) for result in results if result[column] != "Data not available"]
+            sketches[f"{prefix}/{column}"] = sketch.KLLSketch().update(values)
+    sketch.save_sketches(file_path, sketches)
+
+
+def failed_system_id(failure):
+    return failure.item if isinstance(failure.item, int) else failure.item[0]
 
 
 def move_files_to_metering_error(output_folder, system_ids_to_remove):
@@ -182,10 +224,10 @@ def move_files_to_metering_error(output_folder, system_ids_to_remove):
     errors = []
 
     for system_id in system_ids_to_remove:
-        original_file = os.path.join(output_folder, f"system_{system_id}{ORIGINAL_FILE_SUFFIX}")
-        converted_file = os.path.join(output_folder, f"system_{system_id}{CONVERTED_FILE_SUFFIX}")
-        clean_file = os.path.join(output_folder, f"system_{system_id}{CLEAN_FILE_SUFFIX}")
-        winter_file = os.path.join(output_folder, f"system_{system_id}{WINTER_FILE_SUFFIX}")
+        original_file = daily_file_path(output_folder, system_id, 'original')
+        converted_file = daily_file_path(output_folder, system_id, 'converted')
+        clean_file = daily_file_path(output_folder, system_id, 'clean')
+        winter_file = daily_file_path(output_folder, system_id, 'winter')
 
         try:
             if os.path.exists(original_file):
@@ -200,20 +242,37 @@ def move_files_to_metering_error(output_folder, system_ids_to_remove):
             if os.path.exists(winter_file):
                 os.rename(winter_file, os.path.join(metering_error_folder, os.path.basename(winter_file)))
                 moved_files.append(winter_file)
+            for archive_file in archive.archive_files(output_folder, system_id):
+                os.rename(archive_file, os.path.join(metering_error_folder, os.path.basename(archive_file)))
+                moved_files.append(archive_file)
         except Exception as e:
             errors.append(f"Error moving files for system ID {system_id}: {e}")
 
     return moved_files, errors
 
 
-def main():
+def main(metrics_file=METRICS_OUTPUT_FILE, prometheus_file=None, store_file=None,
+         checkpoint_file=checkpoint.CHECKPOINT_FILE, fresh=False, run_id=None):
     output_folder = "system_daily_data"
     os.makedirs(output_folder, exist_ok=True)
 
+    metrics.reset()
+
     url = "https://heatpumpmonitor.org/system/list/public.json"
-    response = requests.get(url)
+    with metrics.stage('fetch_meta'):
+        response = requests.get(url)
+        metrics.add_bytes('fetch_meta', len(response.content))
     meta = response.json()
 
+    store_conn = store.connect(store_file) if store_file else None
+    if store_conn is not None:
+        with metrics.stage('store'):
+            store.load_systems(store_conn, meta)
+            # Their files end up in metering_error, so their rows must not stay behind in the store either
+            store.delete_daily(store_conn, SYSTEM_IDS_TO_REMOVE)
+
+    rollup_tables = rollup.load_rollups(output_folder)
+
     saved_files = []
     scop_results = []
     annual_scop_results = []
@@ -222,76 +281,89 @@ def main():
     wh_scop_results = []
     annual_wh_scop_results = []
 
-    for system in meta:
-        system_id = system['id']
-        original_file, converted_file, clean_file, winter_file = fetch_and_save_daily_data(system_id, output_folder)
-        saved_files.append((system_id, original_file, converted_file, clean_file, winter_file))
-
-        # combined SCOP
-        summer_scop = calculate_scop_from_file(clean_file, SUMMER_START_DATE, SUMMER_END_DATE)
-        autumn_scop = calculate_scop_from_file(clean_file, AUTUMN_START_DATE, AUTUMN_END_DATE)
-        winter_scop = calculate_scop_from_file(clean_file, WINTER_START_DATE, WINTER_END_DATE)
-        spring_scop = calculate_scop_from_file(clean_file, SPRING_START_DATE, SPRING_END_DATE)
-        full_year_scop = calculate_scop_from_file(clean_file, FULL_YEAR_START_DATE, FULL_YEAR_END_DATE)
-
-        scop_results.append({
-            'ID': system_id,
-            'SCOP (Jun 23 to Aug 23)': summer_scop,
-            'SCOP (Sep 23 to Nov 23)': autumn_scop,
-            'SCOP (Dec 23 to Feb 24)': winter_scop,
-            'SCOP (Mar 24 to May 24)': spring_scop,
-            'SCOP (Jun 23 to Jun 24)': full_year_scop
-        })
-
-        if full_year_scop != "Data not available" and float(full_year_scop) > 0:
-            annual_scop_results.append({
-                'ID': system_id,
-                'SCOP (Jun 23 to Jun 24)': full_year_scop
-            })
-
-        # Space heating SCOP
-        summer_sh_scop = calculate_sh_scop_from_file(clean_file, SUMMER_START_DATE, SUMMER_END_DATE)
-        autumn_sh_scop = calculate_sh_scop_from_file(clean_file, AUTUMN_START_DATE, AUTUMN_END_DATE)
-        winter_sh_scop = calculate_sh_scop_from_file(clean_file, WINTER_START_DATE, WINTER_END_DATE)
-        spring_sh_scop = calculate_sh_scop_from_file(clean_file, SPRING_START_DATE, SPRING_END_DATE)
-        full_year_sh_scop = calculate_sh_scop_from_file(clean_file, FULL_YEAR_START_DATE, FULL_YEAR_END_DATE)
-
-        sh_scop_results.append({
-            'ID': system_id,
-            'SCOP (Jun 23 to Aug 23)': summer_sh_scop,
-            'SCOP (Sep 23 to Nov 23)': autumn_sh_scop,
-            'SCOP (Dec 23 to Feb 24)': winter_sh_scop,
-            'SCOP (Mar 24 to May 24)': spring_sh_scop,
-            'SCOP (Jun 23 to Jun 24)': full_year_sh_scop
-        })
-
-        if full_year_sh_scop != "Data not available" and float(full_year_sh_scop) > 0:
-            annual_sh_scop_results.append({
-                'ID': system_id,
-                'SCOP (Jun 23 to Jun 24)': full_year_sh_scop
-            })
+    controller = ratelimit.RateController()
+    system_ids = ratelimit.stalest_first([system['id'] for system in meta],
+                                         lambda system_id: daily_file_path(output_folder, system_id, 'converted'))
+
+    def fetch_stage(system_id):
+        return system_id, download_daily_data(system_id, controller)
+
+    def convert_stage(item):
+        system_id, content = item
+        daily_rows = convert_daily_data(content.decode('utf-8'))
+        with metrics.stage('rollup'):
+            system_rollups = rollup.build_system_rollups(daily_rows[1])
+        return system_id, content, daily_rows, system_rollups
+
+    def persist_stage(item):
+        system_id, content, daily_rows, system_rollups = item
+        return system_id, daily_rows, system_rollups, write_daily_files(system_id, daily_rows, output_folder,
+                                                                         content)
+
+    if fresh:
+        checkpoint.clear_checkpoint(checkpoint_file)
+    run_id = run_id or checkpoint.current_run_id()
+    completed = checkpoint.load_checkpoint(checkpoint_file, run_id)
+    # Systems whose files were moved or deleted since they were checkpointed are fetched again
+    completed = {system_id: record for system_id, record in completed.items()
+                 if all(os.path.exists(file_path) for file_path in record['files'])}
+    for system_id, record in completed.items():
+        # Rollups for completed systems are rebuilt from the daily files they already wrote
+        with open(record['files'][1], mode='r', newline='', encoding='utf-8') as file:
+            rollup.update_rollups(rollup_tables, system_id, list(csv.reader(file)))
+        saved_files.append((system_id, *record['files']))
+        append_scop_result(record['scops'][0], scop_results, annual_scop_results)
+        append_scop_result(record['scops'][1], sh_scop_results, annual_sh_scop_results)
+        append_scop_result(record['scops'][2], wh_scop_results, annual_wh_scop_results)
 
-        # Water heating SCOP
-        summer_wh_scop = calculate_wh_scop_from_file(clean_file, SUMMER_START_DATE, SUMMER_END_DATE)
-        autumn_wh_scop = calculate_wh_scop_from_file(clean_file, AUTUMN_START_DATE, AUTUMN_END_DATE)
-        winter_wh_scop = calculate_wh_scop_from_file(clean_file, WINTER_START_DATE, WINTER_END_DATE)
-        spring_wh_scop = calculate_wh_scop_from_file(clean_file, SPRING_START_DATE, SPRING_END_DATE)
-        full_year_wh_scop = calculate_wh_scop_from_file(clean_file, FULL_YEAR_START_DATE, FULL_YEAR_END_DATE)
-
-        wh_scop_results.append({
-            'ID': system_id,
-            'SCOP (Jun 23 to Aug 23)': summer_wh_scop,
-            'SCOP (Sep 23 to Nov 23)': autumn_wh_scop,
-            'SCOP (Dec 23 to Feb 24)': winter_wh_scop,
-            'SCOP (Mar 24 to May 24)': spring_wh_scop,
-            'SCOP (Jun 23 to Jun 24)': full_year_wh_scop
-        })
-
-        if full_year_wh_scop != "Data not available" and float(full_year_wh_scop) > 0:
-            annual_wh_scop_results.append({
-                'ID': system_id,
-                'SCOP (Jun 23 to Jun 24)': full_year_wh_scop
-            })
+    errors = []
+    pending_ids = [system_id for system_id in system_ids if system_id not in completed]
+
+    for attempt in range(SYSTEM_RETRIES + 1):
+        processed = streaming.run(pending_ids, [
+            ('fetch', fetch_stage, FETCH_WORKERS),
+            ('convert', convert_stage, CONVERT_WORKERS),
+            ('persist', persist_stage, PERSIST_WORKERS)
+        ], queue_size=PIPELINE_QUEUE_SIZE)
+
+        # The loop body below is the aggregate stage; it runs on this thread because it owns the
+        # SCOP result lists, the rollup tables and the SQLite connection
+        failures = []
+        for item in processed:
+            if isinstance(item, streaming.Failure):
+                failures.append(item)
+                continue
+
+            system_id, daily_rows, system_rollups, daily_files = item
+            try:
+                rollup.set_system_rollups(rollup_tables, system_id, system_rollups)
+                # Metering-error systems are kept out of the store, so their SCOPs still come from the rollups
+                system_conn = store_conn if system_id not in SYSTEM_IDS_TO_REMOVE else None
+                if system_conn is not None:
+                    with metrics.stage('store'):
+                        metrics.add_rows('store', store.load_daily(system_conn, system_id, daily_rows[1]))
+                system_scops = calculate_system_scops(rollup_tables, system_id, system_conn)
+            except Exception as e:
+                logging.error(f"Stage aggregate failed for system ID {system_id}: {e}")
+                failures.append(streaming.Failure('aggregate', item, e))
+                continue
+
+            checkpoint.record_system(system_id, {'files': daily_files, 'scops': system_scops}, checkpoint_file,
+                                     run_id)
+            saved_files.append((system_id, *daily_files))
+            append_scop_result(system_scops[0], scop_results, annual_scop_results)
+            append_scop_result(system_scops[1], sh_scop_results, annual_sh_scop_results)
+            append_scop_result(system_scops[2], wh_scop_results, annual_wh_scop_results)
+
+        pending_ids = [failed_system_id(failure) for failure in failures]
+        if not pending_ids:
+            break
+        if attempt < SYSTEM_RETRIES:
+            logging.warning(f"Retrying {len(pending_ids)} failed systems: {pending_ids}")
+        else:
+            for failure in failures:
+                errors.append(f"Error processing system ID {failed_system_id(failure)} in stage {failure.stage}: "
+                              f"{failure.error}")
 
     scop_results = sorted(scop_results, key=lambda x: x['ID'])
     annual_scop_results = sorted(annual_scop_results, key=lambda x: x['ID'])
@@ -461,13 +533,36 @@ def main():
         for result in wh_scop_clean_results:
             writer.writerow(result)
 
-    moved_files, errors = move_files_to_metering_error(output_folder, SYSTEM_IDS_TO_REMOVE)
+    with metrics.stage('sketch'):
+        save_scop_sketches(SCOP_SKETCH_FILE, {
+            'combined': scop_clean_results,
+            'space': sh_scop_clean_results,
+            'water': wh_scop_clean_results
+        })
+
+    with metrics.stage('rollup'):
+        rollup.save_rollups(output_folder, rollup_tables)
+
+    if store_conn is not None:
+        store_conn.close()
+
+    with metrics.stage('metering_error'):
+        moved_files, move_errors = move_files_to_metering_error(output_folder, SYSTEM_IDS_TO_REMOVE)
+    errors.extend(move_errors)
 
     logging.info(f"SCOP and space heating COP calculations completed and saved to {scop_output_file}, "
                  f"{sh_scop_output_file}, {clean_scop_output_file}, {clean_sh_scop_output_file}, "
                  f"{annual_scop_output_file}, {annual_sh_scop_output_file}, {wh_scop_output_file}, "
                  f"{annual_wh_scop_output_file}, and {clean_wh_scop_output_file}.")
 
+    metrics.export(metrics_file, prometheus_file)
+
+    # Every system has now been tried, so the checkpoint is only kept for an interrupted run. Systems that
+    # still failed are not in it and are fetched again by the next run.
+    for error in errors:
+        logging.error(error)
+    checkpoint.clear_checkpoint(checkpoint_file)
+
     return {
         'saved_files': saved_files,
         'scop_results': scop_results,
@@ -482,4 +577,16 @@ def main():
 
 
 if __name__ == "__main__":
-    result = main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metrics', default=METRICS_OUTPUT_FILE, help="JSON file for run metrics")
+    parser.add_argument('--prometheus', default=os.environ.get('PROMETHEUS_TEXTFILE'),
+                        help="Prometheus textfile collector output")
+    parser.add_argument('--store', nargs='?', const=store.STORE_FILE, default=None,
+                        help="Also bulk-load metadata and daily rows into an SQLite store")
+    parser.add_argument('--fresh', action='store_true', help="Ignore any checkpoint left by an interrupted run")
+    parser.add_argument('--run-id', default=None,
+                        help="Run whose checkpoint to resume, e.g. 2024-06-01 after midnight; defaults to today")
+    args = parser.parse_args()
+
+    result = main(metrics_file=args.metrics, prometheus_file=args.prometheus, store_file=args.store,
+                  fresh=args.fresh, run_id=args.run_id)
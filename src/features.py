@@ -0,0 +1,152 @@
+import os
+import logging
+import argparse
+
+import pandas as pd
+
+import metrics
+import metastore
+import store
+from fleet import Fleet, TIMESTAMP_FORMAT
+from dailydata import (SUMMER_START_DATE, AUTUMN_START_DATE, WINTER_START_DATE, SPRING_START_DATE,
+                       SPRING_END_DATE)
+
+# Bump when a feature is added, removed or computed differently, so stale tables are rebuilt rather than read
+FEATURE_VERSION = 1
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FEATURES_FILE = os.path.join(SRC_DIRECTORY, 'system_features.csv')
+
+# The four seasons dailydata.py reports; together they make up the Jun 23 to Jun 24 year
+SEASON_EDGES = [SUMMER_START_DATE, AUTUMN_START_DATE, WINTER_START_DATE, SPRING_START_DATE, SPRING_END_DATE]
+SEASONS = ['summer', 'autumn', 'winter', 'spring']
+YEAR = 'year'
+SCOP_PREFIXES = ['combined', 'space', 'water']
+# Column name the cohort plots and the SCOP model use for the full-year combined SCOP, as in annual_system_scop.csv
+ANNUAL_SCOP_COLUMN = 'SCOP (Jun 23 to Jun 24)'
+
+KWH_FIELDS = [f"{prefix}_{field}" for prefix in SCOP_PREFIXES for field in ['heat_kwh', 'elec_kwh']]
+# Daily means are weighted by the seconds of data behind them, as rollup.py and last365.py do
+WEIGHTED_FIELDS = {
+    'combined_flowT_mean': 'combined_data_length',
+    'combined_roomT_mean': 'combined_data_length',
+    'combined_outsideT_mean': 'combined_data_length',
+    'combined_starts_per_hour': 'combined_data_length',
+    'space_flowT_mean': 'space_data_length',
+    'space_roomT_mean': 'space_data_length',
+    'space_outsideT_mean': 'space_data_length',
+    'water_flowT_mean': 'water_data_length'
+}
+DAILY_COLUMNS = ['timestamp'] + KWH_FIELDS + sorted(set(WEIGHTED_FIELDS) | set(WEIGHTED_FIELDS.values()))
+
+_loaded = {}
+
+
+def season_totals(data):
+    timestamps = pd.to_datetime(data['timestamp'].astype(str).str.strip(), format=TIMESTAMP_FORMAT, errors='coerce')
+    season = pd.cut(timestamps, SEASON_EDGES, labels=SEASONS, right=False)
+    values = data.reindex(columns=DAILY_COLUMNS[1:]).apply(pd.to_numeric, errors='coerce')
+
+    parts = {field: values[field] for field in KWH_FIELDS}
+    parts['days'] = values['combined_data_length'] > 0
+    for field, weight_field in WEIGHTED_FIELDS.items():
+        weight = values[weight_field].where(values[field].notna() & (values[weight_field] > 0))
+        parts[f"{field}_wsum"] = values[field] * weight
+        parts[f"{field}_weight"] = weight
+
+    # One grouped sum gives every system's totals for every season; the year is the sum of its seasons
+    in_year = season.notna()
+    totals = pd.DataFrame(parts)[in_year].groupby([data['system_id'][in_year], season[in_year].astype(str)]) \
+        .sum(min_count=1)
+    year = totals.groupby(level=0).sum(min_count=1)
+    year.index = pd.MultiIndex.from_product([year.index, [YEAR]])
+    return pd.concat([totals, year])
+
+
+def _period_features(totals):
+    features = pd.DataFrame(index=totals.index)
+    features['days'] = totals['days']
+    for prefix in SCOP_PREFIXES:
+        elec = totals[f"{prefix}_elec_kwh"]
+        features[f"{prefix}_scop"] = (totals[f"{prefix}_heat_kwh"] / elec).where(elec > 0)
+    for field in WEIGHTED_FIELDS:
+        weight = totals[f"{field}_weight"]
+        features[field] = (totals[f"{field}_wsum"] / weight).where(weight > 0)
+    # The room-outside temperature differences flowtemp_all.py plots against COP
+    features['combined_delta_t'] = features['combined_roomT_mean'] - features['combined_outsideT_mean']
+    features['space_delta_t'] = features['space_roomT_mean'] - features['space_outsideT_mean']
+    return features
+
+
+def build_features(fleet=None):
+    if fleet is None:
+        fleet = Fleet(store_file=store.default_store_file())
+    data = fleet.source('converted').select(*DAILY_COLUMNS).frame()
+
+    with metrics.stage('features'):
+        if data.empty:
+            features = pd.DataFrame(index=pd.Index([], name='ID'))
+        else:
+            period_features = _period_features(season_totals(data))
+            # Wide layout: one row per system, one column per feature and period, e.g. combined_scop_winter
+            features = period_features.unstack(level=1).reindex(columns=pd.MultiIndex.from_product(
+                [period_features.columns, SEASONS + [YEAR]]))
+            features.columns = [f"{feature}_{period}" for feature, period in features.columns]
+            day_columns = [f"days_{period}" for period in SEASONS + [YEAR]]
+            features[day_columns] = features[day_columns].fillna(0).astype(int)
+            features.index.name = 'ID'
+            metrics.add_rows('features', len(data))
+
+        metadata = metastore.lookup(features.index, ['heat_demand', 'floor_area'])
+        floor_area = pd.to_numeric(metadata['floor_area'], errors='coerce')
+        features['heat_demand_per_floor_area'] = \
+            (pd.to_numeric(metadata['heat_demand'], errors='coerce') / floor_area).where(floor_area > 0)
+
+    features.insert(0, 'feature_version', FEATURE_VERSION)
+    return features.reset_index()
+
+
+def save_features(features, file_path=FEATURES_FILE):
+    temporary_file = f"{file_path}.tmp"
+    features.to_csv(temporary_file, index=False)
+    os.replace(temporary_file, file_path)
+
+
+def load_features(columns=None, file_path=FEATURES_FILE):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} is missing; run features.py to build it")
+    stamp = os.stat(file_path).st_mtime_ns
+    if file_path not in _loaded or _loaded[file_path][0] != stamp:
+        features = pd.read_csv(file_path).set_index('ID')
+        versions = set(features['feature_version'].unique())
+        if versions != {FEATURE_VERSION}:
+            raise ValueError(f"{file_path} holds feature version {sorted(versions)}, expected {FEATURE_VERSION}; "
+                             f"run features.py to rebuild it")
+        _loaded[file_path] = (stamp, features)
+    features = _loaded[file_path][1]
+    return features if columns is None else features[list(columns)]
+
+
+def join_features(data, columns, on='ID', how='left', file_path=FEATURES_FILE):
+    return data.join(load_features(columns, file_path), on=on, how=how)
+
+
+def annual_scop(file_path=FEATURES_FILE):
+    # Same systems as annual_system_scop.csv: dailydata.py leaves out a zero or missing full-year SCOP
+    scop = load_features([f"combined_scop_{YEAR}"], file_path)[f"combined_scop_{YEAR}"]
+    return scop[scop > 0].rename(ANNUAL_SCOP_COLUMN).reset_index()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=FEATURES_FILE, help="CSV file for the per-system feature table")
+    args = parser.parse_args()
+
+    features = build_features()
+    save_features(features, args.output)
+    logging.info(f"Feature table v{FEATURE_VERSION} with {len(features.columns) - 2} features for "
+                 f"{len(features)} systems written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import os
+import copy
+import glob
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import store
+import bulkload
+from dailydata import (daily_file_path, FILE_SUFFIXES, SYSTEM_IDS_TO_REMOVE, SUMMER_START_DATE, SPRING_END_DATE,
+                       WINTER_START_DATE, WINTER_END_DATE)
+
+FILE_TYPE_WINDOWS = {
+    'clean': (SUMMER_START_DATE, SPRING_END_DATE),
+    'winter': (WINTER_START_DATE, WINTER_END_DATE)
+}
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DATA_DIRECTORY = os.path.join(SRC_DIRECTORY, 'system_daily_data')
+METADATA_FILE = os.path.join(SRC_DIRECTORY, 'all_data_sorted_by_id.csv')
+GROUPS_DIRECTORY = os.path.join(SRC_DIRECTORY, 'groups')
+
+GROUP_FILES = {
+    'less_than_50_group': 'less_than_50_group.csv',
+    'bet_50_100_group': 'bet_50_100_group.csv',
+    'bet_100_200_group': 'bet_100_200_group.csv',
+    'more_than_200_group': 'more_than_200_group.csv'
+}
+# Written by groups/cluster.py, numbered from the lowest to the highest COP cluster
+CLUSTER_GROUP_TEMPLATE = 'cluster_{cluster}_group.csv'
+GROUPINGS = ['heat_demand', 'cluster']
+# matplotlib's tab10, for groups a script has no colour for
+GROUP_PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22',
+                 '#17becf']
+
+METADATA_ALIASES = {
+    'hp_model': 'Model',
+    'hp_output': 'Output',
+    'location': 'Location'
+}
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:00:00'
+
+
+def group_files(grouping='heat_demand', groups_directory=GROUPS_DIRECTORY):
+    # Group name to file name, relative to the groups directory
+    if grouping == 'heat_demand':
+        return dict(GROUP_FILES)
+    if grouping == 'cluster':
+        pattern = os.path.join(groups_directory, CLUSTER_GROUP_TEMPLATE.format(cluster='*'))
+        files = sorted(os.path.basename(file_path) for file_path in glob.glob(pattern))
+        return {file_name[:-len('.csv')]: file_name for file_name in files}
+    raise ValueError(f"Unknown grouping {grouping}; expected one of {GROUPINGS}")
+
+
+def group_styles(group_names, labels=None, colors=None):
+    # Label and colour for each group: the heat demand bands keep the ones a script gives them, and other groups,
+    # e.g. cluster_0_group, read as "Cluster 0" and take the palette in order
+    labels, colors = labels or {}, colors or {}
+    styles = {}
+    for position, group_name in enumerate(group_names):
+        name = group_name[:-len('_group')] if group_name.endswith('_group') else group_name
+        styles[group_name] = (labels.get(group_name, name.replace('_', ' ').capitalize()),
+                              colors.get(group_name, GROUP_PALETTE[position % len(GROUP_PALETTE)]))
+    return styles
+
+
+def _matches(series, condition):
+    if callable(condition):
+        return series.map(condition).astype(bool)
+    if isinstance(condition, (list, tuple, set, frozenset)):
+        return series.isin(list(condition))
+    return series == condition
+
+
+class Fleet:
+    def __init__(self, data_directory=DATA_DIRECTORY, metadata_file=METADATA_FILE,
+                 groups_directory=GROUPS_DIRECTORY, store_file=None, workers=bulkload.DEFAULT_WORKERS):
+        self.data_directory = data_directory
+        self.metadata_file = metadata_file
+        self.groups_directory = groups_directory
+        self.store_file = store_file
+        self.workers = workers
+        self._metadata_filters = {}
+        self._groups = None
+        self._ids = None
+        self._start = None
+        self._end = None
+        self._file_type = None
+        self._bounds = {}
+        self._columns = None
+        self._dtypes = {}
+
+    def _copy(self):
+        return copy.copy(self)
+
+    def where(self, group=None, **filters):
+        fleet = self._copy()
+        fleet._metadata_filters = dict(self._metadata_filters)
+        fleet._metadata_filters.update(filters)
+        if group is not None:
+            fleet._groups = [group] if isinstance(group, str) else list(group)
+        return fleet
+
+    def ids(self, system_ids):
+        fleet = self._copy()
+        fleet._ids = list(dict.fromkeys(int(system_id) for system_id in system_ids))
+        return fleet
+
+    def between(self, start_date, end_date):
+        fleet = self._copy()
+        fleet._start, fleet._end = start_date, end_date
+        return fleet
+
+    def source(self, file_type):
+        fleet = self._copy()
+        fleet._file_type = file_type
+        return fleet
+
+    def bounds(self, **bounds):
+        fleet = self._copy()
+        fleet._bounds = dict(self._bounds)
+        fleet._bounds.update(bounds)
+        return fleet
+
+    def select(self, *columns):
+        fleet = self._copy()
+        fleet._columns = list(columns)
+        return fleet
+
+    def astype(self, **dtypes):
+        fleet = self._copy()
+        fleet._dtypes = dict(self._dtypes)
+        fleet._dtypes.update(dtypes)
+        return fleet
+
+    def file_type(self):
+        if self._file_type is not None:
+            return self._file_type
+        # Push the time window down to the narrowest file written by dailydata.py
+        if self._start is not None and self._end is not None:
+            if WINTER_START_DATE <= self._start and self._end <= WINTER_END_DATE:
+                return 'winter'
+            if SUMMER_START_DATE <= self._start and self._end <= SPRING_END_DATE:
+                return 'clean'
+        return 'converted'
+
+    def _group_ids(self):
+        ids = set()
+        for group in self._groups:
+            # Any group file can be named without its .csv, e.g. cluster_0_group
+            file_name = GROUP_FILES.get(group, group if group.endswith('.csv') else f"{group}.csv")
+            group_file = os.path.join(self.groups_directory, file_name)
+            ids.update(pd.read_csv(group_file, usecols=['ID'])['ID'].astype(int))
+        return ids
+
+    def system_ids(self, conn=None):
+        if self.store_file is not None and conn is None:
+            with closing(store.connect_reader(self.store_file)) as conn:
+                return self.system_ids(conn)
+
+        ids = set(self._ids) if self._ids is not None else None
+        if self._groups is not None:
+            group_ids = self._group_ids()
+            ids = group_ids if ids is None else ids & group_ids
+
+        if self._metadata_filters:
+            metadata_ids = self._metadata_ids(conn)
+            ids = metadata_ids if ids is None else ids & metadata_ids
+
+        if self.store_file is not None:
+            stored_ids = {row[0] for row in conn.execute("SELECT DISTINCT system_id FROM daily")}
+            # Stores built before these systems were excluded may still hold their rows
+            stored_ids -= set(SYSTEM_IDS_TO_REMOVE)
+            ids = stored_ids if ids is None else ids & stored_ids
+        else:
+            file_type = self.file_type()
+            if ids is None:
+                suffix = FILE_SUFFIXES[file_type]
+                ids = set()
+                for filename in os.listdir(self.data_directory):
+                    if filename.startswith('system_') and filename.endswith(suffix):
+                        ids.add(int(filename[len('system_'):-len(suffix)]))
+            ids = {system_id for system_id in ids
+                   if os.path.exists(daily_file_path(self.data_directory, system_id, file_type))}
+
+        # Keep the caller's ordering when explicit IDs were given, e.g. group files sorted by heat demand
+        if self._ids is not None:
+            return [system_id for system_id in self._ids if system_id in ids]
+        return sorted(ids)
+
+    def _metadata_ids(self, conn=None):
+        if conn is not None:
+            metadata = store.query_systems(conn, list(self._metadata_filters)).rename(columns={'id': 'ID'})
+        else:
+            columns = {METADATA_ALIASES.get(column, column): column for column in self._metadata_filters}
+            metadata = pd.read_csv(self.metadata_file, encoding='latin1', usecols=['ID'] + list(columns))
+            metadata = metadata.rename(columns=columns)
+
+        mask = pd.Series(True, index=metadata.index)
+        for column, condition in self._metadata_filters.items():
+            mask &= _matches(metadata[column], condition)
+        return set(metadata.loc[mask, 'ID'].astype(int))
+
+    def _needed_columns(self):
+        if self._columns is None:
+            return None
+        needed = set(self._columns) | set(self._bounds)
+        if self._start is not None or self._end is not None:
+            needed.add('timestamp')
+        return needed
+
+    def _filter_rows(self, chunk):
+        mask = pd.Series(True, index=chunk.index)
+        if self._start is not None or self._end is not None:
+            timestamps = pd.to_datetime(chunk['timestamp'].astype(str).str.strip(), format=TIMESTAMP_FORMAT,
+                                        errors='coerce')
+            if self._start is not None:
+                mask &= timestamps >= self._start
+            if self._end is not None:
+                mask &= timestamps < self._end
+        for column, (low, high) in self._bounds.items():
+            values = pd.to_numeric(chunk[column], errors='coerce')
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return chunk[mask]
+
+    def _read_stored_system(self, conn, system_id):
+        start_date, end_date = self._start, self._end
+        if start_date is None and end_date is None:
+            start_date, end_date = FILE_TYPE_WINDOWS.get(self.file_type(), (None, None))
+        needed = self._needed_columns()
+        columns = sorted(needed - {'system_id'}) if needed is not None else None
+
+        with metrics.stage('load'):
+            data = store.query_daily(conn, columns, [system_id], start_date, end_date, self._bounds)
+            metrics.add_rows('load', len(data))
+
+        data = bulkload.coerce_dtypes(data.drop(columns=['system_id', 'day'], errors='ignore'), self._dtypes)
+        if self._columns is not None:
+            data = data[[column for column in self._columns if column in data.columns]]
+        return data
+
+    def _read_system(self, system_id):
+        file_path = daily_file_path(self.data_directory, system_id, self.file_type())
+        data = self._filter_rows(bulkload.read_daily_file(file_path, self._needed_columns(), self._dtypes))
+
+        if self._columns is not None:
+            data = data[[column for column in self._columns if column in data.columns]]
+        return data
+
+    def frames(self):
+        if self.store_file is not None:
+            # One read connection serves the ID lookup and every system's indexed query
+            with closing(store.connect_reader(self.store_file)) as conn:
+                for system_id in self.system_ids(conn):
+                    yield system_id, self._read_stored_system(conn, system_id)
+            return
+
+        # Files are read on a thread pool but still yielded one at a time, in system order
+        system_ids = self.system_ids()
+        yield from zip(system_ids, bulkload.imap(self._read_system, system_ids, self.workers))
+
+    def frame(self):
+        frames = []
+        for system_id, data in self.frames():
+            if not data.empty:
+                frames.append(data.assign(system_id=system_id))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def arrays(self, *columns):
+        fleet = self.select(*columns) if columns else self
+        data = fleet.frame()
+        columns = list(columns) or [column for column in data.columns if column != 'system_id']
+        return {column: data[column].to_numpy() if column in data else np.array([])
+                for column in columns + ['system_id']}
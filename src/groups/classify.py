@@ -1,8 +1,17 @@
+import io
+import os
+import sys
 import requests
 import csv
+import logging
+import argparse
 from collections import defaultdict
 from tabulate import tabulate
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import features
+import last365
 
 INDEX_COP = 4
 INDEX_HEAT_DEMAND_PER_FLOOR_AREA = 10
@@ -23,7 +32,16 @@ def calculate_heat_demand_per_floor_area(heat_demand, floor_area):
     return "N/A"
 
 
-def prepare_system_data(systems, stats):
+def load_heat_demand_per_floor_area():
+    # Systems with daily data take the figure from the feature table; the rest are worked out from public.json
+    if not os.path.exists(features.FEATURES_FILE):
+        return {}
+    values = features.load_features(['heat_demand_per_floor_area'])['heat_demand_per_floor_area'].dropna()
+    return {system_id: "{:.2f}".format(value) for system_id, value in values.items()}
+
+
+def prepare_system_data(systems, stats, known_heat_demand_per_floor_area=None):
+    known_heat_demand_per_floor_area = known_heat_demand_per_floor_area or {}
     table = []
     for system in systems:
         system_stats = stats.get(str(system['id']), {})
@@ -37,7 +55,8 @@ def prepare_system_data(systems, stats):
             if system_stats.get('combined_data_length') is not None else "N/A"
         heat_demand = system.get('heat_demand', "N/A")
         floor_area = system.get('floor_area', "N/A")
-        heat_demand_per_floor_area = calculate_heat_demand_per_floor_area(heat_demand, floor_area)
+        heat_demand_per_floor_area = known_heat_demand_per_floor_area.get(int(system['id'])) or \
+            calculate_heat_demand_per_floor_area(heat_demand, floor_area)
         table.append([system['id'], system['location'], f"{system['hp_output']} kW", system['hp_model'], cop,
                       flowT, outsideT, days, heat_demand, floor_area, heat_demand_per_floor_area])
     return table
@@ -117,6 +136,16 @@ def format_grouped_systems(grouped_systems, headers):
 
     return results
 
+def write_if_changed(filename, content):
+    if os.path.exists(filename):
+        with open(filename, mode='r', newline='', encoding='utf-8') as file:
+            if file.read() == content:
+                return False
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        file.write(content)
+    return True
+
+
 def save_grouped_data_to_csv(grouped_systems, headers):
     filenames = {
         ">200 kWh/m²": "more_than_200_group.csv",
@@ -125,24 +154,30 @@ def save_grouped_data_to_csv(grouped_systems, headers):
         "<50 kWh/m²": "less_than_50_group.csv"
     }
 
+    saved_groups = []
     for group, filename in filenames.items():
-        with open(filename, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(headers)
-            for row in grouped_systems.get(group, []):
-                writer.writerow([row[h] for h in headers])
+        # Built in memory and compared with the file, so unchanged groups keep their timestamps whether the
+        # systems or the grouping rules in this script changed
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        for row in grouped_systems.get(group, []):
+            writer.writerow([row[h] for h in headers])
+        if write_if_changed(filename, buffer.getvalue()):
+            saved_groups.append(group)
 
+    logging.info(f"Group files rewritten: {', '.join(saved_groups) or 'none'}")
     return f"Grouped data has been saved to separate CSV files."
 
-def main():
+def main(local_stats=False):
     url_meta = "https://heatpumpmonitor.org/system/list/public.json"
     url_stats = "https://heatpumpmonitor.org/system/stats/last365"
     meta = fetch_url_data(url_meta)
-    stats = fetch_url_data(url_stats)
+    stats = last365.local_last365() if local_stats else fetch_url_data(url_stats)
 
     headers = ["ID", "Location", "Output", "Model", "COP", "FlowT", "OutsideT", "Days", "Heat Demand", "Floor Area",
                "Heat Demand/Floor Area"]
-    data = prepare_system_data(meta, stats)
+    data = prepare_system_data(meta, stats, load_heat_demand_per_floor_area())
 
     csv_cop = "data_sorted_by_cop.csv"
     cop_save_result = save_data_to_csv(csv_cop, headers, list(data), INDEX_COP)
@@ -178,4 +213,9 @@ def main():
 
 
 if __name__ == "__main__":
-    results = main()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--local-stats', action='store_true',
+                        help="Compute last365 stats from the daily data downloaded by dailydata.py")
+    args = parser.parse_args()
+    results = main(local_stats=args.local_stats)
@@ -0,0 +1,169 @@
+import os
+import sys
+import glob
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import curvefit
+import metrics
+import store
+from fleet import Fleet, CLUSTER_GROUP_TEMPLATE
+
+N_CLUSTERS = 4
+BATCH_SIZE = 256
+# Systems are profiled this many at a time, so only one batch of daily rows is in memory
+PROFILE_BATCH_SYSTEMS = 32
+RANDOM_STATE = 42
+COP_MAX = 8
+# Responses are compared at a typical heating-season outside temperature rather than at 0 °C
+REFERENCE_OUTSIDE_T = 7.0
+PROFILES_FILE = 'cluster_profiles.csv'
+METRICS_OUTPUT_FILE = 'cluster_metrics.json'
+
+# The responses are fitted on space heating where it is metered, as in curvefit.py: hot water days run at a fixed
+# high flow temperature whatever the weather, so they would flatten both slopes
+SPACE_COLUMNS = {'cop': 'space_cop', 'outsideT': curvefit.X_COLUMN, 'flowT': curvefit.Y_COLUMN,
+                 'heat': curvefit.HEAT_COLUMN}
+# Systems that do not meter space heating separately fall back to combined figures on days below the usual degree-day
+# base temperature, when the heat pump is mostly space heating
+COMBINED_COLUMNS = {'cop': 'combined_cop', 'outsideT': 'combined_outsideT_mean', 'flowT': 'combined_flowT_mean',
+                    'heat': 'combined_heat_kwh'}
+HEATING_OUTSIDE_T = 15.5
+DAILY_COLUMNS = list(SPACE_COLUMNS.values()) + list(COMBINED_COLUMNS.values()) + ['combined_starts_per_hour',
+                                                                                 'combined_data_length']
+PROFILE_COLUMNS = ['cop_slope', 'cop_at_reference', 'flowT_slope', 'flowT_at_reference', 'starts_per_hour']
+
+data_directory = os.path.join('..', 'system_daily_data')
+
+
+def heating_days(values, columns):
+    cop = values[columns['cop']]
+    return pd.DataFrame({name: values[column] for name, column in columns.items()})[
+        (values[columns['heat']] > 0) & (cop > 0) & (cop <= COP_MAX) & np.isfinite(values[columns['outsideT']]) &
+        np.isfinite(values[columns['flowT']])]
+
+
+def batch_profiles(data):
+    values = data[DAILY_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    space_days = heating_days(values, SPACE_COLUMNS)
+    combined_days = heating_days(values, COMBINED_COLUMNS)
+    combined_days = combined_days[combined_days['outsideT'] < HEATING_OUTSIDE_T]
+
+    # A system with enough space heating days for a fit uses them; the others use their cold combined days
+    space_counts = data.loc[space_days.index, 'system_id'].value_counts()
+    space_metered = space_counts.index[space_counts >= curvefit.MIN_DAYS]
+    space_days = space_days[data.loc[space_days.index, 'system_id'].isin(space_metered)]
+    combined_days = combined_days[~data.loc[combined_days.index, 'system_id'].isin(space_metered)]
+    days = pd.concat([space_days, combined_days])
+    system_ids = data.loc[days.index, 'system_id']
+
+    # Both responses are fitted for every system in the batch at once
+    cop = curvefit.fit_curves(system_ids, days['outsideT'], days['cop']).set_index('ID')
+    flow = curvefit.fit_curves(system_ids, days['outsideT'], days['flowT']).set_index('ID')
+
+    weight = values['combined_data_length'].where(values['combined_starts_per_hour'].notna() &
+                                                  (values['combined_data_length'] > 0))
+    cycling = (values['combined_starts_per_hour'] * weight).groupby(data['system_id']).sum() / \
+        weight.groupby(data['system_id']).sum()
+
+    profiles = pd.DataFrame({
+        'source': np.where(cop.index.isin(space_metered), 'space', 'combined'),
+        'days': cop['days'],
+        'cop_slope': cop['slope'],
+        'cop_at_reference': cop['intercept'] + cop['slope'] * REFERENCE_OUTSIDE_T,
+        'flowT_slope': flow['slope'],
+        'flowT_at_reference': flow['intercept'] + flow['slope'] * REFERENCE_OUTSIDE_T,
+        'starts_per_hour': cycling.reindex(cop.index)
+    })
+    profiles.index.name = 'ID'
+    return profiles
+
+
+def build_profiles(fleet=None, file_type='clean'):
+    if fleet is None:
+        fleet = Fleet(data_directory, store_file=store.default_store_file())
+    fleet = fleet.source(file_type).select(*DAILY_COLUMNS)
+
+    profiles = []
+    batch = []
+    system_count = 0
+
+    def flush():
+        if batch:
+            with metrics.stage('profile'):
+                profiles.append(batch_profiles(pd.concat(batch, ignore_index=True)))
+                metrics.add_rows('profile', sum(len(data) for data in batch))
+            batch.clear()
+
+    for system_id, data in fleet.frames():
+        if not data.empty:
+            system_count += 1
+            batch.append(data.assign(system_id=system_id))
+        if len(batch) >= PROFILE_BATCH_SYSTEMS:
+            flush()
+    flush()
+
+    if not profiles:
+        return pd.DataFrame(columns=['source', 'days'] + PROFILE_COLUMNS)
+    # Systems without enough heating days for a response fit can not be placed in a cluster
+    profiles = pd.concat(profiles).dropna(subset=PROFILE_COLUMNS)
+    sources = profiles['source'].value_counts()
+    logging.info(f"{len(profiles)} of {system_count} systems have a profile: {sources.get('space', 0)} from "
+                 f"space heating days, {sources.get('combined', 0)} from combined days below {HEATING_OUTSIDE_T} °C")
+    return profiles
+
+
+def cluster_profiles(profiles, n_clusters=N_CLUSTERS):
+    scaled = StandardScaler().fit_transform(profiles[PROFILE_COLUMNS])
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=BATCH_SIZE, n_init=10, random_state=RANDOM_STATE)
+    with metrics.stage('cluster'):
+        labels = kmeans.fit_predict(scaled)
+        metrics.add_rows('cluster', len(scaled))
+
+    # Number clusters from the lowest to the highest COP at the reference temperature, so labels stay stable
+    order = profiles.groupby(labels)['cop_at_reference'].mean().sort_values().index
+    relabel = {label: rank for rank, label in enumerate(order)}
+    return profiles.assign(cluster=[relabel[label] for label in labels])
+
+
+def save_cluster_groups(clustered, profiles_file=PROFILES_FILE):
+    clustered.reset_index().to_csv(profiles_file, index=False)
+
+    for stale_file in glob.glob(CLUSTER_GROUP_TEMPLATE.format(cluster='*')):
+        os.remove(stale_file)
+    # Same shape as the heat demand group files: one row per system with an ID column
+    for cluster, members in clustered.groupby('cluster'):
+        members.drop(columns='cluster').reset_index().to_csv(CLUSTER_GROUP_TEMPLATE.format(cluster=cluster),
+                                                             index=False)
+
+
+def main(n_clusters=N_CLUSTERS, file_type='clean'):
+    profiles = build_profiles(file_type=file_type)
+    if len(profiles) < n_clusters:
+        logging.error(f"Only {len(profiles)} systems have a profile; need at least {n_clusters} to cluster")
+        return None
+
+    clustered = cluster_profiles(profiles, n_clusters)
+    save_cluster_groups(clustered)
+
+    summary = clustered.groupby('cluster')[PROFILE_COLUMNS].median().assign(
+        systems=clustered.groupby('cluster').size())
+    logging.info(f"Clustered {len(clustered)} systems into {n_clusters} groups:\n{summary.round(3).to_string()}")
+    return clustered
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clusters', type=int, default=N_CLUSTERS, help="Number of clusters")
+    parser.add_argument('--source', choices=['clean', 'winter'], default='clean', help="Which daily files to use")
+    args = parser.parse_args()
+
+    main(args.clusters, args.source)
+    metrics.export(METRICS_OUTPUT_FILE, os.environ.get('PROMETHEUS_TEXTFILE'))
@@ -1,9 +1,16 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.interpolate import griddata
 import logging
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import metrics
+import store
+from fleet import Fleet, GROUPINGS, group_files, group_styles
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -32,6 +39,7 @@ LEGEND_TITLE_FONT_SIZE = 14
 
 ANNUAL_PERIOD = 'Jun 23 to Jun 24'
 WINTER_PERIOD = 'Dec 23 to Feb 24'
+METRICS_OUTPUT_FILE = 'flowtemp_metrics.json'
 
 GROUP_COLORS = {
     'less_than_50_group': '#a25430',
@@ -63,19 +71,17 @@ def process_group(group_file, data_directory, file_type='clean'):
 
     all_filtered_data = pd.DataFrame()
 
-    for system_id in ids:
-        filename = f"system_{system_id}_daily_data_{file_type}.csv"
-        file_path = os.path.join(data_directory, filename)
-
-        if os.path.exists(file_path):
-            system_data = pd.read_csv(file_path)
-            system_data.columns = system_data.columns.str.strip()
+    fleet = Fleet(data_directory, store_file=store.default_store_file()).ids(ids).source(file_type)
+    for system_id, system_data in fleet.frames():
+        if has_invalid_cop(system_data):
+            continue
 
-            if has_invalid_cop(system_data):
-                continue
+        if is_non_empty(system_data):
+            all_filtered_data = pd.concat([all_filtered_data, system_data], ignore_index=True)
 
-            if is_non_empty(system_data):
-                all_filtered_data = pd.concat([all_filtered_data, system_data], ignore_index=True)
+    # Small groups, such as a one-system cluster, can lose every system to the COP check
+    if all_filtered_data.empty:
+        return all_filtered_data
 
     filtered_data = all_filtered_data[
         (all_filtered_data['combined_cop'] > COP_MIN_CLEANSE) & (all_filtered_data['combined_cop'] <= COP_MAX)
@@ -83,7 +89,7 @@ def process_group(group_file, data_directory, file_type='clean'):
 
     return filtered_data
 
-def plot_scatter_and_contour_side_by_side(group_name, filtered_data, plot_title_suffix):
+def plot_scatter_and_contour_side_by_side(label, color, filtered_data, plot_title_suffix):
     if not filtered_data.empty:
         plt.figure(figsize=(FIGURE_WIDTH, FIGURE_HEIGHT))
 
@@ -93,8 +99,8 @@ def plot_scatter_and_contour_side_by_side(group_name, filtered_data, plot_title_
             filtered_data['combined_cop'],
             alpha=ALPHA,
             edgecolors='k',
-            facecolor=GROUP_COLORS[group_name],
-            label=GROUP_LABELS[group_name],
+            facecolor=color,
+            label=label,
             s=POINT_SIZE,
             marker="o"
         )
@@ -109,7 +115,9 @@ def plot_scatter_and_contour_side_by_side(group_name, filtered_data, plot_title_
         grid_x, grid_y = np.mgrid[FLOW_TEMP_MIN:FLOW_TEMP_MAX:GRID_DENSITY*1j, COP_MIN:COP_MAX:GRID_DENSITY*1j]
         points = filtered_data[['combined_flowT_mean', 'combined_cop']].values
         values = filtered_data['combined_cop'].values
-        grid_z = griddata(points, values, (grid_x, grid_y), method='cubic')
+        with metrics.stage('griddata'):
+            grid_z = griddata(points, values, (grid_x, grid_y), method='cubic')
+            metrics.add_rows('griddata', len(points))
 
         contour = plt.contourf(grid_x, grid_y, grid_z, levels=CONTOUR_LEVELS, cmap="RdYlBu", alpha=0.75)
         plt.colorbar(contour)
@@ -119,11 +127,12 @@ def plot_scatter_and_contour_side_by_side(group_name, filtered_data, plot_title_
         plt.ylim(COP_MIN, COP_MAX)
         plt.grid(True)
 
-        plt.suptitle(f'{GROUP_LABELS[group_name]} ({plot_title_suffix})', fontsize=FONT_SIZE_EXTRA_LARGE, y=0.95, ha='center')
-        plt.subplots_adjust(top=0.85, wspace=0.3)
-        plt.show()
+        plt.suptitle(f'{label} ({plot_title_suffix})', fontsize=FONT_SIZE_EXTRA_LARGE, y=0.95, ha='center')
+        with metrics.stage('render'):
+            plt.subplots_adjust(top=0.85, wspace=0.3)
+            plt.show()
 
-def plot_scatter_and_contour_combined(group_name, filtered_data, plot_title_suffix):
+def plot_scatter_and_contour_combined(label, color, filtered_data, plot_title_suffix):
     if not filtered_data.empty:
         plt.figure(figsize=(COMBINED_FIGURE_WIDTH, COMBINED_FIGURE_HEIGHT))
 
@@ -131,15 +140,17 @@ def plot_scatter_and_contour_combined(group_name, filtered_data, plot_title_suff
         grid_x, grid_y = np.mgrid[FLOW_TEMP_MIN:FLOW_TEMP_MAX:GRID_DENSITY*1j, COP_MIN:COP_MAX:GRID_DENSITY*1j]
         points = filtered_data[['combined_flowT_mean', 'combined_cop']].values
         values = filtered_data['combined_cop'].values
-        grid_z = griddata(points, values, (grid_x, grid_y), method='cubic')
+        with metrics.stage('griddata'):
+            grid_z = griddata(points, values, (grid_x, grid_y), method='cubic')
+            metrics.add_rows('griddata', len(points))
 
         scatter = plt.scatter(
             filtered_data['combined_flowT_mean'],
             filtered_data['combined_cop'],
             alpha=ALPHA,
             edgecolors='k',
-            facecolor=GROUP_COLORS[group_name],
-            label=GROUP_LABELS[group_name],
+            facecolor=color,
+            label=label,
             s=POINT_SIZE,
             marker="o"
         )
@@ -147,37 +158,44 @@ def plot_scatter_and_contour_combined(group_name, filtered_data, plot_title_suff
         contour = plt.contourf(grid_x, grid_y, grid_z, levels=CONTOUR_LEVELS, cmap="RdYlBu", alpha=0.6)
         plt.colorbar(contour)
 
-        plt.title(f'Combined Plot - {GROUP_LABELS[group_name]} ({plot_title_suffix})', fontsize=FONT_SIZE_LARGE)
+        plt.title(f'Combined Plot - {label} ({plot_title_suffix})', fontsize=FONT_SIZE_LARGE)
         plt.xlabel('Flow Temperature (°C)', fontsize=FONT_SIZE_MEDIUM)
         plt.ylabel('COP', fontsize=FONT_SIZE_MEDIUM)
         plt.xlim(FLOW_TEMP_MIN, FLOW_TEMP_MAX)
         plt.ylim(COP_MIN, COP_MAX)
         plt.grid(True)
         plt.legend(loc='upper left')
-        plt.tight_layout()
-        plt.show()
+        with metrics.stage('render'):
+            plt.tight_layout()
+            plt.show()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--grouping', choices=GROUPINGS, default='heat_demand',
+                    help="Heat demand groups from classify.py or operating profile clusters from cluster.py")
+args = parser.parse_args()
 
 data_directory = os.path.join('..', 'system_daily_data')
-group_files = {
-    'less_than_50_group': 'less_than_50_group.csv',
-    'bet_50_100_group': 'bet_50_100_group.csv',
-    'bet_100_200_group': 'bet_100_200_group.csv',
-    'more_than_200_group': 'more_than_200_group.csv'
-}
+groups = group_files(args.grouping, '.')
+if not groups:
+    logging.error(f"No group files found for the {args.grouping} grouping")
+styles = group_styles(groups, GROUP_LABELS, GROUP_COLORS)
 
-for group_name, group_file in group_files.items():
+for group_name, group_file in groups.items():
+    label, color = styles[group_name]
     filtered_data_clean = process_group(group_file, data_directory, file_type='clean')
 
-    logging.info(f'Plotting Annual Data (scatter and contour side by side) for {GROUP_LABELS[group_name]}...')
-    plot_scatter_and_contour_side_by_side(group_name, filtered_data_clean, ANNUAL_PERIOD)
+    logging.info(f'Plotting Annual Data (scatter and contour side by side) for {label}...')
+    plot_scatter_and_contour_side_by_side(label, color, filtered_data_clean, ANNUAL_PERIOD)
 
-    logging.info(f'Plotting Annual Data (scatter and contour combined) for {GROUP_LABELS[group_name]}...')
-    plot_scatter_and_contour_combined(group_name, filtered_data_clean, ANNUAL_PERIOD)
+    logging.info(f'Plotting Annual Data (scatter and contour combined) for {label}...')
+    plot_scatter_and_contour_combined(label, color, filtered_data_clean, ANNUAL_PERIOD)
 
     filtered_data_winter = process_group(group_file, data_directory, file_type='winter')
 
-    logging.info(f'Plotting Winter Data (scatter and contour side by side) for {GROUP_LABELS[group_name]}...')
-    plot_scatter_and_contour_side_by_side(group_name, filtered_data_winter, WINTER_PERIOD)
+    logging.info(f'Plotting Winter Data (scatter and contour side by side) for {label}...')
+    plot_scatter_and_contour_side_by_side(label, color, filtered_data_winter, WINTER_PERIOD)
+
+    logging.info(f'Plotting Winter Data (scatter and contour combined) for {label}...')
+    plot_scatter_and_contour_combined(label, color, filtered_data_winter, WINTER_PERIOD)
 
-    logging.info(f'Plotting Winter Data (scatter and contour combined) for {GROUP_LABELS[group_name]}...')
-    plot_scatter_and_contour_combined(group_name, filtered_data_winter, WINTER_PERIOD)
\ No newline at end of file
+metrics.export(METRICS_OUTPUT_FILE, os.environ.get('PROMETHEUS_TEXTFILE'))
@@ -1,11 +1,18 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.interpolate import griddata
-from sklearn.model_selection import train_test_split
 import logging
 import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import metrics
+import regression
+import store
+from fleet import Fleet, GROUPINGS, group_files, group_styles
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -32,6 +39,7 @@ LEGEND_FONT_SIZE = 12
 LEGEND_TITLE_FONT_SIZE = 14
 ANNUAL_PERIOD = 'Jun 23 to Jun 24'
 WINTER_PERIOD = 'Dec 23 to Feb 24'
+METRICS_OUTPUT_FILE = 'flowtemp_all_metrics.json'
 
 GROUP_COLORS = {
     'less_than_50_group': '#a25430',
@@ -67,19 +75,17 @@ def process_group(group_file, data_directory, file_type='clean'):
     ids = group_df['ID'].unique()
     all_filtered_data = pd.DataFrame()
 
-    for system_id in ids:
-        filename = f"system_{system_id}_daily_data_{file_type}.csv"
-        file_path = os.path.join(data_directory, filename)
-
-        if os.path.exists(file_path):
-            system_data = pd.read_csv(file_path)
-            system_data.columns = system_data.columns.str.strip()
+    fleet = Fleet(data_directory, store_file=store.default_store_file()).ids(ids).source(file_type)
+    for system_id, system_data in fleet.frames():
+        if has_invalid_cop(system_data):
+            continue
 
-            if has_invalid_cop(system_data):
-                continue
+        if is_non_empty(system_data):
+            all_filtered_data = pd.concat([all_filtered_data, system_data], ignore_index=True)
 
-            if is_non_empty(system_data):
-                all_filtered_data = pd.concat([all_filtered_data, system_data], ignore_index=True)
+    # Small groups, such as a one-system cluster, can lose every system to the COP check
+    if all_filtered_data.empty:
+        return all_filtered_data
 
     filtered_data = all_filtered_data[
         (all_filtered_data['combined_cop'] > COP_MIN_CLEANSE) &
@@ -100,50 +106,38 @@ def create_grid_and_contour(x, y, z, x_min, x_max, y_min, y_max):
     grid_x, grid_y = np.mgrid[x_min:x_max:GRID_DENSITY * 1j, y_min:y_max:GRID_DENSITY * 1j]
     points = np.column_stack((x, y))
 
-    try:
-        grid_z = griddata(points, z, (grid_x, grid_y), method='cubic')
-    except Exception as e:
-        logging.warning(f"Cubic interpolation failed: {e}. Back to linear interpolation.")
+    with metrics.stage('griddata'):
+        metrics.add_rows('griddata', len(points))
         try:
-            grid_z = griddata(points, z, (grid_x, grid_y), method='linear')
+            grid_z = griddata(points, z, (grid_x, grid_y), method='cubic')
         except Exception as e:
-            logging.error(f"Linear interpolation failed: {e}. Unable to create contour plot.")
-            return None, None, None
+            logging.warning(f"Cubic interpolation failed: {e}. Back to linear interpolation.")
+            try:
+                grid_z = griddata(points, z, (grid_x, grid_y), method='linear')
+            except Exception as e:
+                logging.error(f"Linear interpolation failed: {e}. Unable to create contour plot.")
+                return None, None, None
 
     return grid_x, grid_y, grid_z
 
 
 def calculate_r_squared_train_test(x, y, test_size=0.2):
     try:
-        x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=test_size, random_state=42)
-
-        coeffs_train = np.polyfit(x_train, y_train, 1)
-        p_train = np.poly1d(coeffs_train)
-
-        y_pred_train = p_train(x_train)
-        y_pred_test = p_train(x_test)
-
-        ss_res_train = np.sum((y_train - y_pred_train) ** 2)
-        ss_tot_train = np.sum((y_train - np.mean(y_train)) ** 2)
-        r_squared_train = 1 - (ss_res_train / ss_tot_train)
-
-        ss_res_test = np.sum((y_test - y_pred_test) ** 2)
-        ss_tot_test = np.sum((y_test - np.mean(y_test)) ** 2)
-        r_squared_test = 1 - (ss_res_test / ss_tot_test)
-
-        return r_squared_train, r_squared_test, p_train
+        # Fitted from per-fold sums, chunk by chunk, with the same split as train_test_split(random_state=42)
+        return regression.train_test_fit(regression.iter_chunks(x, y), len(x), test_size=test_size,
+                                         random_state=42)
     except Exception as e:
         logging.error(f"Error in calculating R-squared: {e}")
         return None, None, None
 
 
-def plot_scatter(x, y, group_name, x_label, y_label):
+def plot_scatter(x, y, label, color, x_label, y_label):
     plt.scatter(
         x, y,
         alpha=ALPHA,
         edgecolors='k',
-        facecolor=GROUP_COLORS[group_name],
-        label=GROUP_LABELS[group_name],
+        facecolor=color,
+        label=label,
         s=POINT_SIZE,
         marker="o"
     )
@@ -170,7 +164,7 @@ def plot_contour(grid_x, grid_y, grid_z, x_label, y_label):
     plt.grid(True)
 
 
-def plot_data(group_name, filtered_data, period, x, y, x_label, y_label, title_prefix, side_by_side=True):
+def plot_data(label, color, filtered_data, period, x, y, x_label, y_label, title_prefix, side_by_side=True):
     if not filtered_data.empty:
         x_min, x_max = x.min(), x.max()
         y_min, y_max = max(y.min(), COP_MIN), y.max()
@@ -178,25 +172,26 @@ def plot_data(group_name, filtered_data, period, x, y, x_label, y_label, title_p
         if side_by_side:
             plt.figure(figsize=(FIGURE_WIDTH, FIGURE_HEIGHT))
             plt.subplot(1, 2, 1)
-            plot_scatter(x, y, group_name, x_label, y_label)
+            plot_scatter(x, y, label, color, x_label, y_label)
 
             plt.subplot(1, 2, 2)
             grid_x, grid_y, grid_z = create_grid_and_contour(x, y, y, x_min, x_max, y_min, y_max)
             plot_contour(grid_x, grid_y, grid_z, x_label, y_label)
 
-            plt.suptitle(f'{title_prefix} - {GROUP_LABELS[group_name]} ({period})', fontsize=FONT_SIZE_EXTRA_LARGE,
+            plt.suptitle(f'{title_prefix} - {label} ({period})', fontsize=FONT_SIZE_EXTRA_LARGE,
                          y=0.97, ha='center')
             plt.subplots_adjust(top=0.85, wspace=0.3)
         else:
             plt.figure(figsize=(COMBINED_FIGURE_WIDTH, COMBINED_FIGURE_HEIGHT))
-            plot_scatter(x, y, group_name, x_label, y_label)
+            plot_scatter(x, y, label, color, x_label, y_label)
             grid_x, grid_y, grid_z = create_grid_and_contour(x, y, y, x_min, x_max, y_min, y_max)
             plot_contour(grid_x, grid_y, grid_z, x_label, y_label)
-            plt.title(f'{title_prefix} - {GROUP_LABELS[group_name]} ({period})',
+            plt.title(f'{title_prefix} - {label} ({period})',
                       fontsize=FONT_SIZE_LARGE)
 
-        plt.tight_layout()
-        plt.show()
+        with metrics.stage('render'):
+            plt.tight_layout()
+            plt.show()
 
 
 plot_configs = [
@@ -251,32 +246,41 @@ plot_configs = [
     }
 ]
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--grouping', choices=GROUPINGS, default='heat_demand',
+                    help="Heat demand groups from classify.py or operating profile clusters from cluster.py")
+args = parser.parse_args()
+
 data_directory = os.path.join('..', 'system_daily_data')
-group_files = {
-    'less_than_50_group': 'less_than_50_group.csv',
-    'bet_50_100_group': 'bet_50_100_group.csv',
-    'bet_100_200_group': 'bet_100_200_group.csv',
-    'more_than_200_group': 'more_than_200_group.csv'
-}
+groups = group_files(args.grouping, '.')
+if not groups:
+    logging.error(f"No group files found for the {args.grouping} grouping")
+styles = group_styles(groups, GROUP_LABELS, GROUP_COLORS)
 
-for group_name, group_file in group_files.items():
+for group_name, group_file in groups.items():
+    label, color = styles[group_name]
     for period, file_type in [(ANNUAL_PERIOD, 'clean'), (WINTER_PERIOD, 'winter')]:
         filtered_data = process_group(group_file, data_directory, file_type)
+        if filtered_data.empty:
+            logging.info(f"No {period} data left for {label} after filtering")
+            continue
 
         for config in plot_configs:
             x_col = config['x_col'](filtered_data) if callable(config['x_col']) else filtered_data[config['x_col']]
             y_col = filtered_data[config['y_col']]
 
             logging.info(
-                f"Plotting {period} Data (scatter and contour side by side) for {GROUP_LABELS[group_name]} "
+                f"Plotting {period} Data (scatter and contour side by side) for {label} "
                 f"({config['title_prefix']})...")
-            plot_data(group_name, filtered_data, period, x_col, y_col, config['x_label'], config['y_label'],
+            plot_data(label, color, filtered_data, period, x_col, y_col, config['x_label'], config['y_label'],
                       config['title_prefix'], side_by_side=True)
 
             logging.info(
-                f"Plotting {period} Data (scatter and contour combined) for {GROUP_LABELS[group_name]} "
+                f"Plotting {period} Data (scatter and contour combined) for {label} "
                 f"({config['title_prefix']})...")
-            plot_data(group_name, filtered_data, period, x_col, y_col, config['x_label'], config['y_label'],
+            plot_data(label, color, filtered_data, period, x_col, y_col, config['x_label'], config['y_label'],
                       config['title_prefix'], side_by_side=False)
 
         time.sleep(60)
+
+metrics.export(METRICS_OUTPUT_FILE, os.environ.get('PROMETHEUS_TEXTFILE'))
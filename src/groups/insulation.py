@@ -1,10 +1,27 @@
 import os
+import sys
+import math
+import argparse
 from typing import Dict, List, Tuple
 
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import metastore
+import significance
+from fleet import GROUPINGS, group_files, group_styles
+
+GROUP_TITLES = {
+    'less_than_50_group': 'Minimal load',
+    'bet_50_100_group': 'Moderate load',
+    'bet_100_200_group': 'High load',
+    'more_than_200_group': 'Excessive load'
+}
+SCOP_PERIOD = 'Jun 23 to Jun 24'
+
 
 def load_csv(filename: str) -> pd.DataFrame:
     try:
@@ -46,19 +63,42 @@ def plot_scatterplot(data: pd.DataFrame, ax: plt.Axes, title: str, palette: Dict
     ax.grid(True, linestyle='--', alpha=0.7)
 
 
-def plot_boxplot(group_data: Dict[str, pd.DataFrame], palette: Dict[str, Tuple[float, float, float]],
-                 insulation_order: List[str]) -> None:
-    fig, axs = plt.subplots(2, 2, figsize=(16, 12))
-    fig.suptitle("SCOP by Insulation Type for Each Load Group", fontsize=16)
+def insulation_p_values(data: pd.DataFrame, insulation_order: List[str]) -> Dict[str, float]:
+    # Each insulation type against the rest of its load group, all pairs from one batch of resamples
+    cohorts = {}
+    for insulation in insulation_order:
+        in_type = data['insulation'] == insulation
+        cohorts[insulation] = data.loc[in_type, 'SCOP']
+        cohorts[f"not {insulation}"] = data.loc[~in_type, 'SCOP']
+    results = significance.compare_cohorts(cohorts, pairs=[(f"not {insulation}", insulation)
+                                                           for insulation in insulation_order])
+    return dict(zip(results['cohort_b'], results['p_value']))
+
 
-    titles = ['Minimal load (Jun 23 to Jun 24)', 'Moderate load (Jun 23 to Jun 24)',
-              'High load (Jun 23 to Jun 24)', 'Excessive load (Jun 23 to Jun 24)']
+def group_axes(group_count: int, width: float, row_height: float) -> Tuple[plt.Figure, List[plt.Axes]]:
+    # Two groups per row; four heat demand groups give the original 2 x 2 grid
+    rows = max(1, math.ceil(group_count / 2))
+    fig, axs = plt.subplots(rows, 2, figsize=(width, row_height * rows), squeeze=False)
+    axs = list(axs.flatten())
+    for ax in axs[group_count:]:
+        ax.set_visible(False)
+    return fig, axs
 
-    for (group_name, data), ax, title in zip(group_data.items(), axs.flatten(), titles):
+
+def plot_boxplot(group_data: Dict[str, pd.DataFrame], titles: Dict[str, str],
+                 palette: Dict[str, Tuple[float, float, float]], insulation_order: List[str]) -> None:
+    fig, axs = group_axes(len(group_data), 16, 6)
+    fig.suptitle("SCOP by Insulation Type for Each Load Group", fontsize=16)
+
+    for (group_name, data), ax in zip(group_data.items(), axs):
         data['insulation'] = pd.Categorical(data['insulation'], categories=insulation_order, ordered=True)
 
         sns.boxplot(x='insulation', y='SCOP', data=data, hue='insulation', palette=palette, ax=ax, order=insulation_order, dodge=False)
-        ax.set_title(title)
+        for position, (insulation, p_value) in enumerate(insulation_p_values(data, insulation_order).items()):
+            if not pd.isna(p_value):
+                ax.text(position, 0.98, f"p = {p_value:.2f}", transform=ax.get_xaxis_transform(), ha='center',
+                        va='top', fontsize=8)
+        ax.set_title(titles[group_name])
         ax.set_xlabel('Insulation')
         ax.set_ylabel('SCOP')
         ax.tick_params(axis='x', rotation=45)
@@ -68,18 +108,17 @@ def plot_boxplot(group_data: Dict[str, pd.DataFrame], palette: Dict[str, Tuple[f
     plt.show()
 
 
-def load_and_process_data(base_dir: str) -> Tuple[Dict[str, pd.DataFrame], pd.DataFrame]:
-    all_data_df = load_csv(os.path.join(base_dir, '..', 'all_data_sorted_by_id.csv'))
+def load_and_process_data(base_dir: str,
+                          grouping: str = 'heat_demand') -> Tuple[Dict[str, pd.DataFrame], pd.DataFrame]:
+    all_data_df = metastore.load_metadata(['insulation'],
+                                          metadata_file=os.path.join(base_dir, '..', 'all_data_sorted_by_id.csv'))
     scop_df = load_csv(os.path.join(base_dir, '..', 'annual_system_scop.csv'))
-    group_files = {
-        'Less than 50': 'less_than_50_group.csv',
-        'Between 50 and 100': 'bet_50_100_group.csv',
-        'Between 100 and 200': 'bet_100_200_group.csv',
-        'More than 200': 'more_than_200_group.csv'
-    }
+    groups = group_files(grouping, base_dir)
+    if not groups:
+        raise FileNotFoundError(f"No group files found for the {grouping} grouping in {base_dir}.")
 
     group_data = {}
-    for group_name, filename in group_files.items():
+    for group_name, filename in groups.items():
         group_df = load_csv(os.path.join(base_dir, filename))
         group_data[group_name] = process_group(group_df, all_data_df, scop_df, group_name)
 
@@ -87,14 +126,12 @@ def load_and_process_data(base_dir: str) -> Tuple[Dict[str, pd.DataFrame], pd.Da
     return group_data, combined_data
 
 
-def create_scatter_plots(group_data: Dict[str, pd.DataFrame], palette_dict: Dict[str, Tuple[float, float, float]],
-                         insulation_order: List[str]) -> None:
-    fig, axs = plt.subplots(2, 2, figsize=(14, 10))
-    titles = ['Minimal load (Jun 23 to Jun 24)', 'Moderate load (Jun 23 to Jun 24)',
-              'High load (Jun 23 to Jun 24)', 'Excessive load (Jun 23 to Jun 24)']
+def create_scatter_plots(group_data: Dict[str, pd.DataFrame], titles: Dict[str, str],
+                         palette_dict: Dict[str, Tuple[float, float, float]], insulation_order: List[str]) -> None:
+    fig, axs = group_axes(len(group_data), 14, 5)
 
-    for (group_name, data), ax, title in zip(group_data.items(), axs.flatten(), titles):
-        plot_scatterplot(data, ax, title, palette_dict, insulation_order)
+    for (group_name, data), ax in zip(group_data.items(), axs):
+        plot_scatterplot(data, ax, titles[group_name], palette_dict, insulation_order)
 
     handles = [plt.Line2D([0], [0], marker='o', color=color, linestyle='', label=insulation)
                for insulation, color in palette_dict.items()]
@@ -105,15 +142,22 @@ def create_scatter_plots(group_data: Dict[str, pd.DataFrame], palette_dict: Dict
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grouping', choices=GROUPINGS, default='heat_demand',
+                        help="Heat demand groups from classify.py or operating profile clusters from cluster.py")
+    args = parser.parse_args()
+
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    group_data, combined_data = load_and_process_data(base_dir)
+    group_data, combined_data = load_and_process_data(base_dir, args.grouping)
+    titles = {group_name: f"{label} ({SCOP_PERIOD})"
+              for group_name, (label, color) in group_styles(group_data, GROUP_TITLES).items()}
 
     unique_insulation_types = combined_data['insulation'].unique()
     insulation_order = sorted(unique_insulation_types)
     palette_dict = create_color_palette(insulation_order)
 
-    create_scatter_plots(group_data, palette_dict, insulation_order)
-    plot_boxplot(group_data, palette_dict, insulation_order)
+    create_scatter_plots(group_data, titles, palette_dict, insulation_order)
+    plot_boxplot(group_data, titles, palette_dict, insulation_order)
 
 
 if __name__ == "__main__":
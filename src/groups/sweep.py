@@ -0,0 +1,193 @@
+import os
+import sys
+import argparse
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import metrics
+import regression
+import store
+from fleet import Fleet, GROUPINGS, group_files
+
+COP_MIN = 0
+COP_LOWER_THRESHOLD = 0
+ANNUAL_PERIOD = 'Jun 23 to Jun 24'
+WINTER_PERIOD = 'Dec 23 to Feb 24'
+PERIODS = {'annual': (ANNUAL_PERIOD, 'clean'), 'winter': (WINTER_PERIOD, 'winter')}
+ALL_GROUPS = 'all_groups'
+OUTPUT_FILE = 'threshold_sweep.csv'
+METRICS_OUTPUT_FILE = 'sweep_metrics.json'
+
+# flowtemp.py only filters on combined COP; flowtemp_all.py also filters on space and water COP and bounds all
+# three flow temperatures, so the flow bounds only apply in the 'all' mode
+FILTER_MODES = ['combined', 'all']
+FLOW_KEYS = ['flow_temp_min', 'flow_temp_max']
+
+# The values hard-coded in each script; a sweep row with exactly these values reproduces that script's data
+SCRIPT_SETTINGS = {
+    'flowtemp.py': {'filter_mode': 'combined', 'cop_max': 8, 'cop_min_cleanse': 0.5},
+    'flowtemp_all.py': {'filter_mode': 'all', 'cop_max': 6, 'cop_min_cleanse': 0.5, 'flow_temp_min': 15,
+                        'flow_temp_max': 55}
+}
+
+DEFAULT_GRID = {
+    'filter_mode': FILTER_MODES,
+    'cop_max': [6, 8],
+    'cop_min_cleanse': [0.5],
+    'flow_temp_min': [0, 15],
+    'flow_temp_max': [50, 55]
+}
+
+COP_COLUMNS = ['combined_cop', 'space_cop', 'water_cop']
+FLOW_COLUMNS = ['combined_flowT_mean', 'space_flowT_mean', 'water_flowT_mean']
+X_COLUMN = 'combined_flowT_mean'
+Y_COLUMN = 'combined_cop'
+
+data_directory = os.path.join('..', 'system_daily_data')
+
+
+def load_group(group_file, file_type):
+    ids = pd.read_csv(group_file)['ID'].unique()
+    fleet = Fleet(data_directory, store_file=store.default_store_file()).ids(ids).source(file_type)
+    return fleet.select(*(COP_COLUMNS + FLOW_COLUMNS)).frame()
+
+
+def threshold_masks(data, grid, filter_mode):
+    # One row mask per threshold value; each combination is then just the AND of one mask per threshold
+    cops = data[COP_COLUMNS if filter_mode == 'all' else COP_COLUMNS[:1]].to_numpy(dtype=float)
+    combined_cop = cops[:, 0]
+
+    # Like has_invalid_cop in both scripts, one out-of-range day drops the whole system
+    system_max_cop = pd.Series(np.where(np.isnan(cops), -np.inf, cops).max(axis=1)) \
+        .groupby(data['system_id'].to_numpy()).transform('max').to_numpy()
+    system_has_zero = pd.Series(combined_cop <= COP_LOWER_THRESHOLD) \
+        .groupby(data['system_id'].to_numpy()).transform('any').to_numpy()
+
+    with np.errstate(invalid='ignore'):
+        base = ~system_has_zero
+        masks = {
+            'cop_max': np.array([system_max_cop <= value for value in grid['cop_max']]),
+            'cop_min_cleanse': np.array([combined_cop > value for value in grid['cop_min_cleanse']])
+        }
+        if filter_mode == 'all':
+            flows = data[FLOW_COLUMNS].to_numpy(dtype=float)
+            base &= (cops[:, 1] > COP_MIN) & (cops[:, 2] > COP_MIN)
+            masks['flow_temp_min'] = np.array([(flows >= value).all(axis=1) for value in grid['flow_temp_min']])
+            masks['flow_temp_max'] = np.array([(flows <= value).all(axis=1) for value in grid['flow_temp_max']])
+        return base, masks
+
+
+def grid_settings(grid):
+    # Combined-only settings leave the flow bounds blank rather than repeating the same rows for each of them
+    for filter_mode in grid['filter_mode']:
+        keys = [key for key in grid if key != 'filter_mode' and (filter_mode == 'all' or key not in FLOW_KEYS)]
+        for values in itertools.product(*(range(len(grid[key])) for key in keys)):
+            yield filter_mode, dict(zip(keys, values))
+
+
+def reproduces(setting):
+    for script, script_setting in SCRIPT_SETTINGS.items():
+        if set(setting) == set(script_setting) and all(setting[key] == value for key, value in script_setting.items()):
+            return script
+    return ''
+
+
+def masked_medians(values, masks):
+    # Medians of every masked subset from one sort: the running count of selected values finds the middle ones
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    counts = np.cumsum(masks[:, order], axis=1)
+    totals = counts[:, -1]
+    lower = np.array([np.searchsorted(row, (total + 1) // 2) for row, total in zip(counts, totals)])
+    upper = np.array([np.searchsorted(row, total // 2 + 1) for row, total in zip(counts, totals)])
+    last = len(values) - 1
+    medians = (sorted_values[np.minimum(lower, last)] + sorted_values[np.minimum(upper, last)]) / 2
+    return np.where(totals > 0, medians, np.nan)
+
+
+def sweep(data, grid):
+    combinations = list(grid_settings(grid))
+    settings = [dict({key: grid[key][index] for key, index in indices.items()}, filter_mode=filter_mode)
+                for filter_mode, indices in combinations]
+    settings = [dict(setting, reproduces=reproduces(setting)) for setting in settings]
+    if data.empty:
+        return pd.DataFrame(settings).assign(rows=0, systems=0)
+
+    mode_masks = {filter_mode: threshold_masks(data, grid, filter_mode) for filter_mode in grid['filter_mode']}
+    with metrics.stage('sweep'):
+        combination_masks = np.array([
+            mode_masks[filter_mode][0] &
+            np.logical_and.reduce([mode_masks[filter_mode][1][key][index] for key, index in indices.items()])
+            for filter_mode, indices in combinations
+        ])
+        metrics.add_rows('sweep', combination_masks.size)
+
+        x = data[X_COLUMN].to_numpy(dtype=float)
+        y = data[Y_COLUMN].to_numpy(dtype=float)
+        system_ids = data['system_id'].to_numpy()
+        medians = masked_medians(y, combination_masks)
+        accumulators = regression.masked_accumulators(x, y, combination_masks)
+
+    results = []
+    for setting, mask, median, accumulator in zip(settings, combination_masks, medians, accumulators):
+        result = dict(setting)
+        result['rows'] = int(mask.sum())
+        result['systems'] = len(np.unique(system_ids[mask]))
+        result['median_cop'] = median
+        result['r_squared'] = accumulator.r_squared() if accumulator.n > 1 else np.nan
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+def main(grid=DEFAULT_GRID, periods=tuple(PERIODS), output_file=OUTPUT_FILE, grouping='heat_demand'):
+    groups = group_files(grouping, '.')
+    if not groups:
+        logging.error(f"No group files found for the {grouping} grouping")
+        return None
+
+    tables = []
+    for period_key in periods:
+        period, file_type = PERIODS[period_key]
+        group_data = {group_name: load_group(group_file, file_type) for group_name, group_file in groups.items()}
+        group_data[ALL_GROUPS] = pd.concat(list(group_data.values()), ignore_index=True)
+
+        for group_name, data in group_data.items():
+            logging.info(f"Sweeping {len(data)} rows for {group_name} ({period})")
+            tables.append(sweep(data, grid).assign(group=group_name, period=period))
+
+    table = pd.concat(tables, ignore_index=True)
+    table = table.reindex(columns=['period', 'group'] + list(grid) +
+                          ['reproduces', 'rows', 'systems', 'median_cop', 'r_squared'])
+    table.to_csv(output_file, index=False)
+    logging.info(f"Threshold sweep of {len(table)} combinations saved to {output_file}")
+    return table
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filter-mode', choices=FILTER_MODES, nargs='+', default=DEFAULT_GRID['filter_mode'],
+                        help="Filter on combined COP only, like flowtemp.py, or on every column, like flowtemp_all.py")
+    parser.add_argument('--cop-max', type=float, nargs='+', default=DEFAULT_GRID['cop_max'])
+    parser.add_argument('--cop-min-cleanse', type=float, nargs='+', default=DEFAULT_GRID['cop_min_cleanse'])
+    parser.add_argument('--flow-temp-min', type=float, nargs='+', default=DEFAULT_GRID['flow_temp_min'])
+    parser.add_argument('--flow-temp-max', type=float, nargs='+', default=DEFAULT_GRID['flow_temp_max'])
+    parser.add_argument('--period', choices=list(PERIODS), nargs='+', default=list(PERIODS))
+    parser.add_argument('--output', default=OUTPUT_FILE, help="CSV file for the sweep table")
+    parser.add_argument('--grouping', choices=GROUPINGS, default='heat_demand',
+                        help="Heat demand groups from classify.py or operating profile clusters from cluster.py")
+    args = parser.parse_args()
+
+    result = main({
+        'filter_mode': args.filter_mode,
+        'cop_max': args.cop_max,
+        'cop_min_cleanse': args.cop_min_cleanse,
+        'flow_temp_min': args.flow_temp_min,
+        'flow_temp_max': args.flow_temp_max
+    }, args.period, args.output, args.grouping)
+    print(result.to_string(index=False))
+    metrics.export(METRICS_OUTPUT_FILE, os.environ.get('PROMETHEUS_TEXTFILE'))
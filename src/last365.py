@@ -0,0 +1,110 @@
+import json
+import logging
+import argparse
+import datetime
+
+import pandas as pd
+
+import store
+from fleet import Fleet, TIMESTAMP_FORMAT
+
+WINDOW_DAYS = 365
+
+PREFIXES = ['combined', 'running', 'space', 'water']
+MEAN_FIELDS = ['elec_mean', 'heat_mean', 'flowT_mean', 'returnT_mean', 'outsideT_mean', 'roomT_mean', 'prc_carnot']
+QUALITY_FIELDS = ['quality_elec', 'quality_heat', 'quality_flowT', 'quality_returnT', 'quality_outsideT',
+                  'quality_roomT']
+
+SUM_FIELDS = [f"{prefix}_{field}" for prefix in PREFIXES for field in ['elec_kwh', 'heat_kwh', 'data_length']] + \
+             ['combined_cooling_kwh', 'from_energy_feeds_elec_kwh', 'from_energy_feeds_heat_kwh']
+# Daily means are weighted by the seconds of data behind them, as the API does for last365
+WEIGHTED_FIELDS = {f"{prefix}_{field}": f"{prefix}_data_length" for prefix in PREFIXES for field in MEAN_FIELDS}
+COP_FIELDS = {f"{prefix}_cop": prefix for prefix in PREFIXES + ['from_energy_feeds']}
+
+STATS_FIELDS = SUM_FIELDS + list(WEIGHTED_FIELDS) + list(COP_FIELDS) + QUALITY_FIELDS
+
+
+def load_daily_frame(fleet, end_date=None, days=WINDOW_DAYS):
+    columns = sorted(set(SUM_FIELDS) | set(WEIGHTED_FIELDS) | set(QUALITY_FIELDS))
+    fleet = fleet.source('converted').select('timestamp', *columns)
+    if end_date is not None:
+        fleet = fleet.between(end_date - datetime.timedelta(days=days), end_date)
+    data = fleet.frame()
+    if data.empty:
+        return data, end_date
+
+    timestamps = pd.to_datetime(data['timestamp'].astype(str).str.strip(), format=TIMESTAMP_FORMAT, errors='coerce')
+    if end_date is None:
+        # Without an explicit end the window trails the newest day in the data rather than today,
+        # so reports built from an older download still cover a full year
+        end_date = (timestamps.max().normalize() + pd.Timedelta(days=1)).to_pydatetime()
+    start_date = end_date - datetime.timedelta(days=days)
+    data = data[(timestamps >= start_date) & (timestamps < end_date)]
+    return data, end_date
+
+
+def compute_stats(data):
+    values = data.reindex(columns=STATS_FIELDS).apply(pd.to_numeric, errors='coerce')
+    system_ids = data['system_id']
+
+    parts = {field: values[field] for field in SUM_FIELDS}
+    for field, weight_field in WEIGHTED_FIELDS.items():
+        weight = values[weight_field].where(values[field].notna() & (values[weight_field] > 0))
+        parts[f"{field}_wsum"] = values[field] * weight
+        parts[f"{field}_weight"] = weight
+    for field in QUALITY_FIELDS:
+        parts[field] = values[field]
+        parts[f"{field}_count"] = values[field].notna()
+
+    # One grouped sum covers every system at once
+    totals = pd.DataFrame(parts).groupby(system_ids).sum(min_count=1)
+
+    stats = totals[SUM_FIELDS].copy()
+    for field in WEIGHTED_FIELDS:
+        weight = totals[f"{field}_weight"]
+        stats[field] = (totals[f"{field}_wsum"] / weight).where(weight > 0)
+    for field, prefix in COP_FIELDS.items():
+        elec = totals[f"{prefix}_elec_kwh"]
+        stats[field] = (totals[f"{prefix}_heat_kwh"] / elec).where(elec > 0)
+    for field in QUALITY_FIELDS:
+        count = totals[f"{field}_count"]
+        stats[field] = (totals[field] / count).where(count > 0)
+    return stats[STATS_FIELDS]
+
+
+def to_api_format(stats):
+    # Same shape as /system/stats/last365: {"<id>": {field: value}}, with None for missing values
+    stats = stats.astype(object).where(stats.notna(), None)
+    return {str(int(system_id)): row for system_id, row in stats.to_dict('index').items()}
+
+
+def local_last365(fleet=None, end_date=None, days=WINDOW_DAYS):
+    if fleet is None:
+        fleet = Fleet(store_file=store.default_store_file())
+    data, end_date = load_daily_frame(fleet, end_date, days)
+    if data.empty:
+        logging.warning("No daily data found to compute last365 stats")
+        return {}
+
+    stats = to_api_format(compute_stats(data))
+    logging.info(f"Computed {days}-day stats up to {end_date:%Y-%m-%d} for {len(stats)} systems from local daily data")
+    return stats
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=WINDOW_DAYS, help="Length of the trailing window in days")
+    parser.add_argument('--end', type=lambda value: datetime.datetime.strptime(value, '%Y-%m-%d'), default=None,
+                        help="Exclusive end of the window (YYYY-MM-DD); defaults to the day after the newest data")
+    parser.add_argument('--output', default='last365_local.json', help="JSON file in the last365 API format")
+    args = parser.parse_args()
+
+    stats = local_last365(end_date=args.end, days=args.days)
+    with open(args.output, mode='w', encoding='utf-8') as file:
+        json.dump(stats, file, indent=2)
+    logging.info(f"Stats written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import logging
+
+import pandas as pd
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+METADATA_FILE = os.path.join(SRC_DIRECTORY, 'all_data_sorted_by_id.csv')
+CACHE_DIRECTORY = os.path.join(SRC_DIRECTORY, '.metastore')
+METADATA_ENCODING = 'latin1'
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+HASH_CHUNK_SIZE = 1 << 20
+# A snapshot cut short by a crash, or pickled by an incompatible pandas, is rebuilt rather than fatal
+UNREADABLE_SNAPSHOT_ERRORS = (pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError)
+SNAPSHOT_KEYS = {'stamp', 'sha256', 'frame'}
+
+_loaded = {}
+
+
+def cache_file_path(metadata_file, cache_directory=CACHE_DIRECTORY):
+    name = os.path.splitext(os.path.basename(metadata_file))[0]
+    return os.path.join(cache_directory, f"{name}.pkl")
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_stamp(metadata_file):
+    stat = os.stat(metadata_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def build_snapshot(metadata_file=METADATA_FILE):
+    frame = pd.read_csv(metadata_file, encoding=METADATA_ENCODING)
+    for column in frame.columns:
+        is_text = pd.api.types.is_object_dtype(frame[column]) or pd.api.types.is_string_dtype(frame[column])
+        if is_text and frame[column].nunique() <= CATEGORY_MAX_RATIO * len(frame):
+            frame[column] = frame[column].astype('category')
+    return frame.set_index('ID', verify_integrity=True)
+
+
+def _write_snapshot(file_path, snapshot):
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    # A unique temporary name keeps concurrent processes from writing into each other's snapshot
+    handle, temporary_file = tempfile.mkstemp(dir=directory, prefix=os.path.basename(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, mode='wb') as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_file, file_path)
+    except BaseException:
+        os.remove(temporary_file)
+        raise
+
+
+def _read_snapshot(file_path):
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, mode='rb') as file:
+            snapshot = pickle.load(file)
+    except UNREADABLE_SNAPSHOT_ERRORS as e:
+        logging.warning(f"Ignoring unreadable metadata snapshot {file_path}: {e!r}")
+        return None
+    if not isinstance(snapshot, dict) or not SNAPSHOT_KEYS <= snapshot.keys():
+        logging.warning(f"Ignoring metadata snapshot {file_path} written in an unknown format")
+        return None
+    return snapshot
+
+
+def load_indexed(metadata_file=METADATA_FILE, cache_directory=CACHE_DIRECTORY):
+    stamp = source_stamp(metadata_file)
+    key = os.path.abspath(metadata_file)
+    if key in _loaded and _loaded[key]['stamp'] == stamp:
+        return _loaded[key]['frame']
+
+    file_path = cache_file_path(metadata_file, cache_directory)
+    snapshot = _read_snapshot(file_path)
+
+    if snapshot is None or snapshot['stamp'] != stamp:
+        # A touched but unchanged CSV only costs a hash, not a re-parse
+        sha256 = file_sha256(metadata_file)
+        if snapshot is not None and snapshot['sha256'] == sha256:
+            snapshot['stamp'] = stamp
+        else:
+            logging.info(f"Rebuilding metadata snapshot from {metadata_file}")
+            snapshot = {'stamp': stamp, 'sha256': sha256, 'frame': build_snapshot(metadata_file)}
+        _write_snapshot(file_path, snapshot)
+
+    _loaded[key] = snapshot
+    return snapshot['frame']
+
+
+def _decode_categories(frame):
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(frame[column].cat.categories.dtype)
+    return frame
+
+
+def load_metadata(columns=None, categories=True, metadata_file=METADATA_FILE):
+    # Same frame as pd.read_csv on the metadata CSV, with ID as a regular column
+    frame = load_indexed(metadata_file)
+    if columns is not None:
+        frame = frame[list(columns)]
+    frame = frame.reset_index()
+    return frame if categories else _decode_categories(frame)
+
+
+def lookup(system_ids, columns=None, metadata_file=METADATA_FILE):
+    frame = load_indexed(metadata_file)
+    if columns is not None:
+        frame = frame[list(columns)]
+    return frame.reindex(system_ids)
+
+
+def join_metadata(data, columns, on='ID', how='left', categories=True, metadata_file=METADATA_FILE):
+    # Joins against the ID index keep the order of data and avoid the sort a pd.merge would do
+    metadata = load_indexed(metadata_file)[list(columns)]
+    if not categories:
+        metadata = _decode_categories(metadata.copy())
+    return data.join(metadata, on=on, how=how)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import datetime
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+METRIC_PREFIX = "effi"
+
+_lock = threading.Lock()
+_stages = {}
+_latencies = {}
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _latencies.clear()
+
+
+def _stage_entry(name):
+    if name not in _stages:
+        _stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0, 'bytes': 0}
+    return _stages[name]
+
+
+@contextmanager
+def stage(name):
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        with _lock:
+            entry = _stage_entry(name)
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+
+
+def add_rows(name, count):
+    with _lock:
+        _stage_entry(name)['rows'] += count
+
+
+def add_bytes(name, count):
+    with _lock:
+        _stage_entry(name)['bytes'] += count
+
+
+def observe_latency(name, system_id, seconds):
+    with _lock:
+        histogram = _latencies.setdefault(name, {
+            'buckets': [0] * len(LATENCY_BUCKETS),
+            'count': 0,
+            'sum': 0.0,
+            'systems': {}
+        })
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['count'] += 1
+        histogram['sum'] += seconds
+        histogram['systems'][str(system_id)] = seconds
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def snapshot():
+    with _lock:
+        return {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': {name: dict(entry) for name, entry in _stages.items()},
+            'latency': {
+                name: {
+                    'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS], histogram['buckets'])),
+                    'count': histogram['count'],
+                    'sum': histogram['sum'],
+                    'systems': dict(histogram['systems'])
+                }
+                for name, histogram in _latencies.items()
+            }
+        }
+
+
+def write_json(file_path):
+    with open(file_path, mode='w', encoding='utf-8') as file:
+        json.dump(snapshot(), file, indent=2)
+    return f"Metrics have been written to {file_path}"
+
+
+def format_prometheus(data):
+    lines = []
+    for field, help_text in [('wall_seconds', 'Wall clock time spent in stage'),
+                             ('cpu_seconds', 'CPU time spent in stage'),
+                             ('rows', 'Rows processed by stage'),
+                             ('bytes', 'Bytes processed by stage'),
+                             ('calls', 'Number of times stage ran')]:
+        metric = f"{METRIC_PREFIX}_stage_{field}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for name, entry in sorted(data['stages'].items()):
+            lines.append(f'{metric}{{stage="{name}"}} {entry[field]}')
+
+    metric = f"{METRIC_PREFIX}_latency_seconds"
+    lines.append(f"# HELP {metric} Request latency")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, histogram in sorted(data['latency'].items()):
+        for bound, count in histogram['buckets'].items():
+            lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {count}')
+        lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'{metric}_sum{{stage="{name}"}} {histogram["sum"]}')
+        lines.append(f'{metric}_count{{stage="{name}"}} {histogram["count"]}')
+
+    if data['peak_rss_bytes'] is not None:
+        metric = f"{METRIC_PREFIX}_peak_rss_bytes"
+        lines.append(f"# HELP {metric} Peak resident set size of the run")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {data['peak_rss_bytes']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(file_path):
+    # write to a temporary file first so the node exporter never reads a partial file
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, mode='w', encoding='utf-8') as file:
+        file.write(format_prometheus(snapshot()))
+    os.replace(tmp_path, file_path)
+    return f"Prometheus metrics have been written to {file_path}"
+
+
+def export(json_file=None, prometheus_file=None):
+    results = []
+    if json_file:
+        results.append(write_json(json_file))
+    if prometheus_file:
+        results.append(write_prometheus(prometheus_file))
+    for message in results:
+        logging.info(message)
+    return results
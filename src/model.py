@@ -0,0 +1,147 @@
+import os
+import logging
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import KFold, cross_validate
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+import features
+import metastore
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(SRC_DIRECTORY, 'scop_model.joblib')
+PREDICTIONS_FILE = os.path.join(SRC_DIRECTORY, 'scop_predictions.csv')
+# Fitted encoders are cached here, so repeated training and CV folds over the same rows skip re-encoding
+CACHE_DIRECTORY = os.path.join(SRC_DIRECTORY, '.model_cache')
+TARGET_COLUMN = features.ANNUAL_SCOP_COLUMN
+
+# Installation details known before any monitoring; measured results (COP, FlowT, OutsideT, Days) and
+# free text such as notes and URLs are left out
+NUMERIC_COLUMNS = [
+    'Output', 'heatgeek', 'ultimaterenewables', 'heatingacademy', 'cylinder_volume', 'dhw_coil_hex_area',
+    'new_radiators', 'old_radiators', 'fan_coil_radiators', 'UFH', 'flow_temp', 'design_temp', 'flow_temp_typical',
+    'wc_curve', 'zone_number', 'dhw_target_temperature', 'legionella_target_temperature', 'floor_area',
+    'heat_demand', 'water_heat_demand', 'EPC_spaceheat_demand', 'EPC_waterheat_demand', 'heat_loss', 'kwh_m2',
+    'electricity_tariff_unit_rate_all', 'solar_pv_generation', 'solar_pv_divert', 'battery_storage_capacity',
+    'mid_metering', 'metering_inc_boost', 'metering_inc_central_heating_pumps', 'metering_inc_brine_pumps',
+    'metering_inc_controls', 'indoor_temperature'
+]
+CATEGORICAL_COLUMNS = [
+    'Model', 'hp_type', 'refrigerant', 'dhw_method', 'hydraulic_separation', 'freeze', 'space_heat_control_type',
+    'dhw_control_type', 'legionella_frequency', 'property', 'age', 'insulation', 'electricity_tariff_type',
+    'electric_meter', 'heat_meter'
+]
+MISSING_CATEGORY = 'missing'
+# Categories seen fewer times than this are pooled, so a rare heat pump model does not get its own column
+MIN_CATEGORY_COUNT = 3
+
+CV_FOLDS = 5
+N_ESTIMATORS = 300
+MIN_SAMPLES_LEAF = 3
+RANDOM_STATE = 42
+
+
+def model_inputs(metadata):
+    inputs = metadata[NUMERIC_COLUMNS + CATEGORICAL_COLUMNS].copy()
+    # Output is recorded as text such as "11.2 kW"
+    inputs['Output'] = pd.to_numeric(inputs['Output'].astype(str).str.extract(r'([\d.]+)')[0], errors='coerce')
+    for column in NUMERIC_COLUMNS:
+        inputs[column] = pd.to_numeric(inputs[column], errors='coerce')
+    for column in CATEGORICAL_COLUMNS:
+        inputs[column] = inputs[column].astype(object).where(inputs[column].notna(), MISSING_CATEGORY).astype(str)
+    return inputs
+
+
+def load_training_data(features_file=features.FEATURES_FILE):
+    # The target is the full-year combined SCOP from the feature table
+    scop = features.annual_scop(features_file)
+    metadata = metastore.lookup(scop['ID'], NUMERIC_COLUMNS + CATEGORICAL_COLUMNS)
+    known = metadata.notna().any(axis=1).to_numpy()
+    return model_inputs(metadata[known]), scop[TARGET_COLUMN].to_numpy()[known], scop['ID'].to_numpy()[known]
+
+
+def build_pipeline(cache_directory=CACHE_DIRECTORY):
+    encoder = ColumnTransformer([
+        ('numeric', SimpleImputer(strategy='median'), NUMERIC_COLUMNS),
+        ('categorical', OneHotEncoder(handle_unknown='infrequent_if_exist', min_frequency=MIN_CATEGORY_COUNT,
+                                      sparse_output=False), CATEGORICAL_COLUMNS)
+    ])
+    regressor = RandomForestRegressor(n_estimators=N_ESTIMATORS, min_samples_leaf=MIN_SAMPLES_LEAF,
+                                      random_state=RANDOM_STATE)
+    memory = joblib.Memory(cache_directory, verbose=0) if cache_directory else None
+    return Pipeline([('encode', encoder), ('regress', regressor)], memory=memory)
+
+
+def train(features_file=features.FEATURES_FILE, model_file=MODEL_FILE, folds=CV_FOLDS, jobs=-1):
+    inputs, target, system_ids = load_training_data(features_file)
+    logging.info(f"Training on {len(target)} systems with {len(NUMERIC_COLUMNS)} numeric and "
+                 f"{len(CATEGORICAL_COLUMNS)} categorical metadata columns")
+
+    # Folds run on separate cores; each fits its own copy of the pipeline
+    cv = KFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE)
+    scores = cross_validate(build_pipeline(), inputs, target, cv=cv, n_jobs=jobs,
+                            scoring=('r2', 'neg_mean_absolute_error'))
+    cv_r2 = scores['test_r2']
+    cv_mae = -scores['test_neg_mean_absolute_error']
+    logging.info(f"{folds}-fold CV: R² {cv_r2.mean():.3f} ± {cv_r2.std():.3f}, "
+                 f"MAE {cv_mae.mean():.3f} ± {cv_mae.std():.3f}")
+
+    pipeline = build_pipeline()
+    pipeline.set_params(regress__n_jobs=jobs)
+    pipeline.fit(inputs, target)
+    # The cache only helps while training, so the saved model does not depend on it
+    pipeline.memory = None
+    joblib.dump({'pipeline': pipeline, 'target': TARGET_COLUMN, 'systems': system_ids.tolist(),
+                 'cv_r2': cv_r2.tolist(), 'cv_mae': cv_mae.tolist()}, model_file)
+    logging.info(f"Model saved to {model_file}")
+    return pipeline, scores
+
+
+def load_model(model_file=MODEL_FILE):
+    return joblib.load(model_file)
+
+
+def predict(system_ids=None, model_file=MODEL_FILE):
+    # One batched predict over every requested system, straight from the cached metadata snapshot
+    model = load_model(model_file)
+    metadata = metastore.load_indexed()
+    if system_ids is not None:
+        metadata = metadata.reindex(system_ids)
+    metadata = metadata[metadata[NUMERIC_COLUMNS + CATEGORICAL_COLUMNS].notna().any(axis=1)]
+    predictions = model['pipeline'].predict(model_inputs(metadata))
+    return pd.DataFrame({'ID': metadata.index, f"Predicted {model['target']}": np.round(predictions, 3)})
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="Cross-validate, fit and save the SCOP model")
+    train_parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    train_parser.add_argument('--jobs', type=int, default=-1, help="Cores for CV folds and the final fit")
+    train_parser.add_argument('--model', default=MODEL_FILE)
+
+    predict_parser = subparsers.add_parser('predict', help="Score systems with a saved model")
+    predict_parser.add_argument('ids', type=int, nargs='*', help="System IDs; all systems when omitted")
+    predict_parser.add_argument('--model', default=MODEL_FILE)
+    predict_parser.add_argument('--output', default=PREDICTIONS_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train(model_file=args.model, folds=args.folds, jobs=args.jobs)
+    else:
+        predictions = predict(args.ids or None, args.model)
+        predictions.to_csv(args.output, index=False)
+        logging.info(f"Predictions for {len(predictions)} systems written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
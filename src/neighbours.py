@@ -0,0 +1,167 @@
+import os
+import pickle
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import metastore
+import model
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+INDEX_FILE = os.path.join(SRC_DIRECTORY, '.neighbours.pkl')
+SCOP_FILE = os.path.join(SRC_DIRECTORY, 'annual_system_scop.csv')
+SCOP_COLUMN = 'SCOP (Jun 23 to Jun 24)'
+DEFAULT_K = 10
+
+# Size, demand, design flow temperature, heat pump size and climate (design and last365 outside temperatures)
+FEATURE_COLUMNS = ['floor_area', 'heat_demand_per_floor_area', 'flow_temp', 'output_kw', 'design_temp',
+                   'combined_outsideT_mean']
+# Added systems are searched by brute force until there are this many, then the tree is rebuilt
+REBUILD_PENDING = 32
+
+
+def system_features(system_ids=None):
+    metadata = metastore.load_indexed()
+    if system_ids is not None:
+        metadata = metadata.reindex(system_ids)
+    # The installation details are parsed exactly as the SCOP model sees them, e.g. Output from "11.2 kW"
+    inputs = model.model_inputs(metadata)
+    features = pd.DataFrame({
+        'floor_area': inputs['floor_area'],
+        'flow_temp': inputs['flow_temp'],
+        'output_kw': inputs['Output'],
+        'design_temp': inputs['design_temp'],
+        'combined_outsideT_mean': pd.to_numeric(metadata['combined_outsideT_mean'], errors='coerce'),
+        'heat_demand_per_floor_area': (inputs['heat_demand'] / inputs['floor_area']).where(inputs['floor_area'] > 0)
+    }, index=metadata.index)
+    return features[FEATURE_COLUMNS]
+
+
+class NeighbourIndex:
+    # KD-tree over z-scored features. Missing values take the fleet median, so they add no distance.
+    def __init__(self, features):
+        values = features.to_numpy(dtype=float)
+        self.center = np.nanmedian(values, axis=0)
+        scale = np.nanstd(values, axis=0)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        self.ids = features.index.to_numpy()
+        self.points = self.normalize(values)
+        self.tree = cKDTree(self.points)
+        self.pending_ids = np.array([], dtype=self.ids.dtype)
+        self.pending_points = np.empty((0, len(FEATURE_COLUMNS)))
+        self.features = features.copy()
+
+    def to_state(self):
+        return {'features': self.features, 'center': self.center, 'scale': self.scale, 'ids': self.ids,
+                'points': self.points, 'tree': self.tree, 'pending_ids': self.pending_ids,
+                'pending_points': self.pending_points}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        return index
+
+    def normalize(self, values):
+        values = np.asarray(values, dtype=float)
+        return (np.where(np.isnan(values), self.center, values) - self.center) / self.scale
+
+    def __len__(self):
+        return len(self.ids) + len(self.pending_ids)
+
+    def add(self, features):
+        # New systems keep the existing scaling; once enough have queued the whole tree is rebuilt
+        self.features = pd.concat([self.features.drop(features.index, errors='ignore'), features])
+        if len(self.pending_ids) + len(features) >= REBUILD_PENDING:
+            self.__init__(self.features)
+            return
+        self.pending_ids = np.concatenate([self.pending_ids, features.index.to_numpy()])
+        self.pending_points = np.vstack([self.pending_points, self.normalize(features.to_numpy(dtype=float))])
+
+    def query(self, system_ids, k=DEFAULT_K):
+        # Returns a frame of (ID, neighbour, distance), k rows per system and never the system itself
+        unknown = [system_id for system_id in system_ids if system_id not in self.features.index]
+        if unknown:
+            raise ValueError(f"Systems {unknown} are not in the neighbour index")
+        points = self.normalize(self.features.loc[system_ids].to_numpy(dtype=float))
+        distances, indices = self.tree.query(points, k=min(k + 1, len(self.ids)))
+        distances, indices = distances.reshape(len(points), -1), indices.reshape(len(points), -1)
+
+        rows = []
+        for system_id, point, row_distances, row_indices in zip(system_ids, points, distances, indices):
+            candidate_ids = list(self.ids[row_indices]) + list(self.pending_ids)
+            candidate_distances = list(row_distances) + list(np.linalg.norm(self.pending_points - point, axis=1))
+            candidates = sorted(
+                (distance, neighbour) for neighbour, distance in zip(candidate_ids, candidate_distances)
+                if neighbour != system_id)
+            rows.extend({'ID': system_id, 'neighbour': neighbour, 'distance': distance}
+                        for distance, neighbour in candidates[:k])
+        return pd.DataFrame(rows, columns=['ID', 'neighbour', 'distance'])
+
+
+def load_index(index_file=INDEX_FILE):
+    # Reuses the saved tree while its systems' features are unchanged; new systems are only added
+    features = system_features()
+    index = None
+    if os.path.exists(index_file):
+        with open(index_file, mode='rb') as file:
+            index = NeighbourIndex.from_state(pickle.load(file))
+
+    if index is not None:
+        known = features.index.intersection(index.features.index)
+        unchanged = len(known) == len(index.features) and np.allclose(
+            index.features.loc[known].to_numpy(dtype=float), features.loc[known].to_numpy(dtype=float),
+            equal_nan=True)
+        if not unchanged:
+            index = None
+        elif len(known) < len(features):
+            added = features.index.difference(known)
+            logging.info(f"Adding {len(added)} systems to the neighbour index")
+            index.add(features.loc[added])
+            _save_index(index, index_file)
+
+    if index is None:
+        logging.info(f"Building the neighbour index over {len(features)} systems")
+        index = NeighbourIndex(features)
+        _save_index(index, index_file)
+    return index
+
+
+def _save_index(index, index_file):
+    temporary_file = f"{index_file}.tmp"
+    with open(temporary_file, mode='wb') as file:
+        pickle.dump(index.to_state(), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_file, index_file)
+
+
+def neighbour_scop(system_ids, k=DEFAULT_K, index=None, scop_file=SCOP_FILE):
+    index = index or load_index()
+    scop = pd.read_csv(scop_file).set_index('ID')[SCOP_COLUMN]
+    scop = pd.to_numeric(scop, errors='coerce')
+
+    neighbours = index.query(system_ids, k)
+    neighbours['SCOP'] = neighbours['neighbour'].map(scop)
+    summary = neighbours.groupby('ID')['SCOP'].describe()[['count', '25%', '50%', '75%']]
+    summary.columns = ['peers_with_scop', 'peer_scop_q1', 'peer_scop_median', 'peer_scop_q3']
+    summary.insert(0, 'SCOP', summary.index.map(scop))
+    return neighbours, summary.reindex(system_ids)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ids', type=int, nargs='+', help="System IDs to find peers for")
+    parser.add_argument('-k', type=int, default=DEFAULT_K, help="Number of neighbours")
+    args = parser.parse_args()
+
+    neighbours, summary = neighbour_scop(args.ids, args.k)
+    print(neighbours.to_string(index=False))
+    print()
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
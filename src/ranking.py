@@ -0,0 +1,139 @@
+import os
+import pickle
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RANKING_FILE = os.path.join(SRC_DIRECTORY, '.ranking.pkl')
+
+SCOP_FILES = {
+    'combined': os.path.join(SRC_DIRECTORY, 'system_scop_clean.csv'),
+    'space': os.path.join(SRC_DIRECTORY, 'system_sh_scop_clean.csv'),
+    'water': os.path.join(SRC_DIRECTORY, 'system_wh_scop_clean.csv')
+}
+PERIODS = {
+    'summer': 'SCOP (Jun 23 to Aug 23)',
+    'autumn': 'SCOP (Sep 23 to Nov 23)',
+    'winter': 'SCOP (Dec 23 to Feb 24)',
+    'spring': 'SCOP (Mar 24 to May 24)',
+    'year': 'SCOP (Jun 23 to Jun 24)'
+}
+# Above this share of changed systems a metric is re-sorted instead of patched in place
+RESORT_RATIO = 0.25
+
+
+def read_scops(file_path):
+    scops = pd.read_csv(file_path).set_index('ID')
+    return {period: pd.to_numeric(scops[column], errors='coerce').dropna() for period, column in PERIODS.items()}
+
+
+def _patch(ranking, values):
+    # Moves only the systems whose SCOP changed: their old values are deleted from the sorted array by
+    # binary search and the new ones inserted, which keeps the array sorted without a full sort
+    old = ranking['values']
+    removed = old.index.difference(values.index)
+    added = values.index.difference(old.index)
+    common = old.index.intersection(values.index)
+    changed = common[old[common].to_numpy() != values[common].to_numpy()]
+
+    stale = old[removed.append(changed)].to_numpy()
+    fresh = values[added.append(changed)].to_numpy()
+    if len(stale) + len(fresh) > RESORT_RATIO * max(len(values), 1):
+        return {'values': values, 'sorted': np.sort(values.to_numpy())}
+
+    sorted_values = ranking['sorted']
+    if len(stale):
+        stale = np.sort(stale)
+        # Equal stale values map to consecutive slots after the first match
+        repeats = np.arange(len(stale)) - np.searchsorted(stale, stale, side='left')
+        sorted_values = np.delete(sorted_values, np.searchsorted(sorted_values, stale, side='left') + repeats)
+    if len(fresh):
+        fresh = np.sort(fresh)
+        sorted_values = np.insert(sorted_values, np.searchsorted(sorted_values, fresh), fresh)
+    return {'values': values, 'sorted': sorted_values}
+
+
+def refresh(ranking_file=RANKING_FILE, scop_files=SCOP_FILES):
+    rankings = {}
+    if os.path.exists(ranking_file):
+        with open(ranking_file, mode='rb') as file:
+            rankings = pickle.load(file)
+
+    updated = False
+    for scop_type, file_path in scop_files.items():
+        stat = os.stat(file_path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if rankings.get(scop_type, {}).get('stamp') == stamp:
+            continue
+
+        previous = rankings.get(scop_type, {}).get('periods', {})
+        periods = {}
+        for period, values in read_scops(file_path).items():
+            if period in previous:
+                periods[period] = _patch(previous[period], values)
+            else:
+                periods[period] = {'values': values, 'sorted': np.sort(values.to_numpy())}
+        rankings[scop_type] = {'stamp': stamp, 'periods': periods}
+        updated = True
+        logging.info(f"Refreshed {scop_type} SCOP rankings from {file_path}")
+
+    if updated:
+        temporary_file = f"{ranking_file}.tmp"
+        with open(temporary_file, mode='wb') as file:
+            pickle.dump(rankings, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_file, ranking_file)
+    return rankings
+
+
+def percentile_rank(system_ids, scop_type='combined', period='year', rankings=None):
+    # Percentile is the share of the fleet at or below the system's SCOP; rank 1 is the best system
+    rankings = rankings or refresh()
+    ranking = rankings[scop_type]['periods'][period]
+    sorted_values = ranking['sorted']
+    scops = ranking['values'].reindex(system_ids).to_numpy()
+
+    at_or_below = np.searchsorted(sorted_values, scops, side='right')
+    fleet_size = len(sorted_values)
+    known = ~np.isnan(scops)
+    return pd.DataFrame({
+        'ID': system_ids,
+        'type': scop_type,
+        'period': period,
+        'SCOP': scops,
+        'percentile': np.where(known, 100.0 * at_or_below / max(fleet_size, 1), np.nan),
+        'rank': pd.Series(fleet_size - at_or_below + 1, dtype='Int64').where(known),
+        'of': fleet_size
+    })
+
+
+def percentile_table(system_ids, rankings=None):
+    rankings = rankings or refresh()
+    return pd.concat([percentile_rank(system_ids, scop_type, period, rankings)
+                      for scop_type in rankings for period in PERIODS], ignore_index=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ids', type=int, nargs='*', help="System IDs to rank; none just refreshes the rankings")
+    parser.add_argument('--type', choices=list(SCOP_FILES), default=None, help="SCOP type; all types when omitted")
+    parser.add_argument('--period', choices=list(PERIODS), default=None, help="Period; all periods when omitted")
+    args = parser.parse_args()
+
+    rankings = refresh()
+    if not args.ids:
+        return
+
+    table = percentile_table(args.ids, rankings)
+    if args.type:
+        table = table[table['type'] == args.type]
+    if args.period:
+        table = table[table['period'] == args.period]
+    print(table.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
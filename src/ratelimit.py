@@ -0,0 +1,140 @@
+import os
+import math
+import time
+import logging
+import threading
+import datetime
+from email.utils import parsedate_to_datetime
+
+import requests
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 5
+MIN_CONCURRENCY = 1
+INITIAL_CONCURRENCY = 2
+MAX_CONCURRENCY = 16
+TARGET_LATENCY = 2.0
+DECREASE_FACTOR = 0.5
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+RATE_INCREASE = 0.1
+MAX_RETRIES = 4
+DEFAULT_BACKOFF = 5.0
+# A server asking for a longer pause than this gets this; one bad header must not stall the whole run
+MAX_RETRY_AFTER = 300.0
+REQUEST_TIMEOUT = 60
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds()
+    # float() also accepts "inf" and "nan"
+    if not math.isfinite(seconds):
+        return None
+    return min(MAX_RETRY_AFTER, max(0.0, seconds))
+
+
+class RateController:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, concurrency=INITIAL_CONCURRENCY,
+                 min_concurrency=MIN_CONCURRENCY, max_concurrency=MAX_CONCURRENCY, target_latency=TARGET_LATENCY):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        # Requests are numbered as they start; only those started after the last decrease can cause another
+        self._issued = 0
+        self._decrease_after = 0
+        self._last_refill = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.limit):
+                    wait = None
+                elif self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    self._issued += 1
+                    return self._issued
+                self._condition.wait(wait)
+
+    def _decrease(self, ticket, rate=False):
+        # At most one multiplicative decrease per window: responses to requests already in flight when the
+        # limit was cut report the same congestion, so they must not cut it again
+        if ticket <= self._decrease_after:
+            return
+        self._decrease_after = self._issued
+        self.limit = max(self.min_concurrency, self.limit * DECREASE_FACTOR)
+        if rate:
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+
+    def release(self, ticket, latency, status_code=None, retry_after=None):
+        with self._condition:
+            self.in_flight -= 1
+            if status_code is None or status_code in RETRY_STATUS_CODES:
+                # Multiplicative decrease on errors and throttling
+                self._decrease(ticket, rate=True)
+                pause = retry_after if retry_after is not None else DEFAULT_BACKOFF
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+                logging.warning(f"Backing off for {pause:.1f}s (status {status_code}), "
+                                f"concurrency {self.limit:.1f}, rate {self.rate:.2f}/s")
+            elif latency > self.target_latency:
+                self._decrease(ticket)
+            else:
+                # Additive increase: roughly one extra slot per window of successful requests
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.rate = min(MAX_RATE, self.rate + RATE_INCREASE)
+            self._condition.notify_all()
+
+    def get(self, url, session=requests):
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = self.acquire()
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                self.release(ticket, time.perf_counter() - start)
+                if attempt == MAX_RETRIES:
+                    raise
+                logging.warning(f"Request to {url} failed: {e}. Retrying...")
+                continue
+
+            self.release(ticket, time.perf_counter() - start, response.status_code,
+                         parse_retry_after(response.headers.get('Retry-After')))
+            if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                continue
+            response.raise_for_status()
+            return response
+
+
+def stalest_first(system_ids, path_for):
+    def last_updated(system_id):
+        path = path_for(system_id)
+        return os.path.getmtime(path) if os.path.exists(path) else float('-inf')
+
+    return sorted(system_ids, key=last_updated)
@@ -0,0 +1,138 @@
+import math
+
+import numpy as np
+
+DEFAULT_CHUNK_ROWS = 100000
+
+
+class RegressionAccumulator:
+    # Sufficient statistics for a least-squares polynomial fit: the moment matrix sum(x^(i+j)), sum(x^i * y),
+    # n, sum(y) and sum(y^2). Chunks can be added in any order and accumulators from separate shards merged.
+    def __init__(self, degree=1):
+        self.degree = degree
+        self.n = 0
+        self.xtx = np.zeros((degree + 1, degree + 1))
+        self.xty = np.zeros(degree + 1)
+        self.sum_y = 0.0
+        self.sum_y2 = 0.0
+
+    def _design(self, x):
+        return np.vander(x, self.degree + 1, increasing=True)
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if x.shape != y.shape:
+            raise ValueError(f"x and y have different shapes: {x.shape} and {y.shape}")
+        if not (np.isfinite(x).all() and np.isfinite(y).all()):
+            raise ValueError("x and y must not contain NaN or infinite values")
+
+        design = self._design(x)
+        self.n += len(x)
+        self.xtx += design.T @ design
+        self.xty += design.T @ y
+        self.sum_y += y.sum()
+        self.sum_y2 += (y * y).sum()
+        return self
+
+    def merge(self, other):
+        if other.degree != self.degree:
+            raise ValueError(f"Can not merge degree {other.degree} into degree {self.degree}")
+        self.n += other.n
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.sum_y += other.sum_y
+        self.sum_y2 += other.sum_y2
+        return self
+
+    def __add__(self, other):
+        return RegressionAccumulator(self.degree).merge(self).merge(other)
+
+    def coefficients(self):
+        # Highest power first, like np.polyfit, so the result can go straight into np.poly1d
+        if self.n <= self.degree:
+            raise ValueError(f"At least {self.degree + 1} points are needed for a degree {self.degree} fit")
+        solution = np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+        return solution[::-1]
+
+    def r_squared(self, coefficients=None):
+        # R² of any polynomial against the accumulated points, so a test accumulator can score training coefficients
+        if coefficients is None:
+            coefficients = self.coefficients()
+        beta = np.asarray(coefficients, dtype=float)[::-1]
+        ss_res = self.sum_y2 - 2 * beta @ self.xty + beta @ self.xtx @ beta
+        ss_tot = self.sum_y2 - self.sum_y ** 2 / self.n
+        return 1 - ss_res / ss_tot
+
+
+def masked_accumulators(x, y, masks, degree=1):
+    # One accumulator per row of masks (shape: subsets x points), filled by a single matrix product per
+    # statistic instead of a pass over the data for every subset. x and y must be finite wherever a mask is set.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    weights = np.asarray(masks, dtype=float)
+    valid = weights.any(axis=0)
+    x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+    if not (np.isfinite(x).all() and np.isfinite(y).all()):
+        raise ValueError("x and y must not contain NaN or infinite values where a mask is set")
+
+    powers = np.vander(x, 2 * degree + 1, increasing=True)
+    power_sums = weights @ powers
+    cross_sums = weights @ (powers[:, :degree + 1] * y[:, None])
+    counts = weights.sum(axis=1)
+    sum_y = weights @ y
+    sum_y2 = weights @ (y * y)
+
+    accumulators = []
+    exponents = np.add.outer(np.arange(degree + 1), np.arange(degree + 1))
+    for index in range(weights.shape[0]):
+        accumulator = RegressionAccumulator(degree)
+        accumulator.n = int(counts[index])
+        accumulator.xtx = power_sums[index][exponents]
+        accumulator.xty = cross_sums[index]
+        accumulator.sum_y = float(sum_y[index])
+        accumulator.sum_y2 = float(sum_y2[index])
+        accumulators.append(accumulator)
+    return accumulators
+
+
+TRAIN = 0
+TEST = 1
+
+
+def split_folds(n, test_size=0.2, random_state=42):
+    # Marks the rows sklearn's train_test_split(..., test_size, random_state) would put in each set;
+    # rows left out by its rounding stay at -1
+    n_test = math.ceil(test_size * n)
+    n_train = math.floor((1 - test_size) * n)
+    permutation = np.random.RandomState(random_state).permutation(n)
+    folds = np.full(n, -1, dtype=np.int8)
+    folds[permutation[:n_test]] = TEST
+    folds[permutation[n_test:n_test + n_train]] = TRAIN
+    return folds
+
+
+def iter_chunks(x, y, chunk_rows=DEFAULT_CHUNK_ROWS):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    for start in range(0, len(x), chunk_rows):
+        yield x[start:start + chunk_rows], y[start:start + chunk_rows]
+
+
+def train_test_fit(chunks, n, degree=1, test_size=0.2, random_state=42):
+    # chunks yields (x, y) arrays in a fixed order; only the n-row fold labels are held in memory
+    folds = split_folds(n, test_size, random_state)
+    train = RegressionAccumulator(degree)
+    test = RegressionAccumulator(degree)
+    offset = 0
+    for x, y in chunks:
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        chunk_folds = folds[offset:offset + len(x)]
+        train.update(x[chunk_folds == TRAIN], y[chunk_folds == TRAIN])
+        test.update(x[chunk_folds == TEST], y[chunk_folds == TEST])
+        offset += len(x)
+    if offset != n:
+        raise ValueError(f"Expected {n} rows but the chunks held {offset}")
+
+    coefficients = train.coefficients()
+    return train.r_squared(coefficients), test.r_squared(coefficients), np.poly1d(coefficients)
@@ -0,0 +1,160 @@
+import os
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tensor import FleetTensor, TENSOR_DIRECTORY, INDEX_FILE
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ROLLING_FILE = os.path.join(SRC_DIRECTORY, 'rolling_scop.npz')
+CHANGES_FILE = os.path.join(SRC_DIRECTORY, 'rolling_scop_changes.csv')
+
+WINDOWS = [7, 30, 90]
+SCOP_TYPES = ['combined', 'space', 'water']
+# A window needs data on this share of its days, otherwise a few logged days would stand for the whole window
+MIN_COVERAGE = 0.75
+CHANGE_WINDOW = 30
+# Shift in SCOP between the windows either side of a day that counts as a change
+CHANGE_THRESHOLD = 0.5
+# The windows either side must run a similar load, or the shift is just the season: heat per logged day within
+# this ratio, and the hot water share of metered heat within this many points where hot water is metered
+MAX_HEAT_RATIO = 1.35
+MAX_WATER_SHARE_CHANGE = 0.05
+
+
+def window_sums(values, window):
+    # Trailing window ending on each day, from differences of one cumulative sum along the day axis
+    cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=cumulative[:, 1:])
+    sums = np.full(values.shape, np.nan)
+    sums[:, window - 1:] = cumulative[:, window:] - cumulative[:, :-window]
+    return sums
+
+
+def rolling_scop(tensor, windows=WINDOWS, scop_types=SCOP_TYPES):
+    # Returns an array of (type, window, system, day); each value is heat over electricity for the window
+    # ending that day, so long windows are not skewed by short days the way a mean of daily COPs is
+    logged = np.nan_to_num(np.asarray(tensor.metric('combined_data_length'), dtype=float)) > 0
+    scop = np.full((len(scop_types), len(windows)) + logged.shape, np.nan, dtype=np.float32)
+
+    for type_position, scop_type in enumerate(scop_types):
+        heat = np.nan_to_num(np.asarray(tensor.metric(f"{scop_type}_heat_kwh"), dtype=float))
+        elec = np.nan_to_num(np.asarray(tensor.metric(f"{scop_type}_elec_kwh"), dtype=float))
+        for window_position, window in enumerate(windows):
+            heat_sum = window_sums(heat, window)
+            elec_sum = window_sums(elec, window)
+            covered = window_sums(logged.astype(float), window) >= MIN_COVERAGE * window
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scop[type_position, window_position] = np.where(covered & (elec_sum > 0), heat_sum / elec_sum, np.nan)
+    return scop
+
+
+def either_side(values, window):
+    # The trailing window ending the day before each day, and the one starting that day
+    before = np.full(values.shape, np.nan)
+    before[:, 1:] = values[:, :-1]
+    after = np.full(values.shape, np.nan)
+    after[:, :-window + 1] = values[:, window - 1:]
+    return before, after
+
+
+def window_load(tensor, window=CHANGE_WINDOW):
+    # Heat per logged day and the hot water share of metered heat, over the trailing window ending each day
+    def metric_sums(name):
+        return window_sums(np.nan_to_num(np.asarray(tensor.metric(name), dtype=float)), window)
+
+    logged = window_sums((np.nan_to_num(np.asarray(tensor.metric('combined_data_length'), dtype=float)) > 0)
+                         .astype(float), window)
+    space = metric_sums('space_heat_kwh')
+    water = metric_sums('water_heat_kwh')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        heat_per_day = np.where(logged > 0, metric_sums('combined_heat_kwh') / logged, np.nan)
+        # Without hot water metering the split is unknown, rather than all space heating
+        water_share = np.where(water > 0, water / (space + water), np.nan)
+    return heat_per_day, water_share
+
+
+def change_points(scop, load, days, system_ids, window=CHANGE_WINDOW, threshold=CHANGE_THRESHOLD):
+    # Compares the window ending the day before with the window starting that day. Only windows running a similar
+    # load count, so switching between space heating and hot water through the year does not flag every system,
+    # and only the largest shift within a window either side is kept, so one change gives one flag.
+    before, after = either_side(scop, window)
+    shift = after - before
+
+    heat_before, heat_after = either_side(load[0], window)
+    share_before, share_after = either_side(load[1], window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        heat_ratio = heat_after / heat_before
+        similar = (heat_ratio >= 1 / MAX_HEAT_RATIO) & (heat_ratio <= MAX_HEAT_RATIO) & \
+            ~(np.abs(share_after - share_before) > MAX_WATER_SHARE_CHANGE)
+    change = np.where(similar, np.abs(np.nan_to_num(shift, nan=0.0)), 0.0)
+
+    padded = np.pad(change, ((0, 0), (window, window)))
+    neighbourhood = np.lib.stride_tricks.sliding_window_view(padded, 2 * window + 1, axis=1).max(axis=2)
+    rows, columns = np.nonzero((change >= threshold) & (change == neighbourhood))
+    return pd.DataFrame({
+        'ID': system_ids[rows],
+        'day': days[columns],
+        'scop_before': np.round(before[rows, columns], 3),
+        'scop_after': np.round(after[rows, columns], 3),
+        'shift': np.round(shift[rows, columns], 3),
+        'heat_per_day_before': np.round(heat_before[rows, columns], 2),
+        'heat_per_day_after': np.round(heat_after[rows, columns], 2)
+    })
+
+
+def save_rolling(scop, tensor, rolling_file=ROLLING_FILE, windows=WINDOWS, scop_types=SCOP_TYPES):
+    # Half precision keeps about three significant figures of SCOP, and the gaps before a system was
+    # monitored compress to almost nothing
+    temporary_file = f"{rolling_file}.tmp.npz"
+    np.savez_compressed(temporary_file, scop=scop.astype(np.float16), system_ids=tensor.system_ids,
+                        first_day=str(tensor.days[0].date()), windows=np.array(windows),
+                        scop_types=np.array(scop_types))
+    os.replace(temporary_file, rolling_file)
+
+
+def load_rolling(system_id, scop_type='combined', window=30, rolling_file=ROLLING_FILE):
+    with np.load(rolling_file) as rolling:
+        system_ids = rolling['system_ids']
+        if system_id not in system_ids:
+            raise ValueError(f"System {system_id} is not in {rolling_file}")
+        type_position = list(rolling['scop_types']).index(scop_type)
+        window_position = list(rolling['windows']).index(window)
+        values = rolling['scop'][type_position, window_position, np.flatnonzero(system_ids == system_id)[0]]
+        days = pd.date_range(str(rolling['first_day']), periods=len(values), freq='D')
+    return pd.Series(values.astype(float), index=days, name=f"{scop_type} SCOP ({window} days)").dropna()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tensor', default=TENSOR_DIRECTORY, help="Fleet tensor directory written by tensor.py")
+    parser.add_argument('--output', default=ROLLING_FILE, help="Compressed file for the rolling SCOP series")
+    parser.add_argument('--changes', default=CHANGES_FILE, help="CSV file for the change points")
+    parser.add_argument('--threshold', type=float, default=CHANGE_THRESHOLD, help="SCOP shift that counts as a change")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.tensor, INDEX_FILE)):
+        raise FileNotFoundError(f"No fleet tensor in {args.tensor}; run tensor.py first")
+    tensor = FleetTensor(args.tensor)
+
+    scop = rolling_scop(tensor)
+    save_rolling(scop, tensor, args.output)
+    logging.info(f"Rolling {'/'.join(map(str, WINDOWS))} day SCOP for {len(tensor.system_ids)} systems over "
+                 f"{len(tensor.days)} days written to {args.output}")
+
+    window_position = WINDOWS.index(CHANGE_WINDOW)
+    load = window_load(tensor)
+    changes = pd.concat([change_points(scop[type_position, window_position], load, tensor.days, tensor.system_ids,
+                                       threshold=args.threshold).assign(type=scop_type)
+                         for type_position, scop_type in enumerate(SCOP_TYPES)], ignore_index=True)
+    changes = changes[['ID', 'type', 'day', 'scop_before', 'scop_after', 'shift', 'heat_per_day_before',
+                       'heat_per_day_after']].sort_values(['ID', 'type', 'day'])
+    changes.to_csv(args.changes, index=False)
+    logging.info(f"{len(changes)} change points in {changes['ID'].nunique()} systems written to {args.changes}")
+
+
+if __name__ == "__main__":
+    main()
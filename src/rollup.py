@@ -0,0 +1,157 @@
+import csv
+import datetime
+import os
+
+ROLLUP_FOLDER = "rollup"
+ROLLUP_FILE_TEMPLATE = "rollup_{granularity}.csv"
+
+# Ordered from coarsest to finest so queries pick the smallest table first
+GRANULARITIES = ['heating_year', 'season', 'month', 'week']
+
+HEATING_YEAR_START_MONTH = 6
+SEASON_START_MONTHS = [3, 6, 9, 12]
+
+PREFIXES = ['combined', 'running', 'space', 'water']
+KWH_FIELDS = ['elec_kwh', 'heat_kwh']
+TEMPERATURE_FIELDS = ['flowT_mean', 'returnT_mean', 'outsideT_mean', 'roomT_mean']
+
+SUM_COLUMNS = [f"{prefix}_{field}" for prefix in PREFIXES for field in KWH_FIELDS] + \
+              ['combined_cooling_kwh', 'combined_starts'] + \
+              [f"{prefix}_data_length" for prefix in PREFIXES]
+WEIGHTED_COLUMNS = [f"{prefix}_{field}" for prefix in PREFIXES for field in TEMPERATURE_FIELDS]
+
+ROLLUP_FIELDS = ['days'] + SUM_COLUMNS + \
+                [f"{column}_wsum" for column in WEIGHTED_COLUMNS] + \
+                [f"{column}_weight" for column in WEIGHTED_COLUMNS]
+
+
+def parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def period_start(date, granularity):
+    if granularity == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.replace(day=1)
+    if granularity == 'season':
+        month = max(m for m in [0] + SEASON_START_MONTHS if m <= date.month)
+        if month == 0:
+            return datetime.date(date.year - 1, 12, 1)
+        return datetime.date(date.year, month, 1)
+    if granularity == 'heating_year':
+        year = date.year if date.month >= HEATING_YEAR_START_MONTH else date.year - 1
+        return datetime.date(year, HEATING_YEAR_START_MONTH, 1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def empty_bucket():
+    return {field: 0.0 for field in ROLLUP_FIELDS}
+
+
+def build_system_rollups(rows):
+    header = [h.strip() for h in rows[0]]
+    index = {name: i for i, name in enumerate(header)}
+    rollups = {granularity: {} for granularity in GRANULARITIES}
+
+    for row in rows[1:]:
+        if len(row) <= 1:
+            continue
+        try:
+            day = datetime.datetime.strptime(row[index['timestamp']].strip(), '%Y-%m-%d %H:00:00').date()
+        except ValueError:
+            continue
+
+        values = {name: parse_float(row[i]) if i < len(row) else None for name, i in index.items()}
+
+        for granularity in GRANULARITIES:
+            key = period_start(day, granularity).isoformat()
+            bucket = rollups[granularity].setdefault(key, empty_bucket())
+            bucket['days'] += 1
+            for column in SUM_COLUMNS:
+                if values.get(column) is not None:
+                    bucket[column] += values[column]
+            for column in WEIGHTED_COLUMNS:
+                weight = values.get(f"{column.split('_')[0]}_data_length")
+                if values.get(column) is not None and weight:
+                    bucket[f"{column}_wsum"] += values[column] * weight
+                    bucket[f"{column}_weight"] += weight
+
+    return rollups
+
+
+def set_system_rollups(tables, system_id, system_rollups):
+    for granularity in GRANULARITIES:
+        tables.setdefault(granularity, {})[system_id] = system_rollups[granularity]
+    return tables
+
+
+def update_rollups(tables, system_id, rows):
+    return set_system_rollups(tables, system_id, build_system_rollups(rows))
+
+
+def rollup_file_path(output_folder, granularity):
+    return os.path.join(output_folder, ROLLUP_FOLDER, ROLLUP_FILE_TEMPLATE.format(granularity=granularity))
+
+
+def save_rollups(output_folder, tables):
+    os.makedirs(os.path.join(output_folder, ROLLUP_FOLDER), exist_ok=True)
+    saved_files = []
+    for granularity in GRANULARITIES:
+        file_path = rollup_file_path(output_folder, granularity)
+        with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['system_id', 'period_start'] + ROLLUP_FIELDS)
+            for system_id in sorted(tables.get(granularity, {})):
+                buckets = tables[granularity][system_id]
+                for key in sorted(buckets):
+                    writer.writerow([system_id, key] + [buckets[key][field] for field in ROLLUP_FIELDS])
+        saved_files.append(file_path)
+    return saved_files
+
+
+def load_rollups(output_folder, granularities=GRANULARITIES):
+    tables = {}
+    for granularity in granularities:
+        tables[granularity] = {}
+        file_path = rollup_file_path(output_folder, granularity)
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                buckets = tables[granularity].setdefault(int(row['system_id']), {})
+                buckets[row['period_start']] = {field: float(row[field]) for field in ROLLUP_FIELDS}
+    return tables
+
+
+def is_aligned(date, granularity):
+    return period_start(date, granularity) == date
+
+
+def choose_granularity(start_date, end_date):
+    start, end = start_date.date(), end_date.date()
+    if start_date != datetime.datetime.combine(start, datetime.time()) or \
+            end_date != datetime.datetime.combine(end, datetime.time()):
+        return None
+    for granularity in GRANULARITIES:
+        if is_aligned(start, granularity) and is_aligned(end, granularity):
+            return granularity
+    return None
+
+
+def aggregate(tables, system_id, start_date, end_date):
+    granularity = choose_granularity(start_date, end_date)
+    if granularity is None:
+        raise ValueError(f"No rollup table is aligned with {start_date} to {end_date}")
+
+    start, end = start_date.date().isoformat(), end_date.date().isoformat()
+    total = empty_bucket()
+    for key, bucket in tables.get(granularity, {}).get(system_id, {}).items():
+        if start <= key < end:
+            for field in ROLLUP_FIELDS:
+                total[field] += bucket[field]
+    return total
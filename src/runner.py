@@ -0,0 +1,276 @@
+import os
+import sys
+import ast
+import glob
+import json
+import hashlib
+import logging
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(SRC_DIRECTORY, '.runner_state.json')
+HASH_CHUNK_SIZE = 1 << 20
+DEFAULT_JOBS = 4
+
+ARCHIVE_FILES = 'system_daily_data/archive/system_*_daily_data_*.csv.*'
+CONVERTED_FILES = 'system_daily_data/system_*_daily_data_converted.csv'
+CLEAN_FILES = 'system_daily_data/system_*_daily_data_clean.csv'
+WINTER_FILES = 'system_daily_data/system_*_daily_data_winter.csv'
+SCOP_FILES = ['system_scop_original.csv', 'system_scop_clean.csv', 'system_sh_scop_original.csv',
+              'system_sh_scop_clean.csv', 'system_wh_scop_original.csv', 'system_wh_scop_clean.csv']
+ANNUAL_SCOP_FILES = ['annual_system_scop.csv', 'annual_system_sh_scop.csv', 'annual_system_wh_scop.csv']
+ALL_DATA_FILES = ['limited_data_sorted_by_cop.csv', 'limited_data_sorted_by_id.csv', 'all_data_sorted_by_cop.csv',
+                  'all_data_sorted_by_id.csv']
+GROUP_FILES = ['groups/less_than_50_group.csv', 'groups/bet_50_100_group.csv', 'groups/bet_100_200_group.csv',
+               'groups/more_than_200_group.csv']
+
+# Paths are relative to src. Remote stages download from heatpumpmonitor.org, so what they download can not be
+# hashed; they only re-run when their script, local inputs or outputs change, or when --refresh is given.
+STAGES = [
+    {'name': 'dailydata', 'script': 'dailydata.py', 'remote': True, 'inputs': [],
+     'outputs': [ARCHIVE_FILES, CONVERTED_FILES, CLEAN_FILES, WINTER_FILES] + SCOP_FILES + ANNUAL_SCOP_FILES +
+                ['scop_sketches.json']},
+    {'name': 'alldata', 'script': 'alldata.py', 'remote': True, 'inputs': [],
+     'outputs': ALL_DATA_FILES},
+    {'name': 'classify', 'script': 'groups/classify.py', 'remote': True, 'inputs': ['system_features.csv'],
+     'outputs': ['groups/data_sorted_by_cop.csv', 'groups/data_sorted_by_heat_demand_per_floor_area.csv',
+                 'groups/classify_clean.csv'] + GROUP_FILES},
+    {'name': 'cluster', 'script': 'groups/cluster.py', 'inputs': [CLEAN_FILES],
+     'outputs': ['groups/cluster_*_group.csv', 'groups/cluster_profiles.csv']},
+    {'name': 'ranking', 'script': 'ranking.py', 'outputs': ['.ranking.pkl'],
+     'inputs': ['system_scop_clean.csv', 'system_sh_scop_clean.csv', 'system_wh_scop_clean.csv']},
+    {'name': 'features', 'script': 'features.py', 'inputs': [CONVERTED_FILES, 'all_data_sorted_by_id.csv'],
+     'outputs': ['system_features.csv']},
+    {'name': 'curvefit', 'script': 'curvefit.py', 'inputs': [CLEAN_FILES, 'all_data_sorted_by_id.csv'],
+     'outputs': ['compensation_curves.csv']},
+    {'name': 'tensor', 'script': 'tensor.py', 'inputs': [CONVERTED_FILES], 'outputs': ['fleet_tensor/*']},
+    {'name': 'rolling', 'script': 'rolling.py', 'inputs': ['fleet_tensor/*'],
+     'outputs': ['rolling_scop.npz', 'rolling_scop_changes.csv']},
+    {'name': 'season', 'script': 'season.py', 'outputs': ['plot/*_scop_vs_season.png'],
+     'inputs': ['system_scop_clean.csv', 'system_sh_scop_clean.csv', 'system_wh_scop_clean.csv',
+                'scop_sketches.json']},
+    {'name': 'training', 'script': 'training.py', 'outputs': [],
+     'inputs': ['system_features.csv', 'all_data_sorted_by_id.csv']},
+    {'name': 'training_detailed', 'script': 'training_detailed.py', 'outputs': [],
+     'inputs': ['system_features.csv', 'all_data_sorted_by_id.csv']},
+    {'name': 'solar', 'script': 'solar.py', 'outputs': [],
+     'inputs': ['system_features.csv', 'all_data_sorted_by_id.csv']},
+    {'name': 'ufh', 'script': 'ufh.py', 'outputs': [],
+     'inputs': ['system_features.csv', 'all_data_sorted_by_id.csv']},
+    {'name': 'comp_curve', 'script': 'comp_curve.py', 'outputs': [],
+     'inputs': ['annual_system_sh_scop.csv', 'all_data_sorted_by_id.csv']},
+    {'name': 'weathercomp', 'script': 'weathercomp.py', 'outputs': [],
+     'inputs': ['annual_system_sh_scop.csv', 'all_data_sorted_by_id.csv']},
+    {'name': 'insulation', 'script': 'groups/insulation.py', 'outputs': [],
+     'inputs': ['annual_system_scop.csv', 'all_data_sorted_by_id.csv'] + GROUP_FILES},
+    {'name': 'flowtemp', 'script': 'groups/flowtemp.py', 'outputs': [],
+     'inputs': GROUP_FILES + [CLEAN_FILES, WINTER_FILES]},
+    {'name': 'flowtemp_all', 'script': 'groups/flowtemp_all.py', 'outputs': [],
+     'inputs': GROUP_FILES + [CLEAN_FILES, WINTER_FILES]},
+    {'name': 'sweep', 'script': 'groups/sweep.py', 'outputs': ['groups/threshold_sweep.csv'],
+     'inputs': GROUP_FILES + [CLEAN_FILES, WINTER_FILES]},
+]
+
+
+def expand(patterns):
+    paths = set()
+    for pattern in patterns:
+        paths.update(os.path.relpath(path, SRC_DIRECTORY)
+                     for path in glob.glob(os.path.join(SRC_DIRECTORY, pattern)) if os.path.isfile(path))
+    return sorted(paths)
+
+
+def file_digest(path, cache):
+    # Files whose size and mtime are unchanged since the last run are not read again
+    full_path = os.path.join(SRC_DIRECTORY, path)
+    stat = os.stat(full_path)
+    cached = cache.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(full_path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return cache[path][2]
+
+
+def fingerprint(patterns, cache):
+    digest = hashlib.sha256()
+    for path in expand(patterns):
+        digest.update(f"{path}\0{file_digest(path, cache)}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_dependencies(stages):
+    producers = {}
+    for stage in stages:
+        for pattern in stage['outputs']:
+            producers[pattern] = stage['name']
+    return {stage['name']: sorted({producers[pattern] for pattern in stage['inputs']
+                                   if pattern in producers and producers[pattern] != stage['name']})
+            for stage in stages}
+
+
+def with_upstream(targets, dependencies):
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies[name])
+    return selected
+
+
+def load_state(file_path=STATE_FILE):
+    if not os.path.exists(file_path):
+        return {'stages': {}, 'files': {}}
+    with open(file_path, mode='r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_state(state, file_path=STATE_FILE):
+    temporary_file = f"{file_path}.tmp"
+    with open(temporary_file, mode='w', encoding='utf-8') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(temporary_file, file_path)
+
+
+def local_imports(script, seen=None):
+    # Modules of this repo a script imports, directly or through other local modules. Scripts in groups/
+    # put src on sys.path, so both their own directory and src are searched.
+    top_level = seen is None
+    seen = {script} if top_level else seen
+    with open(os.path.join(SRC_DIRECTORY, script), mode='r', encoding='utf-8') as file:
+        tree = ast.parse(file.read(), filename=script)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+
+    for name in sorted(names):
+        for directory in dict.fromkeys([os.path.dirname(script), '']):
+            path = os.path.join(directory, f"{name}.py")
+            if os.path.isfile(os.path.join(SRC_DIRECTORY, path)):
+                if path not in seen:
+                    seen.add(path)
+                    local_imports(path, seen)
+                break
+    return sorted(seen - {script}) if top_level else seen
+
+
+def input_fingerprint(stage, cache):
+    return fingerprint([stage['script']] + local_imports(stage['script']) + stage['inputs'], cache)
+
+
+def stage_fingerprints(stage, cache):
+    return {
+        'inputs': input_fingerprint(stage, cache),
+        'outputs': fingerprint(stage['outputs'], cache)
+    }
+
+
+def is_up_to_date(stage, recorded, current, refresh=False):
+    if recorded is None or (refresh and stage.get('remote')):
+        return False
+    if stage['outputs'] and not expand(stage['outputs']):
+        return False
+    return recorded == current
+
+
+def run_stage(stage):
+    script = os.path.join(SRC_DIRECTORY, stage['script'])
+    # Plotting scripts call plt.show(); a non-interactive backend lets them run unattended
+    env = dict(os.environ, MPLBACKEND=os.environ.get('MPLBACKEND', 'Agg'))
+    logging.info(f"Running {stage['name']} ({stage['script']})")
+    completed = subprocess.run([sys.executable, os.path.basename(script)], cwd=os.path.dirname(script), env=env)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Stage {stage['name']} exited with code {completed.returncode}")
+
+
+def run(targets=None, jobs=DEFAULT_JOBS, refresh=False, force=False, dry_run=False, stages=STAGES,
+        state_file=STATE_FILE):
+    stages_by_name = {stage['name']: stage for stage in stages}
+    dependencies = stage_dependencies(stages)
+    unknown = set(targets or []) - set(stages_by_name)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+    selected = with_upstream(targets, dependencies) if targets else set(stages_by_name)
+
+    state = load_state(state_file)
+    lock = threading.Lock()
+    done, failed, executed, skipped = set(), set(), [], []
+    waiting = [stage['name'] for stage in stages if stage['name'] in selected]
+
+    def process(name):
+        stage = stages_by_name[name]
+        with lock:
+            current = stage_fingerprints(stage, state['files'])
+        if not force and is_up_to_date(stage, state['stages'].get(name), current, refresh):
+            logging.info(f"Skipping {name}: up to date")
+            return False
+        if dry_run:
+            logging.info(f"Would run {name}")
+            return True
+
+        run_stage(stage)
+        with lock:
+            # The inputs are recorded as they were before the run, so an edit made while the stage ran
+            # still differs next time and forces another run; the outputs are the ones just written
+            state['stages'][name] = {'inputs': current['inputs'],
+                                     'outputs': fingerprint(stage['outputs'], state['files'])}
+            save_state(state, state_file)
+        return True
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while waiting or running:
+            for name in list(waiting):
+                if any(dependency in failed for dependency in dependencies[name] if dependency in selected):
+                    logging.error(f"Not running {name}: an upstream stage failed")
+                    waiting.remove(name)
+                    failed.add(name)
+                elif all(dependency in done for dependency in dependencies[name] if dependency in selected):
+                    waiting.remove(name)
+                    running[executor.submit(process, name)] = name
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    (executed if future.result() else skipped).append(name)
+                    done.add(name)
+                except Exception as e:
+                    logging.error(f"Stage {name} failed: {e}")
+                    failed.add(name)
+
+    logging.info(f"Ran {len(executed)} stages, skipped {len(skipped)}, failed {len(failed)}")
+    return {'executed': executed, 'skipped': skipped, 'failed': sorted(failed)}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stages', nargs='*', help="Stages to bring up to date, with everything upstream of them")
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help="Independent stages to run in parallel")
+    parser.add_argument('--refresh', action='store_true', help="Download fresh data in the remote stages")
+    parser.add_argument('--force', action='store_true', help="Run stages even when they are up to date")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run")
+    args = parser.parse_args()
+
+    result = run(args.stages, jobs=args.jobs, refresh=args.refresh, force=args.force, dry_run=args.dry_run)
+    if result['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
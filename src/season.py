@@ -1,41 +1,23 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 
-os.makedirs('plot', exist_ok=True)
-
-def process_and_plot_scop(file_path, scop_type):
-    scop_data = pd.read_csv(file_path)
+import sketch
 
-    scop_data['SCOP (Jun 23 to Aug 23)'] = pd.to_numeric(scop_data['SCOP (Jun 23 to Aug 23)'], errors='coerce')
-    scop_data['SCOP (Sep 23 to Nov 23)'] = pd.to_numeric(scop_data['SCOP (Sep 23 to Nov 23)'], errors='coerce')
-    scop_data['SCOP (Dec 23 to Feb 24)'] = pd.to_numeric(scop_data['SCOP (Dec 23 to Feb 24)'], errors='coerce')
-    scop_data['SCOP (Mar 24 to May 24)'] = pd.to_numeric(scop_data['SCOP (Mar 24 to May 24)'], errors='coerce')
+SCOP_SKETCH_FILE = 'scop_sketches.json'
 
-    melted_scop_data = scop_data.melt(
-        value_vars=[
-            'SCOP (Jun 23 to Aug 23)',
-            'SCOP (Sep 23 to Nov 23)',
-            'SCOP (Dec 23 to Feb 24)',
-            'SCOP (Mar 24 to May 24)'
-        ],
-        var_name='Season',
-        value_name='SCOP'
-    )
+os.makedirs('plot', exist_ok=True)
 
+def process_and_plot_scop(file_path, scop_type):
     season_labels = {
         'SCOP (Jun 23 to Aug 23)': 'Summer\n(Jun 23 to Aug 23)',
         'SCOP (Sep 23 to Nov 23)': 'Autumn\n(Sep 23 to Nov 23)',
         'SCOP (Dec 23 to Feb 24)': 'Winter\n(Dec 23 to Feb 24)',
         'SCOP (Mar 24 to May 24)': 'Spring\n(Mar 24 to May 24)'
     }
-    melted_scop_data['Season'] = melted_scop_data['Season'].map(season_labels)
 
-    median_summer = scop_data['SCOP (Jun 23 to Aug 23)'].median()
-    median_autumn = scop_data['SCOP (Sep 23 to Nov 23)'].median()
-    median_winter = scop_data['SCOP (Dec 23 to Feb 24)'].median()
-    median_spring = scop_data['SCOP (Mar 24 to May 24)'].median()
+    # Medians, boxes and violin outlines all come from the quantile sketches saved by dailydata.py
+    sketches = sketch.file_sketches(file_path, list(season_labels), sketch_file=SCOP_SKETCH_FILE,
+                                    prefix=scop_type.lower())
 
     season_colors = {
         'Summer': '#5BCBCE',
@@ -45,48 +27,33 @@ def process_and_plot_scop(file_path, scop_type):
     }
 
     plt.figure(figsize=(12, 8))
+    ax = plt.gca()
 
-    for i, season in enumerate(season_labels.values()):
+    for i, column in enumerate(season_labels):
         color = season_colors[list(season_colors.keys())[i]]
-        sns.violinplot(
-            x='Season',
-            y='SCOP',
-            data=melted_scop_data[melted_scop_data['Season'] == season],
-            inner=None,
-            color=color,
-            linewidth=2
-        )
-
-        sns.boxplot(
-            x='Season',
-            y='SCOP',
-            data=melted_scop_data[melted_scop_data['Season'] == season],
-            width=0.2,
+        sketch.plot_violins(ax, [sketches[column]], positions=[i], colors=[color], linewidth=2)
+
+        sketch.plot_boxes(
+            ax,
+            [sketches[column]],
+            positions=[i],
+            widths=0.2,
+            patch_artist=True,
             boxprops=dict(facecolor='white', edgecolor=color),
             medianprops=dict(color=color, linewidth=2),
             whiskerprops=dict(color='black'),
             capprops=dict(color='black')
         )
 
-    plt.scatter(0, median_summer, color=season_colors['Summer'], s=100, zorder=3)
-    plt.scatter(1, median_autumn, color=season_colors['Autumn'], s=100, zorder=3)
-    plt.scatter(2, median_winter, color=season_colors['Winter'], s=100, zorder=3)
-    plt.scatter(3, median_spring, color=season_colors['Spring'], s=100, zorder=3)
-
-    plt.text(0, median_summer + 0.1, f'{median_summer:.2f}', horizontalalignment='center', fontsize=14, color='black')
-    plt.text(1, median_autumn + 0.1, f'{median_autumn:.2f}', horizontalalignment='center', fontsize=14, color='black')
-    plt.text(2, median_winter + 0.1, f'{median_winter:.2f}', horizontalalignment='center', fontsize=14, color='black')
-    plt.text(3, median_spring + 0.1, f'{median_spring:.2f}', horizontalalignment='center', fontsize=14, color='black')
-
-    count_valid_summer = scop_data['SCOP (Jun 23 to Aug 23)'].dropna().count()
-    count_valid_autumn = scop_data['SCOP (Sep 23 to Nov 23)'].dropna().count()
-    count_valid_winter = scop_data['SCOP (Dec 23 to Feb 24)'].dropna().count()
-    count_valid_spring = scop_data['SCOP (Mar 24 to May 24)'].dropna().count()
+    for i, column in enumerate(season_labels):
+        color = season_colors[list(season_colors.keys())[i]]
+        median = sketches[column].median()
+        plt.scatter(i, median, color=color, s=100, zorder=3)
+        plt.text(i, median + 0.1, f'{median:.2f}', horizontalalignment='center', fontsize=14, color='black')
+        plt.text(i, 7.2, f'Valid counts = {sketches[column].n}', horizontalalignment='center', fontsize=14,
+                 color='black')
 
-    plt.text(0, 7.2, f'Valid counts = {count_valid_summer}', horizontalalignment='center', fontsize=14, color='black')
-    plt.text(1, 7.2, f'Valid counts = {count_valid_autumn}', horizontalalignment='center', fontsize=14, color='black')
-    plt.text(2, 7.2, f'Valid counts = {count_valid_winter}', horizontalalignment='center', fontsize=14, color='black')
-    plt.text(3, 7.2, f'Valid counts = {count_valid_spring}', horizontalalignment='center', fontsize=14, color='black')
+    plt.xticks(range(len(season_labels)), list(season_labels.values()))
 
     plt.ylabel('SCOP', fontsize=16)
     plt.xlabel('Season', fontsize=16)
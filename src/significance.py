@@ -0,0 +1,90 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+N_RESAMPLES = 10000
+RANDOM_SEED = 42
+CONFIDENCE = 0.95
+STATISTICS = {'median': np.median, 'mean': np.mean}
+RESULT_COLUMNS = ['cohort_a', 'cohort_b', 'n_a', 'n_b', 'statistic', 'difference', 'ci_low', 'ci_high', 'p_value']
+
+
+def _clean(values):
+    values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+    return values[np.isfinite(values)]
+
+
+def bootstrap_statistics(cohorts, statistic='median', n_resamples=N_RESAMPLES, rng=None):
+    # Every cohort is resampled from one matrix of uniforms over the pooled values: cohort c takes the
+    # columns of its own block and scales them to its own index range, so cohorts stay independent
+    rng = rng if rng is not None else np.random.default_rng(RANDOM_SEED)
+    sizes = np.array([len(values) for values in cohorts])
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    pooled = np.concatenate(cohorts) if len(cohorts) else np.array([])
+
+    uniforms = rng.random((n_resamples, offsets[-1]))
+    block_sizes = np.repeat(sizes, sizes)
+    indices = offsets[np.repeat(np.arange(len(cohorts)), sizes)] + \
+        np.minimum((uniforms * block_sizes).astype(int), block_sizes - 1)
+    resampled = pooled[indices]
+
+    function = STATISTICS[statistic]
+    return np.array([function(resampled[:, start:end], axis=1) if end > start else np.full(n_resamples, np.nan)
+                     for start, end in zip(offsets[:-1], offsets[1:])])
+
+
+def permutation_differences(a, b, keys, statistic='median'):
+    # Sorting a row of iid uniform keys gives a uniform random permutation, so the first len(a) columns
+    # of each row are a random relabelling of the pooled cohorts
+    pooled = np.concatenate([a, b])
+    permutations = np.argsort(keys[:, :len(pooled)], axis=1)
+    shuffled = pooled[permutations]
+    function = STATISTICS[statistic]
+    return function(shuffled[:, :len(a)], axis=1) - function(shuffled[:, len(a):], axis=1)
+
+
+def compare_cohorts(cohorts, pairs=None, statistic='median', n_resamples=N_RESAMPLES, confidence=CONFIDENCE,
+                    seed=RANDOM_SEED):
+    # Difference is cohort_b minus cohort_a, with a percentile bootstrap interval and a two-sided
+    # permutation p-value. The same seed always gives the same table.
+    names = list(cohorts)
+    values = [_clean(cohorts[name]) for name in names]
+    pairs = list(pairs) if pairs is not None else list(itertools.combinations(names, 2))
+    rng = np.random.default_rng(seed)
+
+    bootstrap = bootstrap_statistics(values, statistic, n_resamples, rng)
+    # One matrix of permutation keys serves every pair; each pair uses as many columns as it has systems
+    largest_pool = max([len(values[names.index(a)]) + len(values[names.index(b)]) for a, b in pairs], default=0)
+    keys = rng.random((n_resamples, largest_pool))
+
+    function = STATISTICS[statistic]
+    alpha = (1 - confidence) / 2
+    rows = []
+    for name_a, name_b in pairs:
+        index_a, index_b = names.index(name_a), names.index(name_b)
+        a, b = values[index_a], values[index_b]
+        row = {'cohort_a': name_a, 'cohort_b': name_b, 'n_a': len(a), 'n_b': len(b), 'statistic': statistic,
+               'difference': np.nan, 'ci_low': np.nan, 'ci_high': np.nan, 'p_value': np.nan}
+        if len(a) > 1 and len(b) > 1:
+            observed = function(b) - function(a)
+            differences = bootstrap[index_b] - bootstrap[index_a]
+            permuted = -permutation_differences(a, b, keys, statistic)
+            row['difference'] = observed
+            row['ci_low'], row['ci_high'] = np.quantile(differences, [alpha, 1 - alpha])
+            # Twice the smaller tail, as scipy.stats.permutation_test does; the null is skewed when the cohorts
+            # differ in size. The observed split counts as one of the permutations, so p is never exactly zero.
+            tolerance = 1e-12 * max(1.0, abs(observed))
+            tails = [np.sum(permuted >= observed - tolerance), np.sum(permuted <= observed + tolerance)]
+            row['p_value'] = min(1.0, 2 * (1 + min(tails)) / (n_resamples + 1))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def annotation(result, confidence=CONFIDENCE):
+    # One line for a plot, e.g. "Δ median 0.21 (95% CI -0.05 to 0.48), p = 0.12"
+    if np.isnan(result['p_value']):
+        return f"Δ {result['statistic']}: too few systems"
+    p_value = f"p = {result['p_value']:.3f}" if result['p_value'] >= 0.001 else "p < 0.001"
+    return (f"Δ {result['statistic']} {result['difference']:.2f} ({confidence:.0%} CI {result['ci_low']:.2f} to "
+            f"{result['ci_high']:.2f}), {p_value}")
@@ -0,0 +1,213 @@
+import os
+import json
+import math
+import random
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_K = 400
+CAPACITY_DECAY = 2 / 3
+VIOLIN_POINTS = 100
+# Like seaborn, the violin outline runs this many bandwidths past the extreme values
+VIOLIN_CUT = 2
+WHISKER_IQR = 1.5
+
+
+class KLLSketch:
+    # KLL quantile sketch: level h holds items that each stand for 2^h inputs. Rank error is roughly 1.7/k of n,
+    # and nothing is compacted until more than k values have been added, so fleet-sized cohorts stay exact.
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.compactors = [[]]
+        self.n = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _compress(self):
+        while sum(len(items) for items in self.compactors) > \
+                sum(self._capacity(level) for level in range(len(self.compactors))):
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    items.sort()
+                    # With an odd count one item stays behind so the promoted half is an even split
+                    keep = [items.pop()] if len(items) % 2 else []
+                    self.compactors[level + 1].extend(items[self._random.randint(0, 1)::2])
+                    self.compactors[level] = keep
+                    break
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.n += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        for start in range(0, len(values), self.k):
+            self.compactors[0].extend(values[start:start + self.k].tolist())
+            self._compress()
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError(f"Can not merge a sketch with k={other.k} into one with k={self.k}")
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def __add__(self, other):
+        return KLLSketch(self.k).merge(self).merge(other)
+
+    def is_exact(self):
+        return len(self.compactors) == 1
+
+    def weighted_items(self):
+        items = np.array([item for level in self.compactors for item in level], dtype=float)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.compactors)]) \
+            if items.size else np.array([])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype=float)
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        items, weights = self.weighted_items()
+        if self.is_exact():
+            # Same linear interpolation as pandas and np.percentile while nothing has been compacted
+            return np.quantile(items, qs)
+        cumulative = np.cumsum(weights)
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        result = items[np.minimum(positions, len(items) - 1)]
+        return np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, result))
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def mean(self):
+        return self.total / self.n if self.n else math.nan
+
+    def rank(self, value):
+        items, weights = self.weighted_items()
+        return float(weights[items <= value].sum() / weights.sum()) if self.n else math.nan
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'total': self.total, 'min': self.min, 'max': self.max,
+                'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.compactors = [list(items) for items in data['compactors']]
+        sketch.n, sketch.total = data['n'], data['total']
+        sketch.min, sketch.max = data['min'], data['max']
+        return sketch
+
+
+def sketch_columns(frame, columns, by=None, k=DEFAULT_K):
+    # One sketch per column, or per (cohort, column) when a grouping column is given
+    sketches = {}
+    groups = [(None, frame)] if by is None else frame.groupby(by, sort=True)
+    for cohort, data in groups:
+        for column in columns:
+            key = column if by is None else (cohort, column)
+            values = np.asarray(data[column].apply(_to_float), dtype=float)
+            sketches[key] = KLLSketch(k).update(values)
+    return sketches
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def save_sketches(file_path, sketches):
+    temporary_file = f"{file_path}.tmp"
+    with open(temporary_file, mode='w', encoding='utf-8') as file:
+        json.dump({key: sketch.to_dict() for key, sketch in sketches.items()}, file)
+    os.replace(temporary_file, file_path)
+
+
+def load_sketches(file_path):
+    with open(file_path, mode='r', encoding='utf-8') as file:
+        return {key: KLLSketch.from_dict(data) for key, data in json.load(file).items()}
+
+
+def file_sketches(file_path, columns, sketch_file=None, prefix=None):
+    # Sketches saved at ingest are used while they are at least as new as the CSV they summarise,
+    # otherwise they are rebuilt from the CSV
+    if sketch_file and os.path.exists(sketch_file) and os.path.getmtime(sketch_file) >= os.path.getmtime(file_path):
+        saved = load_sketches(sketch_file)
+        keys = [f"{prefix}/{column}" for column in columns]
+        if all(key in saved for key in keys):
+            return {column: saved[key] for column, key in zip(columns, keys)}
+    return sketch_columns(pd.read_csv(file_path), columns)
+
+
+def violin_stats(sketch, points=VIOLIN_POINTS, bw_method='scott', cut=VIOLIN_CUT):
+    # The statistics dict matplotlib's Axes.violin draws from, with the outline estimated from the sketch items
+    from scipy.stats import gaussian_kde
+
+    items, weights = sketch.weighted_items()
+    if len(items) > 1 and items[0] != items[-1]:
+        kde = gaussian_kde(items, bw_method=bw_method, weights=weights)
+        bandwidth = float(np.sqrt(kde.covariance[0, 0]))
+        coords = np.linspace(sketch.min - cut * bandwidth, sketch.max + cut * bandwidth, points)
+        vals = kde(coords)
+    else:
+        coords = np.linspace(sketch.min, sketch.max, points)
+        vals = np.zeros(points)
+    return {'coords': coords, 'vals': vals, 'mean': sketch.mean(), 'median': sketch.median(),
+            'min': sketch.min, 'max': sketch.max}
+
+
+def box_stats(sketch, label=None, whis=WHISKER_IQR):
+    # The statistics dict matplotlib's Axes.bxp draws from, matching cbook.boxplot_stats for exact sketches
+    items, _ = sketch.weighted_items()
+    q1, median, q3 = sketch.quantiles([0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = items[(items >= q1 - whis * iqr) & (items <= q3 + whis * iqr)]
+    whislo = inside.min() if inside.size else q1
+    whishi = inside.max() if inside.size else q3
+    return {'label': label, 'med': median, 'q1': q1, 'q3': q3, 'mean': sketch.mean(), 'iqr': iqr,
+            'whislo': whislo, 'whishi': whishi, 'fliers': items[(items < whislo) | (items > whishi)]}
+
+
+def plot_violins(ax, sketches, positions, colors, widths=0.8, linewidth=1.0, alpha=1.0):
+    parts = ax.violin([violin_stats(sketch) for sketch in sketches], positions=positions, widths=widths,
+                      showmeans=False, showextrema=False, showmedians=False)
+    for body, color in zip(parts['bodies'], colors):
+        body.set_facecolor(color)
+        body.set_edgecolor('black')
+        body.set_linewidth(linewidth)
+        body.set_alpha(alpha)
+    return parts
+
+
+def plot_boxes(ax, sketches, positions, widths=0.2, labels=None, **bxp_kwargs):
+    labels = labels or [None] * len(sketches)
+    stats = [box_stats(sketch, label) for sketch, label in zip(sketches, labels)]
+    return ax.bxp(stats, positions=positions, widths=widths, manage_ticks=False, **bxp_kwargs)
@@ -2,14 +2,17 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+import features
+import metastore
+import significance
+
 file_all_data = 'all_data_sorted_by_id.csv'
-file_annual_scop = 'annual_system_scop.csv'
 
 WITHOUT_SOLAR_PV_COLOR='#2DAFA7'
 WITH_SOLAR_PV_COLOR='#CAA4E8'
 
-df_all_data = pd.read_csv(file_all_data, encoding='latin1')
-df_annual_scop = pd.read_csv(file_annual_scop, encoding='latin1')
+df_all_data = metastore.load_metadata(['solar_pv_generation'], metadata_file=file_all_data)
+df_annual_scop = features.annual_scop()
 
 df_all_data['Solar PV'] = df_all_data['solar_pv_generation'].apply(lambda x: 1 if x > 0 else 0)
 
@@ -31,5 +34,10 @@ plt.xticks([0, 1], ['Without Solar PV', 'With Solar PV'])
 plt.title('Boxen Plot: SCOP vs Solar PV')
 plt.grid(True, linestyle='--')
 
+# Bootstrap interval and permutation p-value for the median difference, with solar PV minus without
+scop_by_pv = df_merged_solar.groupby('Solar PV')['SCOP (Jun 23 to Jun 24)']
+result = significance.compare_cohorts({pv: scop_by_pv.get_group(pv) for pv in [0, 1]}).iloc[0]
+plt.suptitle(significance.annotation(result))
+
 plt.tight_layout()
 plt.show()
@@ -0,0 +1,244 @@
+import os
+import csv
+import sqlite3
+import logging
+import argparse
+import pathlib
+from contextlib import closing
+
+STORE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'effi.sqlite')
+
+SYSTEM_INDEX_COLUMNS = ['hp_model', 'hp_type', 'UFH', 'insulation', 'heat_demand', 'floor_area',
+                        'space_heat_control_type']
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def parse_value(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    if value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def default_store_file(store_file=STORE_FILE):
+    # Scripts read through the indexed store once dailydata.py --store has built one, and the daily files until then
+    return store_file if os.path.exists(store_file) else None
+
+
+def connect(store_file=STORE_FILE):
+    conn = sqlite3.connect(store_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS systems (id INTEGER PRIMARY KEY)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS stats_last365 (system_id INTEGER PRIMARY KEY)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS daily (
+                        system_id INTEGER NOT NULL,
+                        day TEXT NOT NULL,
+                        timestamp TEXT,
+                        PRIMARY KEY (system_id, day))""")
+    return conn
+
+
+def connect_reader(store_file=STORE_FILE):
+    # Readers open the store as it is: the schema is already there and the journal mode is kept in the file
+    uri = pathlib.Path(store_file).resolve().as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote(table)})")]
+
+
+def ensure_columns(conn, table, columns):
+    existing = set(table_columns(conn, table))
+    for column in columns:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column)}")
+            existing.add(column)
+
+
+def upsert(conn, table, columns, rows, replace=True):
+    placeholders = ", ".join("?" for _ in columns)
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    conn.executemany(f"{verb} INTO {quote(table)} ({', '.join(quote(c) for c in columns)}) "
+                     f"VALUES ({placeholders})", rows)
+
+
+def load_systems(conn, meta):
+    columns = ['id']
+    for system in meta:
+        for key, value in system.items():
+            if key not in columns and not isinstance(value, (dict, list)):
+                columns.append(key)
+
+    with conn:
+        ensure_columns(conn, 'systems', columns)
+        upsert(conn, 'systems', columns, [[parse_value(system.get(c)) for c in columns] for system in meta])
+        for column in SYSTEM_INDEX_COLUMNS:
+            if column in columns:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {quote('idx_systems_' + column)} "
+                             f"ON systems ({quote(column)})")
+    return len(meta)
+
+
+def load_stats(conn, stats):
+    columns = ['system_id']
+    for system_stats in stats.values():
+        for key in system_stats:
+            if key not in columns:
+                columns.append(key)
+
+    rows = [[int(system_id)] + [parse_value(system_stats.get(c)) for c in columns[1:]]
+            for system_id, system_stats in stats.items()]
+    with conn:
+        ensure_columns(conn, 'stats_last365', columns)
+        upsert(conn, 'stats_last365', columns, rows)
+    return len(rows)
+
+
+def load_daily(conn, system_id, rows):
+    header = [h.strip() for h in rows[0]]
+    columns = [c for c in header if c not in ('id', 'timestamp')]
+    timestamp_index = header.index('timestamp')
+    value_indexes = [header.index(c) for c in columns]
+
+    records = []
+    for row in rows[1:]:
+        if len(row) <= timestamp_index:
+            continue
+        timestamp = row[timestamp_index].strip()
+        records.append([system_id, timestamp[:10], timestamp] +
+                       [parse_value(row[i]) if i < len(row) else None for i in value_indexes])
+
+    # Only one row per (system_id, day) can be kept. Exact repeats are dropped quietly; differing readings for the
+    # same day are reported, and the last one is kept
+    by_day = {}
+    conflicts = set()
+    for record in records:
+        previous = by_day.get(record[1])
+        if previous is not None and previous != record:
+            conflicts.add(record[1])
+        by_day[record[1]] = record
+    if conflicts:
+        days = sorted(conflicts)
+        logging.warning(f"System {system_id} has conflicting readings for {len(days)} days "
+                        f"({', '.join(days[:5])}{', ...' if len(days) > 5 else ''}); kept the last of each")
+
+    # Replace the system's rows in one transaction so readers never see a half-loaded system. A plain INSERT
+    # fails on a duplicate key rather than overwriting a row
+    with conn:
+        ensure_columns(conn, 'daily', columns)
+        conn.execute("DELETE FROM daily WHERE system_id = ?", (system_id,))
+        upsert(conn, 'daily', ['system_id', 'day', 'timestamp'] + columns, list(by_day.values()), replace=False)
+    return len(by_day)
+
+
+def delete_daily(conn, system_ids):
+    system_ids = [int(system_id) for system_id in system_ids]
+    with conn:
+        conn.execute(f"DELETE FROM daily WHERE system_id IN ({', '.join('?' for _ in system_ids)})", system_ids)
+
+
+def totals(conn, system_id, start_date, end_date, columns):
+    # Sums over one window of a system's days, answered from the (system_id, day) key
+    sums = ", ".join(f"TOTAL({quote(column)})" for column in columns)
+    row = conn.execute(
+        f"SELECT COUNT(*), {sums} FROM daily "
+        f"WHERE system_id = ? AND day >= ? AND day <= ? AND timestamp >= ? AND timestamp < ?",
+        (system_id, start_date.date().isoformat(), end_date.date().isoformat(),
+         start_date.strftime('%Y-%m-%d %H:00:00'), end_date.strftime('%Y-%m-%d %H:00:00'))).fetchone()
+    return dict(zip(['days'] + list(columns), row))
+
+
+def daily_query(columns=None, system_ids=None, start_date=None, end_date=None, bounds=None):
+    select = ", ".join(quote(c) for c in ['system_id'] + list(columns)) if columns else '*'
+    clauses = []
+    params = []
+
+    if system_ids is not None:
+        system_ids = list(system_ids)
+        clauses.append(f"system_id IN ({', '.join('?' for _ in system_ids)})")
+        params.extend(int(system_id) for system_id in system_ids)
+    if start_date is not None:
+        clauses.append("day >= ? AND timestamp >= ?")
+        params.extend([start_date.date().isoformat(), start_date.strftime('%Y-%m-%d %H:00:00')])
+    if end_date is not None:
+        clauses.append("day <= ? AND timestamp < ?")
+        params.extend([end_date.date().isoformat(), end_date.strftime('%Y-%m-%d %H:00:00')])
+    for column, (low, high) in (bounds or {}).items():
+        if low is not None:
+            clauses.append(f"{quote(column)} >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"{quote(column)} <= ?")
+            params.append(high)
+
+    sql = f"SELECT {select} FROM daily"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql + " ORDER BY system_id, day", params
+
+
+def query_daily(conn, columns=None, system_ids=None, start_date=None, end_date=None, bounds=None):
+    import pandas as pd
+
+    sql, params = daily_query(columns, system_ids, start_date, end_date, bounds)
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+def query_systems(conn, columns=None, **filters):
+    import pandas as pd
+
+    select = ", ".join(quote(c) for c in ['id'] + list(columns or [])) if columns else '*'
+    clauses = []
+    params = []
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f"{quote(column)} IN ({', '.join('?' for _ in value)})")
+            params.extend(value)
+        else:
+            clauses.append(f"{quote(column)} = ?")
+            params.append(value)
+
+    sql = f"SELECT {select} FROM systems"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+def build_from_files(conn, data_directory, file_type='converted'):
+    from dailydata import FILE_SUFFIXES
+
+    suffix = FILE_SUFFIXES[file_type]
+    loaded = 0
+    for filename in sorted(os.listdir(data_directory)):
+        if filename.startswith('system_') and filename.endswith(suffix):
+            system_id = int(filename[len('system_'):-len(suffix)])
+            with open(os.path.join(data_directory, filename), mode='r', newline='', encoding='utf-8') as file:
+                loaded += load_daily(conn, system_id, list(csv.reader(file)))
+    logging.info(f"Loaded {loaded} daily rows from {data_directory} into the store.")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--store', default=STORE_FILE, help="SQLite file to build")
+    parser.add_argument('--data-directory', default=os.path.join(os.path.dirname(STORE_FILE), 'system_daily_data'))
+    args = parser.parse_args()
+
+    with closing(connect(args.store)) as conn:
+        build_from_files(conn, args.data_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import queue
+import logging
+import threading
+
+QUEUE_SIZE = 8
+# Blocked puts and gets wake this often to see whether the consumer has stopped
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class Failure:
+    def __init__(self, stage, item, error):
+        self.stage = stage
+        self.item = item
+        self.error = error
+
+    def __repr__(self):
+        return f"Failure(stage={self.stage!r}, item={self.item!r}, error={self.error!r})"
+
+
+def _put(box, item, stop):
+    # Returns False once the consumer has stopped, so a producer never stays blocked on a full queue
+    while not stop.is_set():
+        try:
+            box.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(box, stop):
+    while not stop.is_set():
+        try:
+            return box.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _drain(box):
+    while True:
+        try:
+            box.get_nowait()
+        except queue.Empty:
+            return
+
+
+def _run_worker(name, func, inbox, outbox, stop, on_finished):
+    try:
+        while True:
+            item = _get(inbox, stop)
+            if item is _DONE:
+                break
+            if isinstance(item, Failure):
+                if not _put(outbox, item, stop):
+                    break
+                continue
+            try:
+                result = func(item)
+            except Exception as e:
+                logging.error(f"Stage {name} failed for {item!r}: {e}")
+                result = Failure(name, item, e)
+            if not _put(outbox, result, stop):
+                break
+    finally:
+        on_finished()
+
+
+def _stage_finished(lock, remaining, outbox, downstream_workers, stop):
+    with lock:
+        remaining[0] -= 1
+        last = remaining[0] == 0
+    if last:
+        for _ in range(downstream_workers):
+            _put(outbox, _DONE, stop)
+
+
+def run(items, stages, queue_size=QUEUE_SIZE):
+    # stages is a list of (name, func, workers); every queue between stages is bounded so a fast
+    # stage blocks instead of buffering the whole fleet in memory
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = []
+    # Set when the consumer is done, including when it closes this generator early
+    stop = threading.Event()
+
+    for position, (name, func, workers) in enumerate(stages):
+        downstream_workers = stages[position + 1][2] if position + 1 < len(stages) else 1
+        lock = threading.Lock()
+        remaining = [workers]
+        for worker in range(workers):
+            thread = threading.Thread(
+                target=_run_worker,
+                args=(name, func, queues[position], queues[position + 1], stop,
+                      lambda lock=lock, remaining=remaining, outbox=queues[position + 1],
+                      downstream=downstream_workers: _stage_finished(lock, remaining, outbox, downstream, stop)),
+                name=f"{name}-{worker}",
+                daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    def feed():
+        for item in items:
+            if not _put(queues[0], item, stop):
+                return
+        for _ in range(stages[0][2]):
+            _put(queues[0], _DONE, stop)
+
+    feeder = threading.Thread(target=feed, name="feeder", daemon=True)
+    feeder.start()
+
+    try:
+        while True:
+            result = queues[-1].get()
+            if result is _DONE:
+                break
+            yield result
+    finally:
+        stop.set()
+        # Emptying the queues wakes any producer blocked on a full one straight away
+        for box in queues:
+            _drain(box)
+        feeder.join()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,154 @@
+import os
+import json
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from fleet import Fleet, TIMESTAMP_FORMAT
+
+TENSOR_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fleet_tensor')
+VALUES_FILE = 'values.npy'
+MASK_FILE = 'mask.npy'
+INDEX_FILE = 'index.json'
+
+TENSOR_METRICS = [
+    'combined_elec_kwh', 'combined_heat_kwh', 'combined_cop', 'combined_data_length',
+    'combined_flowT_mean', 'combined_outsideT_mean', 'combined_roomT_mean', 'combined_starts_per_hour',
+    'space_elec_kwh', 'space_heat_kwh', 'space_flowT_mean', 'space_outsideT_mean',
+    'water_elec_kwh', 'water_heat_kwh'
+]
+
+
+def _days(timestamps):
+    return pd.to_datetime(timestamps.astype(str).str.strip(), format=TIMESTAMP_FORMAT,
+                          errors='coerce').dt.normalize()
+
+
+def build_tensor(fleet=None, tensor_directory=TENSOR_DIRECTORY, tensor_metrics=TENSOR_METRICS):
+    fleet = (fleet or Fleet()).source('converted')
+    os.makedirs(tensor_directory, exist_ok=True)
+
+    # First pass only reads timestamps to size the calendar axis
+    first_day, last_day = None, None
+    system_ids = []
+    for system_id, data in fleet.select('timestamp').frames():
+        days = _days(data['timestamp']).dropna()
+        if days.empty:
+            continue
+        system_ids.append(system_id)
+        first_day = days.min() if first_day is None else min(first_day, days.min())
+        last_day = days.max() if last_day is None else max(last_day, days.max())
+
+    if not system_ids:
+        raise ValueError("No daily data found to build the fleet tensor")
+
+    day_count = (last_day - first_day).days + 1
+    shape = (len(system_ids), day_count, len(tensor_metrics))
+    values = np.lib.format.open_memmap(os.path.join(tensor_directory, VALUES_FILE), mode='w+',
+                                       dtype=np.float32, shape=shape)
+    mask = np.lib.format.open_memmap(os.path.join(tensor_directory, MASK_FILE), mode='w+',
+                                     dtype=np.bool_, shape=shape)
+    values[:] = np.nan
+    mask[:] = False
+
+    dtypes = {metric: 'float32' for metric in tensor_metrics}
+    fleet = fleet.ids(system_ids).select('timestamp', *tensor_metrics).astype(**dtypes)
+    for position, (system_id, data) in enumerate(fleet.frames()):
+        offsets = (_days(data['timestamp']) - first_day).dt.days
+        valid = offsets.notna().to_numpy()
+        offsets = offsets[valid].astype(int).to_numpy()
+        block = data.reindex(columns=tensor_metrics).to_numpy(np.float32)[valid]
+        values[position, offsets, :] = block
+        mask[position, offsets, :] = ~np.isnan(block)
+
+    values.flush()
+    mask.flush()
+
+    index = {
+        'system_ids': [int(system_id) for system_id in system_ids],
+        'first_day': first_day.date().isoformat(),
+        'metrics': list(tensor_metrics)
+    }
+    with open(os.path.join(tensor_directory, INDEX_FILE), mode='w', encoding='utf-8') as file:
+        json.dump(index, file)
+
+    logging.info(f"Fleet tensor of shape {shape} written to {tensor_directory}")
+    return shape
+
+
+class FleetTensor:
+    def __init__(self, tensor_directory=TENSOR_DIRECTORY):
+        self.values = np.load(os.path.join(tensor_directory, VALUES_FILE), mmap_mode='r')
+        self.mask = np.load(os.path.join(tensor_directory, MASK_FILE), mmap_mode='r')
+        with open(os.path.join(tensor_directory, INDEX_FILE), mode='r', encoding='utf-8') as file:
+            index = json.load(file)
+        self.system_ids = np.array(index['system_ids'])
+        self.metrics = index['metrics']
+        self.days = pd.date_range(index['first_day'], periods=self.values.shape[1], freq='D')
+
+    def metric(self, name):
+        return self.values[:, :, self.metrics.index(name)]
+
+    def valid(self, name):
+        return self.mask[:, :, self.metrics.index(name)]
+
+    def system_rows(self, system_ids):
+        positions = np.searchsorted(self.system_ids, system_ids)
+        return positions[self.system_ids[np.minimum(positions, len(self.system_ids) - 1)] == system_ids]
+
+    def day_slice(self, start_date, end_date):
+        start = max(0, (pd.Timestamp(start_date) - self.days[0]).days)
+        end = min(len(self.days), (pd.Timestamp(end_date) - self.days[0]).days)
+        return slice(start, max(start, end))
+
+    def fleet_daily(self, name, statistic=np.nanmedian):
+        return pd.Series(statistic(self.metric(name), axis=0), index=self.days)
+
+    def fleet_cop(self, prefix='combined', days=slice(None)):
+        heat = np.nansum(self.metric(f'{prefix}_heat_kwh')[:, days], axis=0)
+        elec = np.nansum(self.metric(f'{prefix}_elec_kwh')[:, days], axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(elec > 0, heat / elec, np.nan)
+
+    def coldest_days(self, count=10, days=slice(None)):
+        outside = np.nanmean(self.metric('combined_outsideT_mean')[:, days], axis=0)
+        order = np.argsort(np.where(np.isnan(outside), np.inf, outside))[:count]
+        return self.days[days][order], outside[order]
+
+    def percentile_bands(self, name, percentiles=(10, 25, 50, 75, 90), days=slice(None)):
+        return pd.DataFrame(np.nanpercentile(self.metric(name)[:, days], percentiles, axis=0).T,
+                            index=self.days[days], columns=[f'p{p}' for p in percentiles])
+
+    def weather_normalized(self, name, bins=np.arange(-10, 21, 2), outside='combined_outsideT_mean'):
+        # Mean of a metric per system inside each outside temperature bin, so systems in different
+        # climates are compared at the same weather rather than over their own calendars
+        x = self.metric(outside)
+        y = self.metric(name)
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        bin_index = np.digitize(x, bins) - 1
+        valid &= (bin_index >= 0) & (bin_index < len(bins) - 1)
+
+        rows = np.broadcast_to(np.arange(x.shape[0])[:, None], x.shape)[valid]
+        flat = rows * (len(bins) - 1) + bin_index[valid]
+        size = x.shape[0] * (len(bins) - 1)
+        sums = np.bincount(flat, weights=y[valid], minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan).reshape(x.shape[0], len(bins) - 1)
+        columns = [f'{low:g} to {high:g}' for low, high in zip(bins[:-1], bins[1:])]
+        return pd.DataFrame(means, index=self.system_ids, columns=columns)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=TENSOR_DIRECTORY, help="Directory for the memory-mapped tensor")
+    args = parser.parse_args()
+
+    build_tensor(tensor_directory=args.output)
+
+
+if __name__ == "__main__":
+    main()
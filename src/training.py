@@ -2,11 +2,15 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-file1_path = 'annual_system_scop.csv'
-file2_path = 'all_data_sorted_by_id.csv'
+import features
+import metastore
+import significance
 
-scop_df = pd.read_csv(file1_path)
-all_data_df = pd.read_csv(file2_path, encoding='latin1')
+file_path = 'all_data_sorted_by_id.csv'
+training_flags = ['heatgeek', 'ultimaterenewables', 'heatingacademy']
+
+scop_df = features.annual_scop()
+all_data_df = metastore.load_metadata(training_flags, metadata_file=file_path)
 
 merged_df = pd.merge(all_data_df, scop_df, on='ID')
 
@@ -14,6 +18,13 @@ custom_cmap = sns.color_palette("Spectral_r", as_cmap=True)
 
 label_mapping = {0: 'Without', 1: 'With'}
 
+# The heatmaps show means, so each flag gets a bootstrap interval and permutation p-value for its mean difference
+flag_notes = {}
+for flag in training_flags:
+    result = significance.compare_cohorts({value: merged_df.loc[merged_df[flag] == value, 'SCOP (Jun 23 to Jun 24)']
+                                           for value in [0, 1]}, statistic='mean').iloc[0]
+    flag_notes[flag] = significance.annotation(result)
+
 plt.figure(figsize=(18, 5))
 
 plt.subplot(1, 3, 1)
@@ -24,7 +35,9 @@ heatmap_data1 = merged_df.pivot_table(values='SCOP (Jun 23 to Jun 24)',
 heatmap_data1.index = heatmap_data1.index.map(label_mapping)
 heatmap_data1.columns = heatmap_data1.columns.map(label_mapping)
 sns.heatmap(heatmap_data1, annot=True, cmap=custom_cmap, fmt=".2f", linewidths=.5)
-plt.title('SCOP Comparison: Heat Geek vs Ultimate Renewables')
+plt.title('SCOP Comparison: Heat Geek vs Ultimate Renewables\n'
+          f"Heat Geek: {flag_notes['heatgeek']}\nUltimate Renewables: {flag_notes['ultimaterenewables']}",
+          fontsize=9)
 plt.xlabel('Ultimate Renewables')
 plt.ylabel('Heat Geek')
 
@@ -37,7 +50,9 @@ heatmap_data2 = merged_df.pivot_table(values='SCOP (Jun 23 to Jun 24)',
 heatmap_data2.index = heatmap_data2.index.map(label_mapping)
 heatmap_data2.columns = heatmap_data2.columns.map(label_mapping)
 sns.heatmap(heatmap_data2, annot=True, cmap=custom_cmap, fmt=".2f", linewidths=.5)
-plt.title('SCOP Comparison: Heat Geek vs Heating Academy')
+plt.title('SCOP Comparison: Heat Geek vs Heating Academy\n'
+          f"Heat Geek: {flag_notes['heatgeek']}\nHeating Academy: {flag_notes['heatingacademy']}",
+          fontsize=9)
 plt.xlabel('Heating Academy')
 plt.ylabel('Heat Geek')
 
@@ -50,7 +65,9 @@ heatmap_data3 = merged_df.pivot_table(values='SCOP (Jun 23 to Jun 24)',
 heatmap_data3.index = heatmap_data3.index.map(label_mapping)
 heatmap_data3.columns = heatmap_data3.columns.map(label_mapping)
 sns.heatmap(heatmap_data3, annot=True, cmap=custom_cmap, fmt=".2f", linewidths=.5)
-plt.title('SCOP Comparison: Ultimate Renewables vs Heating Academy')
+plt.title('SCOP Comparison: Ultimate Renewables vs Heating Academy\n'
+          f"Ultimate Renewables: {flag_notes['ultimaterenewables']}\nHeating Academy: {flag_notes['heatingacademy']}",
+          fontsize=9)
 plt.xlabel('Heating Academy')
 plt.ylabel('Ultimate Renewables')
 
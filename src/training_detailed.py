@@ -2,14 +2,25 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-file1_path = 'annual_system_scop.csv'
-file2_path = 'all_data_sorted_by_id.csv'
+import features
+import metastore
+import significance
 
-scop_df = pd.read_csv(file1_path)
-all_data_df = pd.read_csv(file2_path, encoding='latin1')
+file_path = 'all_data_sorted_by_id.csv'
+training_flags = ['heatgeek', 'ultimaterenewables', 'heatingacademy']
+
+scop_df = features.annual_scop()
+all_data_df = metastore.load_metadata(training_flags, metadata_file=file_path)
 
 merged_df = pd.merge(all_data_df, scop_df, on='ID')
 
+# Bootstrap interval and permutation p-value for each flag's median difference, with minus without
+flag_notes = {}
+for flag in training_flags:
+    result = significance.compare_cohorts({value: merged_df.loc[merged_df[flag] == value, 'SCOP (Jun 23 to Jun 24)']
+                                           for value in [0, 1]}).iloc[0]
+    flag_notes[flag] = significance.annotation(result)
+
 plt.figure(figsize=(18, 8))
 
 custom_palette = ['#FC9676', '#53ABDA', '#A2BD2C', '#FFCC31', '#8080D7', '#CA2D8D']
@@ -24,7 +35,7 @@ medians_heatgeek = merged_df.groupby('heatgeek')['SCOP (Jun 23 to Jun 24)'].medi
 for i, median in enumerate(medians_heatgeek):
     plt.text(i, median + 0.05, f'{median:.2f}', ha='center', color='black')
 
-plt.title('SCOP Comparison by Heat Geek')
+plt.title(f"SCOP Comparison by Heat Geek\n{flag_notes['heatgeek']}")
 plt.xlabel('Heat Geek')
 plt.ylabel('SCOP (Jun 23 to Jun 24)')
 plt.xticks([0, 1], ['Without', 'With'])
@@ -41,7 +52,7 @@ medians_ultimate = merged_df.groupby('ultimaterenewables')['SCOP (Jun 23 to Jun
 for i, median in enumerate(medians_ultimate):
     plt.text(i, median + 0.05, f'{median:.2f}', ha='center', color='black')
 
-plt.title('SCOP Comparison by Ultimate Renewables')
+plt.title(f"SCOP Comparison by Ultimate Renewables\n{flag_notes['ultimaterenewables']}")
 plt.xlabel('Ultimate Renewables')
 plt.ylabel('SCOP (Jun 23 to Jun 24)')
 plt.xticks([0, 1], ['Without', 'With'])
@@ -58,7 +69,7 @@ medians_heating = merged_df.groupby('heatingacademy')['SCOP (Jun 23 to Jun 24)']
 for i, median in enumerate(medians_heating):
     plt.text(i, median + 0.05, f'{median:.2f}', ha='center', color='black')
 
-plt.title('SCOP Comparison by Heating Academy')
+plt.title(f"SCOP Comparison by Heating Academy\n{flag_notes['heatingacademy']}")
 plt.xlabel('Heating Academy')
 plt.ylabel('SCOP (Jun 23 to Jun 24)')
 plt.xticks([0, 1], ['Without', 'With'])
@@ -3,11 +3,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.patches import Patch
 
+import features
+import metastore
+import significance
+
 file_all_data = 'all_data_sorted_by_id.csv'
-file_annual_scop = 'annual_system_scop.csv'
 
-df_all_data = pd.read_csv(file_all_data, encoding='latin1')
-df_annual_scop = pd.read_csv(file_annual_scop, encoding='latin1')
+df_all_data = metastore.load_metadata(['UFH'], metadata_file=file_all_data)
+df_annual_scop = features.annual_scop()
 
 df_merged = pd.merge(df_all_data[['ID', 'UFH']], df_annual_scop, on='ID', how='inner')
 
@@ -24,6 +27,10 @@ sns.boxplot(x='UFH', y='SCOP (Jun 23 to Jun 24)', data=df_merged, whis=1.5, widt
 plt.xticks([0, 1], ['Without', 'With'], fontsize=14)
 
 # plt.title('SCOP vs Underfloor Heating')
+# Bootstrap interval and permutation p-value for the median difference, with UFH minus without
+result = significance.compare_cohorts({ufh: df_merged.loc[df_merged['UFH'] == ufh, 'SCOP (Jun 23 to Jun 24)']
+                                       for ufh in [0, 1]}).iloc[0]
+plt.title(significance.annotation(result), fontsize=12)
 plt.xlabel('Underfloor Heating', fontsize=14)
 plt.ylabel('SCOP (Jun 23 to Jun 24)', fontsize=14)
 